@@ -1,5 +1,17 @@
-from app.gui import VideoPlayerApp
+import sys
+
+from app.profiling import StartupProfiler
+
+startup_profiler = StartupProfiler()
+with startup_profiler.step('imports'):
+    from app.gui import VideoPlayerApp
 
 if __name__ == "__main__":
-    app = VideoPlayerApp()
+    if len(sys.argv) > 2:
+        # Several videos: synchronized grid view
+        from app.grid_gui import GridPlayerApp
+        app = GridPlayerApp(sys.argv[1:])
+    else:
+        # A single video is opened in the player, the default video otherwise
+        app = VideoPlayerApp(startup_profiler, filename=sys.argv[1] if len(sys.argv) == 2 else None)
     app.launch_app()
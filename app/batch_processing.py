@@ -0,0 +1,248 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import cv2
+
+from app.components.decoders import DECODER_BACKENDS
+from app.components.image_filter import FILTER_LIST, ImageFilter
+from app.components.video_exporter import VIDEO_OUTPUT_FORMATS
+from app.components.video_player import VideoPlayer
+
+# Extension of the per-frame results file, the annotated videos use VIDEO_OUTPUT_FORMATS
+RESULTS_OUTPUT_FORMAT = '.jsonl'
+
+# Decoder and model of the current worker process, built once by the pool initializer
+_worker_video_player: Optional[VideoPlayer] = None
+_worker_image_filter: Optional[ImageFilter] = None
+
+
+def split_frame_ranges(num_frames: int, chunk_size: int) -> list:
+    """
+    Split the video into consecutive [start, end) frame ranges.
+    :param num_frames: the number of frames in the video.
+    :param chunk_size: the maximum number of frames per range.
+    :return: the list of (start, end) tuples.
+    """
+    return [(start, min(start + chunk_size, num_frames)) for start in range(0, num_frames, chunk_size)]
+
+
+def get_torch_threads(workers: int) -> int:
+    """
+    Get the number of torch threads of each worker, so the models of all the workers share the cores.
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def get_chunk_filename(output: str, chunk_index: int) -> str:
+    stem, extension = os.path.splitext(output)
+    return f'{stem}.part{chunk_index:04d}{extension}'
+
+
+def _init_worker(filename: str, filter_type: str, processing_size: Optional[tuple], decoder: str,
+                 decode_threads: int, torch_threads: int) -> None:
+    global _worker_video_player, _worker_image_filter
+
+    if filter_type == 'object_detection':
+        # By default torch runs one thread per core in each worker, the workers would oversubscribe the cores.
+        # Torch is only imported for the model, it may be missing when no worker runs one
+        try:
+            import torch
+        except ImportError:
+            pass
+        else:
+            torch.set_num_threads(torch_threads)
+
+    # One decoder and one model per worker process, the frame cache is useless for a single sequential pass.
+    # The keyframe index is read from the sidecar written by the parent process, instead of scanning the packets
+    # again. The gray filter gets its frames decoded straight to gray
+    _worker_video_player = VideoPlayer(filename, frame_cache_bytes=0,
+                                       processing_size=processing_size, decoder=decoder,
+                                       decode_threads=decode_threads,
+                                       pixel_format='gray' if filter_type == 'gray' else 'bgr')
+    _worker_image_filter = ImageFilter()
+    _worker_image_filter.set_filter_type(filter_type)
+
+
+def _process_chunk(chunk_index: int, start: int, end: int, output: Optional[str]) -> dict:
+    """
+    Apply the filter to a range of frames, in a worker process.
+    :return: the chunk statistics, and the per-frame results if no video is written.
+    """
+    start_time = time.perf_counter()
+    writer = None
+    results = []
+    nb_frames = 0
+
+    _worker_video_player.set_current_frame_id(start)
+    for frame_id in range(start, end):
+        ret, frame = _worker_video_player.read_next_frame()
+        if not ret:
+            break
+        nb_frames += 1
+
+        filtered_frame = _worker_image_filter.update_filtered_image(frame, frame_id)
+
+        if output is None:
+            # The detections are exported in source coordinates
+            detections = _worker_image_filter.detections
+            if detections is not None:
+                detections = detections.scaled(*_worker_video_player.get_source_scale())
+            results.append(detections_to_dict(frame_id, detections))
+            continue
+
+        if writer is None:
+            height, width = filtered_frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*VIDEO_OUTPUT_FORMATS[os.path.splitext(output)[1]])
+            writer = cv2.VideoWriter(get_chunk_filename(output, chunk_index), fourcc,
+                                     _worker_video_player.fps, (width, height))
+        writer.write(filtered_frame)
+
+    if writer is not None:
+        writer.release()
+
+    return {'chunk_index': chunk_index,
+            'worker': os.getpid(),
+            'frames': nb_frames,
+            'elapsed_time': time.perf_counter() - start_time,
+            'results': results}
+
+
+def detections_to_dict(frame_id: int, detections) -> dict:
+    if detections is None:
+        return {'frame_id': frame_id, 'detections': []}
+
+    return {'frame_id': frame_id,
+            'detections': [{'box': [float(value) for value in box],
+                            'class': detections.names.get(int(class_id), int(class_id)),
+                            'confidence': float(confidence)}
+                           for box, class_id, confidence in zip(detections.boxes, detections.classes,
+                                                                detections.confidences)]}
+
+
+def merge_video_chunks(output: str, nb_chunks: int, fps: float) -> None:
+    """
+    Concatenate the chunk videos written by the workers into the output video, and remove them.
+    """
+    writer = None
+    for chunk_index in range(nb_chunks):
+        chunk_filename = get_chunk_filename(output, chunk_index)
+        capture = cv2.VideoCapture(chunk_filename)
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if writer is None:
+                height, width = frame.shape[:2]
+                fourcc = cv2.VideoWriter_fourcc(*VIDEO_OUTPUT_FORMATS[os.path.splitext(output)[1]])
+                writer = cv2.VideoWriter(output, fourcc, fps, (width, height))
+            writer.write(frame)
+        capture.release()
+        os.remove(chunk_filename)
+
+    if writer is not None:
+        writer.release()
+
+
+def process_video(filename: str, filter_type: str, output: str, workers: int = os.cpu_count(),
+                  chunk_size: int = 0, processing_size: Optional[tuple] = None, decoder: str = 'opencv',
+                  decode_threads: int = 1) -> dict:
+    """
+    Apply a filter to a whole video with a pool of worker processes.
+    :param filename: the video filepath.
+    :param filter_type: the filter to apply, from FILTER_LIST.
+    :param output: the annotated video (.mp4, .avi) or the per-frame results file (.jsonl) to write.
+    :param workers: the number of worker processes, the cores are split between their models.
+    :param chunk_size: the number of frames per task, 0 to split the video evenly between the workers.
+    :param processing_size: the (width, height) the frames are downscaled to before filtering, None for the source.
+    :param decoder: the decoder backend, from DECODER_BACKENDS.
+    :param decode_threads: the number of decoding threads per worker, 1 as the workers already use all the cores.
+    :return: the throughput statistics, per worker and in total.
+    """
+    if filter_type not in FILTER_LIST:
+        raise ValueError(f"Invalid filter. Supported filters are: {', '.join(FILTER_LIST)}")
+
+    extension = os.path.splitext(output)[1]
+    write_video = extension in VIDEO_OUTPUT_FORMATS
+    if not write_video and extension != RESULTS_OUTPUT_FORMAT:
+        raise ValueError(f"Invalid output format. Supported formats are: "
+                         f"{', '.join(list(VIDEO_OUTPUT_FORMATS) + [RESULTS_OUTPUT_FORMAT])}")
+    if not write_video and filter_type != 'object_detection':
+        raise ValueError("Per-frame results are only available for the object_detection filter")
+
+    # Probe the video and write its keyframe sidecar once, the workers load it
+    video_player = VideoPlayer(filename)
+    video_player.wait_keyframe_index()
+    num_frames, fps = video_player.num_frames, video_player.fps
+    del video_player
+
+    workers = max(1, workers)
+    chunk_size = chunk_size or max(1, math.ceil(num_frames / workers))
+    frame_ranges = split_frame_ranges(num_frames, chunk_size)
+
+    start_time = time.perf_counter()
+    # Spawn the workers, forking a process that already runs decoder threads is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker,
+                             initargs=(filename, filter_type, processing_size, decoder, decode_threads,
+                                       get_torch_threads(workers))) as executor:
+        futures = [executor.submit(_process_chunk, chunk_index, start, end, output if write_video else None)
+                   for chunk_index, (start, end) in enumerate(frame_ranges)]
+        chunks = [future.result() for future in futures]
+
+    if write_video:
+        merge_video_chunks(output, len(frame_ranges), fps)
+    else:
+        with open(output, 'w') as results_file:
+            for chunk in chunks:
+                for result in chunk['results']:
+                    results_file.write(json.dumps(result) + '\n')
+    total_time = time.perf_counter() - start_time
+
+    # Throughput of each worker over the chunks it processed
+    worker_frames, worker_times = defaultdict(int), defaultdict(float)
+    for chunk in chunks:
+        worker_frames[chunk['worker']] += chunk['frames']
+        worker_times[chunk['worker']] += chunk['elapsed_time']
+
+    total_frames = sum(worker_frames.values())
+    return {'frames': total_frames,
+            'elapsed_time': total_time,
+            'fps': total_frames / total_time if total_time > 0 else 0.0,
+            'workers': {worker: {'frames': worker_frames[worker],
+                                 'fps': worker_frames[worker] / worker_times[worker] if worker_times[worker] else 0.0}
+                        for worker in worker_frames}}
+
+
+def parse_size(size: str) -> tuple:
+    width, height = size.lower().split('x')
+    return int(width), int(height)
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Apply a filter to a whole video, without the GUI.")
+    parser.add_argument('video', help="the video file to process")
+    parser.add_argument('filter', choices=FILTER_LIST, help="the filter to apply")
+    parser.add_argument('output', help="the annotated video (.mp4, .avi) or per-frame results file (.jsonl)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="the number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help="the number of frames per task, by default the video is split evenly between workers")
+    parser.add_argument('--processing-size', type=parse_size, default=None,
+                        help="the WIDTHxHEIGHT the frames are downscaled to before filtering, e.g. 854x480")
+    parser.add_argument('--decoder', choices=DECODER_BACKENDS, default='opencv', help="the decoder backend")
+    parser.add_argument('--decode-threads', type=int, default=1,
+                        help="the number of decoding threads per worker, 0 to let the decoder choose")
+    args = parser.parse_args(argv)
+
+    stats = process_video(args.video, args.filter, args.output, args.workers, args.chunk_size, args.processing_size,
+                          args.decoder, args.decode_threads)
+
+    for worker, worker_stats in stats['workers'].items():
+        print(f"Worker {worker}: {worker_stats['frames']} frames, {worker_stats['fps']:.1f} fps")
+    print(f"Total: {stats['frames']} frames in {stats['elapsed_time']:.1f}s, {stats['fps']:.1f} fps")
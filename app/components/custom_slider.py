@@ -1,12 +1,17 @@
+import time
+
 from PySimpleGUI import Slider, Text
-from datetime import timedelta
 
 from app.components.video_player import VideoPlayer
 
+# Maximum number of slider moves per second during playback, the time labels are updated at every frame
+SLIDER_UPDATE_RATE = 10.0
+
 
 class CustomSlider(Slider):
-    def __init__(self, slider_key: str, time_elapsed: Text = '', time_remaining: Text = ''):
-        super().__init__(range=(1, 100), orientation='h', size=(75, 10), key=slider_key,
+    def __init__(self, slider_key: str, time_elapsed: Text = '', time_remaining: Text = '',
+                 update_rate: float = SLIDER_UPDATE_RATE):
+        super().__init__(range=(0, 100), orientation='h', size=(75, 10), key=slider_key,
                          disable_number_display=False, enable_events=True)
 
         self.nb_frames: int = 0
@@ -14,6 +19,15 @@ class CustomSlider(Slider):
         self.elapsed_time: Text = time_elapsed
         self.remaining_time: Text = time_remaining
 
+        # Each widget update is a round trip to Tk: the labels are only updated when their text changes,
+        # and the slider moves at most update_rate times per second during playback
+        self.update_rate: float = update_rate
+        self.position: int | None = None
+        self.position_time: float = 0.0
+        self.elapsed_text: str | None = None
+        self.remaining_text: str | None = None
+        self.widget_updates: int = 0
+
     def update_metadata_from_video_player(self, video_player: VideoPlayer):
         """
         Update the metadata of the slider using the metadata from the video player.
@@ -40,7 +54,7 @@ class CustomSlider(Slider):
         """
         self.nb_frames = nb_frames
         # Update the slider range, the range is from 0 to the number of frames - 1
-        self.update(range=(1, self.nb_frames))
+        self.update(range=(0, max(self.nb_frames - 1, 0)))
 
     def set_fps(self, fps: float) -> None:
         self.fps = fps
@@ -50,14 +64,11 @@ class CustomSlider(Slider):
         if self.fps <= 0 or frame_id < 0:
             return "00:00:00"
 
-        # Calculate total seconds according to the current frame id and the FPS
-        total_seconds = frame_id/self.fps
-
-        # Convert seconds to timedelta object
-        time_passed = timedelta(seconds=total_seconds)
+        # Calculate the whole seconds according to the current frame id and the FPS
+        total_seconds = int(frame_id / self.fps)
 
         # Format as HH:MM:SS
-        hours, remainder = divmod(time_passed.seconds, 3600)
+        hours, remainder = divmod(total_seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{hours:02}:{minutes:02}:{seconds:02}"
 
@@ -79,11 +90,34 @@ class CustomSlider(Slider):
 
     def update_remaining_time_text(self, frame_id: int) -> None:
         remaining_time = self.get_remaining_time(frame_id)
-        self.remaining_time.update(remaining_time)
+        if remaining_time != self.remaining_text:
+            self.remaining_text = remaining_time
+            self.remaining_time.update(remaining_time)
+            self.widget_updates += 1
 
     def update_elapsed_time_text(self, frame_id: int) -> None:
         elapsed_time = self.get_elapsed_time(frame_id)
-        self.elapsed_time.update(elapsed_time)
+        if elapsed_time != self.elapsed_text:
+            self.elapsed_text = elapsed_time
+            self.elapsed_time.update(elapsed_time)
+            self.widget_updates += 1
+
+    def update_position(self, frame_id: int, throttle: bool = False) -> None:
+        """
+        Move the slider to a frame and update the time labels.
+        :param frame_id: the id of the current frame.
+        :param throttle: whether to limit the slider moves to update_rate per second, e.g. during playback.
+        :return:
+        """
+        now = time.monotonic()
+        is_due = not throttle or self.update_rate <= 0 or now - self.position_time >= 1 / self.update_rate
+        if frame_id != self.position and is_due:
+            self.position = frame_id
+            self.position_time = now
+            self.update(frame_id)
+            self.widget_updates += 1
+
+        self.update_slider_time_labels(frame_id)
 
     def update_slider_time_labels(self, frame_id: int) -> None:
         self.update_remaining_time_text(frame_id)
@@ -0,0 +1,162 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of decoding threads shared by all the streams, and number of frames decoded ahead of each playhead
+DECODE_WORKERS = min(4, os.cpu_count() or 1)
+STREAM_PREFETCH_SIZE = 8
+
+
+class _Stream:
+    """
+    Decoding state of one video of the scheduler.
+    """
+    def __init__(self, video_player, capacity: int):
+        self.video_player = video_player
+        self.capacity: int = capacity
+        # Decoded (frame_id, frame) tuples ahead of the playhead, and id of the next frame to decode
+        self.ring: deque = deque()
+        self.next_frame_id: int = 0
+        self.end_of_stream: bool = False
+        # Whether a decode of this stream is queued or running, at most one as a decoder is not thread-safe
+        self.is_decoding: bool = False
+        # Bumped on each seek, the frames decoded for an older position are dropped
+        self.generation: int = 0
+        self.decoded_frames: int = 0
+        self.seeks: int = 0
+
+
+class DecodeScheduler:
+    """
+    Decode the frames of several videos ahead of their playheads, with one thread pool shared by all the videos.
+
+    Each stream keeps a bounded ring of decoded frames. A decode task decodes a single frame, then queues the next
+    decode of its stream if the ring is not full: the tasks of the streams interleave in the queue of the pool, so
+    the decoding threads are shared fairly, and a stream never has two decodes running at once.
+    """
+    def __init__(self, video_players: list, workers: int = DECODE_WORKERS,
+                 prefetch_size: int = STREAM_PREFETCH_SIZE):
+        """
+        :param video_players: the video players of the streams, without prefetcher. Their decoders are only used
+            by the scheduler threads.
+        :param workers: the number of decoding threads.
+        :param prefetch_size: the maximum number of frames decoded ahead of each playhead.
+        """
+        self.streams: list = [_Stream(video_player, max(1, prefetch_size)) for video_player in video_players]
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='decode-scheduler')
+        self._condition = threading.Condition()
+        self._closed: bool = False
+
+    def seek(self, stream_index: int, frame_id: int) -> None:
+        """
+        Move the playhead of a stream, the frames already decoded from this position on are kept.
+        :param stream_index: the index of the stream.
+        :param frame_id: the id of the next frame needed.
+        """
+        with self._condition:
+            self._seek(self.streams[stream_index], frame_id)
+
+    def _seek(self, stream: _Stream, frame_id: int) -> None:
+        self._drop_before(stream, frame_id)
+        if not stream.ring or stream.ring[0][0] != frame_id:
+            stream.ring.clear()
+            stream.next_frame_id = frame_id
+            stream.end_of_stream = False
+            stream.generation += 1
+            stream.seeks += 1
+        self._schedule(stream)
+
+    def get(self, stream_index: int, frame_id: int, timeout: float = 0.0):
+        """
+        Get a decoded frame of a stream, and release the frames before it.
+
+        A frame behind the playhead or too far ahead of it restarts the decoding from this frame.
+        :param stream_index: the index of the stream.
+        :param frame_id: the id of the frame.
+        :param timeout: the maximum time to wait for the frame, in seconds.
+        :return: the frame, or None if it is not decoded in time.
+        """
+        return self.get_many({stream_index: frame_id}, timeout)[stream_index]
+
+    def get_many(self, frame_ids: dict, timeout: float = 0.0) -> dict:
+        """
+        Get decoded frames of several streams, waiting once for all of them.
+
+        The decoding of all the frames is started before waiting, so the streams decode in parallel and the timeout
+        is shared instead of being spent on each stream in turn.
+        :param frame_ids: the id of the frame of each stream, by stream index.
+        :param timeout: the maximum time to wait for all the frames, in seconds.
+        :return: the frames by stream index, None for the frames not decoded in time.
+        """
+        requests = [(stream_index, self.streams[stream_index], frame_id)
+                    for stream_index, frame_id in frame_ids.items()]
+        with self._condition:
+            for _, stream, frame_id in requests:
+                is_ahead = stream.next_frame_id <= frame_id < stream.next_frame_id + stream.capacity
+                is_decoded = any(ring_frame_id == frame_id for ring_frame_id, _ in stream.ring)
+                if not is_ahead and not is_decoded:
+                    self._seek(stream, frame_id)
+
+            # Stop waiting once each frame is decoded, or can no longer be (end of the stream)
+            self._condition.wait_for(lambda: all(self._get_ready(stream, frame_id) is not None
+                                                 or stream.next_frame_id > frame_id or stream.end_of_stream
+                                                 for _, stream, frame_id in requests), timeout)
+            frames = {}
+            for stream_index, stream, frame_id in requests:
+                item = self._get_ready(stream, frame_id)
+                frames[stream_index] = item[1] if item is not None else None
+            return frames
+
+    def _get_ready(self, stream: _Stream, frame_id: int):
+        # The frames before frame_id are released, which lets the decoding go on
+        self._drop_before(stream, frame_id)
+        self._schedule(stream)
+        if stream.ring and stream.ring[0][0] == frame_id:
+            return stream.ring[0]
+        return None
+
+    @staticmethod
+    def _drop_before(stream: _Stream, frame_id: int) -> None:
+        # The frame itself stays in the ring until a later frame is asked, so it can be shown again
+        while stream.ring and stream.ring[0][0] < frame_id:
+            stream.ring.popleft()
+
+    def _schedule(self, stream: _Stream) -> None:
+        # Called with the condition held
+        if self._closed or stream.is_decoding or stream.end_of_stream or len(stream.ring) >= stream.capacity:
+            return
+        stream.is_decoding = True
+        self._executor.submit(self._decode, stream, stream.next_frame_id, stream.generation)
+
+    def _decode(self, stream: _Stream, frame_id: int, generation: int) -> None:
+        frame = None
+        try:
+            frame = stream.video_player.decode_frame(frame_id)
+        finally:
+            with self._condition:
+                stream.is_decoding = False
+                if generation == stream.generation:
+                    if frame is not None:
+                        stream.ring.append((frame_id, frame))
+                        stream.decoded_frames += 1
+                        stream.next_frame_id = frame_id + 1
+                    else:
+                        # End of the stream or unreadable frame, the decoding only resumes after a seek
+                        stream.end_of_stream = True
+                self._schedule(stream)
+                self._condition.notify_all()
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of frames ready, decoded and of seeks of each stream.
+        """
+        with self._condition:
+            return {'queue_depths': [len(stream.ring) for stream in self.streams],
+                    'decoded_frames': [stream.decoded_frames for stream in self.streams],
+                    'seeks': [stream.seeks for stream in self.streams]}
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+        self._executor.shutdown(wait=True)
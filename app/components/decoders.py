@@ -0,0 +1,181 @@
+from fractions import Fraction
+
+import cv2
+
+# Decoder backends, and pixel formats of the decoded frames
+DECODER_BACKENDS = ['opencv', 'pyav']
+PIXEL_FORMATS = ['bgr', 'gray']
+# Number of decoding threads, 0 lets the backend choose (usually one per core)
+DECODE_THREADS = 0
+
+
+class OpenCVDecoder:
+    """
+    Decoder backed by cv2.VideoCapture, the previous hard-wired decoder of the video player.
+
+    The FFmpeg thread count can be set when the capture is opened. Gray frames are converted after decoding,
+    since OpenCV always outputs BGR.
+    """
+    def __init__(self, filename: str, threads: int = DECODE_THREADS, pixel_format: str = 'bgr'):
+        if threads > 0:
+            self.capture = cv2.VideoCapture(filename, cv2.CAP_FFMPEG, [cv2.CAP_PROP_N_THREADS, threads])
+        else:
+            self.capture = cv2.VideoCapture(filename)
+        self.pixel_format: str = pixel_format
+
+    def _convert(self, ret: bool, frame):
+        if ret and self.pixel_format == 'gray':
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return ret, frame
+
+    def read(self):
+        return self._convert(*self.capture.read())
+
+    def grab(self) -> bool:
+        return self.capture.grab()
+
+    def retrieve(self):
+        return self._convert(*self.capture.retrieve())
+
+    def get(self, property_id: int) -> float:
+        return self.capture.get(property_id)
+
+    def set(self, property_id: int, value) -> bool:
+        return self.capture.set(property_id, value)
+
+    def isOpened(self) -> bool:
+        return self.capture.isOpened()
+
+    def release(self) -> None:
+        self.capture.release()
+
+
+class PyAVDecoder:
+    """
+    Decoder backed by PyAV (FFmpeg bindings), with frame and slice threading enabled.
+
+    Gray frames are taken straight from the luma plane by swscale, without going through BGR.
+    PyAV is an optional dependency, only imported when this backend is used.
+    The interface is the subset of cv2.VideoCapture used by the video player, so both backends are interchangeable.
+    """
+    def __init__(self, filename: str, threads: int = DECODE_THREADS, pixel_format: str = 'bgr'):
+        import av
+
+        self.container = av.open(filename)
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+        if threads > 0:
+            self.stream.thread_count = threads
+        self.output_format: str = 'gray' if pixel_format == 'gray' else 'bgr24'
+
+        self.fps: Fraction = self.stream.average_rate or self.stream.guessed_rate or Fraction(25)
+        self.start_pts: int = self.stream.start_time or 0
+        self._frames = self.container.decode(self.stream)
+        # Last grabbed frame, and id of the next frame to decode
+        self._frame = None
+        self.position: int = 0
+
+    def _get_frame_id(self, frame) -> int:
+        if frame.pts is None:
+            return self.position
+        return round((frame.pts - self.start_pts) * self.stream.time_base * self.fps)
+
+    def grab(self) -> bool:
+        self._frame = next(self._frames, None)
+        if self._frame is None:
+            return False
+        self.position = self._get_frame_id(self._frame) + 1
+        return True
+
+    def retrieve(self):
+        if self._frame is None:
+            return False, None
+        return True, self._frame.to_ndarray(format=self.output_format)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def set(self, property_id: int, value) -> bool:
+        if property_id != cv2.CAP_PROP_POS_FRAMES:
+            return False
+
+        # Seek to the keyframe before the target, then decode up to it
+        frame_id = int(value)
+        target_pts = self.start_pts + int(frame_id / (self.fps * self.stream.time_base))
+        self.container.seek(target_pts, stream=self.stream, backward=True, any_frame=False)
+        self._frames = self.container.decode(self.stream)
+        self.position = frame_id
+
+        while True:
+            frame = next(self._frames, None)
+            if frame is None:
+                self._frame = None
+                return False
+            if self._get_frame_id(frame) >= frame_id:
+                break
+        # Keep the target frame for the next read
+        self._frames = _prepend(frame, self._frames)
+        return True
+
+    def get(self, property_id: int) -> float:
+        if property_id == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if property_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.stream.frames)
+        if property_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.stream.codec_context.width)
+        if property_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.stream.codec_context.height)
+        if property_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if property_id == cv2.CAP_PROP_FOURCC:
+            codec = self.stream.codec_context.name[:4].ljust(4)
+            return float(sum(ord(character) << (8 * index) for index, character in enumerate(codec)))
+        return 0.0
+
+    def isOpened(self) -> bool:
+        return self.container is not None
+
+    def release(self) -> None:
+        if self.container is not None:
+            self.container.close()
+            self.container = None
+
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+
+def create_decoder(filename: str, backend: str = 'opencv', threads: int = DECODE_THREADS,
+                   pixel_format: str = 'bgr'):
+    """
+    Open a video with the given decoder backend.
+    :param filename: the video filepath.
+    :param backend: the decoder backend, from DECODER_BACKENDS.
+    :param threads: the number of decoding threads, 0 to let the backend choose.
+    :param pixel_format: the pixel format of the decoded frames, from PIXEL_FORMATS.
+    :return: the decoder, with the interface of cv2.VideoCapture.
+    """
+    if pixel_format not in PIXEL_FORMATS:
+        raise ValueError(f"Invalid pixel format. Supported formats are: {', '.join(PIXEL_FORMATS)}")
+    if backend == 'opencv':
+        return OpenCVDecoder(filename, threads, pixel_format)
+    if backend == 'pyav':
+        return PyAVDecoder(filename, threads, pixel_format)
+    raise ValueError(f"Invalid decoder backend. Supported backends are: {', '.join(DECODER_BACKENDS)}")
+
+
+def get_available_backends() -> list:
+    """
+    Get the decoder backends whose dependencies are installed.
+    """
+    backends = ['opencv']
+    try:
+        import av  # noqa: F401
+        backends.append('pyav')
+    except ImportError:
+        pass
+    return backends
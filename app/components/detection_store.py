@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Optional
+
+import numpy as np
+
+from app.components.detection_worker import Detections
+
+# Default folder of the detection stores, shared by all the videos
+DETECTION_STORE_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'enacuity', 'detections')
+# Size of the blocks read to hash a file, in bytes
+HASH_BLOCK_SIZE = 1024 * 1024
+# Number of new detections kept in memory before they are written to disk
+FLUSH_EVERY = 256
+
+# Columns of the chunks, one .npy file each, sorted by frame id
+COLUMNS = ['row_frame_ids', 'boxes', 'classes', 'confidences']
+# File listing the chunks of a store from the oldest to the newest, replaced atomically on each flush
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def hash_file(filename: str) -> str:
+    """
+    Hash the content of a file.
+
+    Only the size and three blocks (start, middle and end) are hashed, so hashing a long procedure stays instant.
+    :param filename: the filepath.
+    :return: the hexadecimal digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    size = os.path.getsize(filename)
+    digest.update(str(size).encode())
+
+    with open(filename, 'rb') as file:
+        for offset in sorted({0, max(size // 2 - HASH_BLOCK_SIZE // 2, 0), max(size - HASH_BLOCK_SIZE, 0)}):
+            file.seek(offset)
+            digest.update(file.read(HASH_BLOCK_SIZE))
+
+    return digest.hexdigest()
+
+
+class _Chunk:
+    """
+    Detections of a range of flushes, as memory-mapped columns sorted by frame id.
+    """
+    def __init__(self, folder: str):
+        self.folder: str = folder
+        self.frame_ids: np.ndarray = np.load(os.path.join(folder, 'frame_ids.npy'), mmap_mode='r')
+        self.columns: dict = {column: np.load(os.path.join(folder, f'{column}.npy'), mmap_mode='r')
+                              for column in COLUMNS}
+
+    def __len__(self):
+        return len(self.frame_ids)
+
+    def __contains__(self, frame_id: int):
+        position = np.searchsorted(self.frame_ids, frame_id)
+        return position < len(self.frame_ids) and self.frame_ids[position] == frame_id
+
+    def get_rows(self, frame_id: int) -> dict:
+        row_frame_ids = self.columns['row_frame_ids']
+        start = np.searchsorted(row_frame_ids, frame_id, side='left')
+        end = np.searchsorted(row_frame_ids, frame_id, side='right')
+        return {column: values[start:end] for column, values in self.columns.items()}
+
+
+def merge_columns(older: dict, newer: dict) -> dict:
+    """
+    Merge the columns of two chunks, the frames of the newer one replace the same frames of the older one.
+    :return: the merged columns sorted by frame id, with their 'frame_ids'.
+    """
+    kept_rows = ~np.isin(older['row_frame_ids'], newer['frame_ids'])
+    merged = {column: np.concatenate([older[column][kept_rows], newer[column]]) for column in COLUMNS}
+    order = np.argsort(merged['row_frame_ids'], kind='stable')
+    merged = {column: values[order] for column, values in merged.items()}
+    merged['frame_ids'] = np.union1d(older['frame_ids'], newer['frame_ids'])
+    return merged
+
+
+class DetectionStore:
+    """
+    On-disk store of the detections of one model on one video.
+
+    The store is keyed by the content hash of the video, the hash of the model weights and the confidence threshold.
+    Each flush appends the new detections as a chunk of columns sorted by frame id, read through memory maps,
+    so a lookup is a binary search per chunk and a zero-copy slice. The chunks are merged when the newest one
+    is as large as the one before it, so a store of N frames has O(log N) chunks and a full pass writes each
+    row O(log N) times. A manifest lists the chunks and is replaced atomically: a crash leaves the previous
+    chunks in place, and the files of the merged chunks are only deleted once they are out of the manifest.
+    """
+    def __init__(self, folder: str):
+        self.folder: str = folder
+        self._lock = threading.Lock()
+        # Held for the whole flush, the files are written without holding _lock
+        self._flush_lock = threading.Lock()
+
+        # Memory-mapped chunks from the oldest to the newest, new detections not written yet,
+        # and detections being written by the current flush
+        self._chunks: list = []
+        self._names: dict = {}
+        self._pending: dict = {}
+        self._flushing: dict = {}
+        self._next_chunk_id: int = 0
+
+        self._load()
+
+    @classmethod
+    def open(cls, video_filename: str, weights_filename: str, confidence: float,
+             root: Optional[str] = None) -> 'DetectionStore':
+        """
+        Open the store of a video, a model and a confidence threshold.
+        :param video_filename: the video filepath.
+        :param weights_filename: the model weights filepath, its name is hashed instead if the file does not exist.
+        :param confidence: the confidence threshold of the model.
+        :param root: the folder of the stores, DETECTION_STORE_ROOT by default.
+        :return: the detection store.
+        """
+        if os.path.isfile(weights_filename):
+            model_hash = hash_file(weights_filename)
+        else:
+            model_hash = hashlib.blake2b(os.path.basename(weights_filename).encode(), digest_size=16).hexdigest()
+
+        folder = os.path.join(root or DETECTION_STORE_ROOT, hash_file(video_filename),
+                              f'{model_hash}-conf{confidence:.3f}')
+        return cls(folder)
+
+    def __len__(self):
+        with self._lock:
+            frame_ids = [chunk.frame_ids for chunk in self._chunks]
+            frame_ids.append(np.array(list(self._pending) + list(self._flushing), np.int64))
+            return len(np.unique(np.concatenate(frame_ids)))
+
+    def __contains__(self, frame_id: int):
+        return frame_id in self._pending or frame_id in self._flushing \
+            or any(frame_id in chunk for chunk in self._chunks)
+
+    def get(self, frame_id: int) -> Optional[Detections]:
+        """
+        Get the stored detections of a frame.
+        :param frame_id: the id of the frame.
+        :return: the detections, or None if the frame was never processed.
+        """
+        with self._lock:
+            if frame_id in self._pending:
+                return self._pending[frame_id]
+            if frame_id in self._flushing:
+                return self._flushing[frame_id]
+            # The newest chunk holds the latest detections of a frame processed again
+            for chunk in reversed(self._chunks):
+                if frame_id in chunk:
+                    rows = chunk.get_rows(frame_id)
+                    return Detections(frame_id, rows['boxes'], rows['classes'], rows['confidences'], self._names)
+            return None
+
+    def put(self, detections: Detections) -> None:
+        """
+        Add the detections of a frame, they are written to disk every FLUSH_EVERY frames.
+        :param detections: the detections, tagged by their frame id.
+        :return:
+        """
+        with self._lock:
+            self._pending[detections.frame_id] = detections
+            self._names.update(detections.names)
+            should_flush = len(self._pending) >= FLUSH_EVERY
+
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Append the new detections to the store as a chunk, and merge the last chunks if needed.
+
+        The files are written outside the lock of the store, so put and get never wait for the disk: the detections
+        being written are still served from memory until their chunk is in place. One flush runs at a time.
+        :return:
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+                # Only the flushes change the chunks, the list stays valid until the new chunk is appended
+                chunks = list(self._chunks)
+
+            try:
+                new_frame_ids = np.array(sorted(pending), np.int64)
+                columns = {
+                    'row_frame_ids': np.concatenate([np.full(len(pending[frame_id]), frame_id, np.int64)
+                                                     for frame_id in new_frame_ids]),
+                    'boxes': np.concatenate([np.asarray(pending[frame_id].boxes, np.float32).reshape(-1, 4)
+                                             for frame_id in new_frame_ids]),
+                    'classes': np.concatenate([np.asarray(pending[frame_id].classes, np.int16)
+                                               for frame_id in new_frame_ids]),
+                    'confidences': np.concatenate([np.asarray(pending[frame_id].confidences, np.float32)
+                                                   for frame_id in new_frame_ids]),
+                    'frame_ids': new_frame_ids,
+                }
+
+                # Merge with the last chunks while they are not larger, the merged chunks are only read from here on
+                merged_chunks = []
+                while chunks and len(chunks[-1]) <= len(columns['frame_ids']):
+                    chunk = chunks.pop()
+                    older = {column: np.asarray(values) for column, values in chunk.columns.items()}
+                    older['frame_ids'] = np.asarray(chunk.frame_ids)
+                    columns = merge_columns(older, columns)
+                    merged_chunks.append(chunk)
+                chunks.append(_Chunk(self._write_chunk(columns)))
+            except Exception:
+                # Nothing was written, the detections go back to the pending ones, the newer ones first
+                with self._lock:
+                    self._pending = {**pending, **self._pending}
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                self._chunks = chunks
+                self._flushing = {}
+                names = dict(self._names)
+            self._write_manifest(chunks, names)
+            for chunk in merged_chunks:
+                # Best effort: the memory maps of the detections handed out keep the files open on Windows,
+                # the files left over are removed when the store is opened again
+                self._remove_chunk(chunk.folder)
+
+    def _write_chunk(self, columns: dict) -> str:
+        # Write in a temporary folder first, so a crash never leaves a half-written chunk
+        folder = os.path.join(self.folder, f'chunk-{self._next_chunk_id:06d}')
+        self._next_chunk_id += 1
+        temporary_folder = folder + '.tmp'
+        shutil.rmtree(temporary_folder, ignore_errors=True)
+        os.makedirs(temporary_folder)
+        for column, values in columns.items():
+            np.save(os.path.join(temporary_folder, f'{column}.npy'), values)
+        os.replace(temporary_folder, folder)
+        return folder
+
+    def _write_manifest(self, chunks: list, names: dict) -> None:
+        manifest = {'chunks': [os.path.basename(chunk.folder) for chunk in chunks],
+                    'names': {str(class_id): name for class_id, name in names.items()}}
+        temporary_filename = os.path.join(self.folder, MANIFEST_FILENAME + '.tmp')
+        with open(temporary_filename, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temporary_filename, os.path.join(self.folder, MANIFEST_FILENAME))
+
+    @staticmethod
+    def _remove_chunk(folder: str) -> None:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    def _load(self) -> None:
+        with self._lock:
+            try:
+                with open(os.path.join(self.folder, MANIFEST_FILENAME)) as manifest_file:
+                    manifest = json.load(manifest_file)
+            except (OSError, ValueError):
+                manifest = {'chunks': [], 'names': {}}
+
+            self._names = {int(class_id): name for class_id, name in manifest['names'].items()}
+            self._chunks = [_Chunk(os.path.join(self.folder, name)) for name in manifest['chunks']]
+
+            # The chunks out of the manifest were merged, or written by an interrupted flush
+            listed = set(manifest['chunks'])
+            entries = os.listdir(self.folder) if os.path.isdir(self.folder) else []
+            for entry in entries:
+                if entry.startswith('chunk-') and entry not in listed:
+                    self._remove_chunk(os.path.join(self.folder, entry))
+            chunk_ids = [int(entry[len('chunk-'):]) for entry in entries
+                         if entry.startswith('chunk-') and entry[len('chunk-'):].isdigit()]
+            self._next_chunk_id = max(chunk_ids, default=-1) + 1
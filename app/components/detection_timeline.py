@@ -0,0 +1,300 @@
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.detection_store import DetectionStore
+from app.components.detection_worker import Detections
+from app.components.video_player import VideoPlayer
+
+# Number of frames per detection of the timeline, each detection covers the frames up to the next one
+TIMELINE_STEP = 5
+# Number of frames per model call while the timeline is built
+TIMELINE_BATCH_SIZE = 8
+# Colors of the heatmap: the indexed frames are mapped through the colormap, the others are gray
+HEATMAP_COLORMAP = cv2.COLORMAP_INFERNO
+HEATMAP_PENDING_COLOR = (60, 60, 60)
+
+
+class _ClassRuns:
+    """
+    Run-length intervals of the number of detections of one class, sorted by frame id.
+
+    A run is a [start, end) range of frames with the same non-zero count. An appearance is a range of contiguous
+    runs, i.e. a range of frames where the class is always present.
+    """
+    def __init__(self):
+        self.starts: list = []
+        self.ends: list = []
+        self.counts: list = []
+        self.appearance_starts: list = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def append(self, start: int, end: int, count: int) -> None:
+        # Called in frame order
+        is_contiguous = bool(self.ends) and self.ends[-1] == start
+        if is_contiguous and self.counts[-1] == count:
+            self.ends[-1] = end
+            return
+        if not is_contiguous:
+            self.appearance_starts.append(start)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.counts.append(count)
+
+    def get_count(self, frame_id: int) -> int:
+        position = bisect_right(self.starts, frame_id) - 1
+        if position >= 0 and frame_id < self.ends[position]:
+            return self.counts[position]
+        return 0
+
+
+class DetectionTimeline:
+    """
+    Index of the presence and the number of detections of each class over the frames of a video.
+
+    The index is built once in a background thread, one frame every `step` frames, and stored as run-length
+    intervals per class, so the next or previous appearance of a class is a binary search. The detections
+    already in the detection store are reused without decoding the frames, and the new ones are added to it:
+    the timeline of a video is rebuilt from the store in a moment, and its playback reuses the detections.
+    """
+    def __init__(self, filename: str, num_frames: int, detection_store: Optional[DetectionStore] = None,
+                 detect=None, step: int = TIMELINE_STEP, batch_size: int = TIMELINE_BATCH_SIZE,
+                 processing_size: Optional[tuple] = None):
+        """
+        :param filename: the video filepath.
+        :param num_frames: the number of frames of the video.
+        :param detection_store: the detection store of the video, in source coordinates. None to not use one.
+        :param detect: detects a list of frames, returns their Detections, e.g. ImageFilter.detect to share the
+            model of the GUI. None to only index the detections already in the store.
+        :param step: the number of frames per detection.
+        :param batch_size: the number of frames per call of detect.
+        :param processing_size: the (width, height) the frames are downscaled to before the detection, None for the
+            source size.
+        """
+        self.filename: str = filename
+        self.num_frames: int = num_frames
+        self.detection_store: DetectionStore | None = detection_store
+        self.detect = detect
+        self.step: int = max(1, step)
+        self.batch_size: int = max(1, batch_size)
+        self.processing_size: tuple | None = processing_size
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        # Runs of each class id, names of the classes, and end of the frames indexed so far
+        self._runs: dict = {}
+        self.names: dict = {}
+        self.indexed_frames: int = 0
+        self.detected_frames: int = 0
+        self.error: Exception | None = None
+
+    @property
+    def progress(self) -> float:
+        return self.indexed_frames / self.num_frames if self.num_frames > 0 else 1.0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.indexed_frames >= self.num_frames
+
+    def add(self, detections: Detections) -> None:
+        """
+        Index the detections of a frame, they cover the frames up to the next detection. Called in frame order.
+        """
+        start = detections.frame_id
+        end = min(start + self.step, self.num_frames) if self.num_frames > 0 else start + self.step
+        classes, counts = np.unique(np.asarray(detections.classes, np.int64), return_counts=True)
+        with self._lock:
+            self.names.update(detections.names)
+            for class_id, count in zip(classes.tolist(), counts.tolist()):
+                self._runs.setdefault(class_id, _ClassRuns()).append(start, end, count)
+            self.indexed_frames = max(self.indexed_frames, end)
+
+    def get_class_id(self, name: str) -> Optional[int]:
+        """
+        Get the id of a class from its name, None if the class was never detected.
+        """
+        with self._lock:
+            return next((class_id for class_id, class_name in self.names.items()
+                         if class_name == name and class_id in self._runs), None)
+
+    def get_classes(self) -> list:
+        """
+        Get the names of the classes detected so far.
+        """
+        with self._lock:
+            return sorted(self.names.get(class_id, str(class_id)) for class_id in self._runs)
+
+    def get_counts(self, frame_id: int) -> dict:
+        """
+        Get the number of detections of each class present on a frame.
+        """
+        with self._lock:
+            counts = {class_id: runs.get_count(frame_id) for class_id, runs in self._runs.items()}
+        return {class_id: count for class_id, count in counts.items() if count}
+
+    def get_runs(self, class_id: int) -> tuple:
+        """
+        Get the run-length intervals of a class.
+        :return: the (starts, ends, counts) arrays, a run is a [start, end) range of frames with the same count.
+        """
+        with self._lock:
+            runs = self._runs.get(class_id, _ClassRuns())
+            return (np.array(runs.starts, np.int64), np.array(runs.ends, np.int64),
+                    np.array(runs.counts, np.int64))
+
+    def next_occurrence(self, frame_id: int, class_id: Optional[int] = None) -> Optional[int]:
+        """
+        Get the first frame of the next appearance of a class after a frame.
+        :param frame_id: the current frame.
+        :param class_id: the class, None for any class.
+        :return: the frame id, or None if the class does not appear again in the frames indexed so far.
+        """
+        with self._lock:
+            occurrences = []
+            for runs in self._get_class_runs(class_id):
+                position = bisect_right(runs.appearance_starts, frame_id)
+                if position < len(runs.appearance_starts):
+                    occurrences.append(runs.appearance_starts[position])
+        return min(occurrences, default=None)
+
+    def previous_occurrence(self, frame_id: int, class_id: Optional[int] = None) -> Optional[int]:
+        """
+        Get the first frame of the previous appearance of a class before a frame, the appearance in progress
+        included.
+        :param frame_id: the current frame.
+        :param class_id: the class, None for any class.
+        :return: the frame id, or None if the class does not appear before.
+        """
+        with self._lock:
+            occurrences = []
+            for runs in self._get_class_runs(class_id):
+                position = bisect_left(runs.appearance_starts, frame_id)
+                if position > 0:
+                    occurrences.append(runs.appearance_starts[position - 1])
+        return max(occurrences, default=None)
+
+    def _get_class_runs(self, class_id: Optional[int]) -> list:
+        # Called with the lock held
+        if class_id is None:
+            return list(self._runs.values())
+        return [self._runs[class_id]] if class_id in self._runs else []
+
+    def get_density(self, nb_bins: int, class_id: Optional[int] = None) -> np.ndarray:
+        """
+        Get the mean number of detections per frame of a class, over equal ranges of frames.
+        :param nb_bins: the number of ranges.
+        :param class_id: the class, None for all the classes.
+        :return: the mean counts, as a float array of nb_bins values.
+        """
+        frame_counts = np.zeros(self.num_frames + 1, np.float64)
+        with self._lock:
+            for runs in self._get_class_runs(class_id):
+                np.add.at(frame_counts, runs.starts, runs.counts)
+                np.add.at(frame_counts, runs.ends, np.negative(runs.counts))
+        # Per-frame counts, then their cumulative sum read at the edges of the ranges
+        cumulative_counts = np.concatenate([[0.0], np.cumsum(np.cumsum(frame_counts[:-1]))])
+        edges = np.linspace(0, self.num_frames, nb_bins + 1).astype(np.int64)
+        return (cumulative_counts[edges[1:]] - cumulative_counts[edges[:-1]]) / np.maximum(np.diff(edges), 1)
+
+    def render_heatmap(self, width: int, height: int, class_id: Optional[int] = None) -> np.ndarray:
+        """
+        Draw the density of a class along the video, one column per range of frames.
+        :param width: the width of the heatmap, e.g. the width of the slider.
+        :param height: the height of the heatmap.
+        :param class_id: the class, None for all the classes.
+        :return: the BGR image, the frames not indexed yet are gray.
+        """
+        density = self.get_density(width, class_id)
+        if density.max() > 0:
+            density = density / density.max()
+        row = cv2.applyColorMap((density * 255).astype(np.uint8).reshape(1, -1), HEATMAP_COLORMAP)
+        if self.num_frames > 0:
+            row[0, int(width * self.progress):] = HEATMAP_PENDING_COLOR
+        return np.repeat(row, height, axis=0)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'indexed_frames': self.indexed_frames, 'detected_frames': self.detected_frames,
+                    'classes': len(self._runs), 'runs': sum(len(runs) for runs in self._runs.values())}
+
+    def start(self) -> None:
+        """
+        Build the missing part of the index in a background thread.
+        """
+        if self.is_complete or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='detection-timeline', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        try:
+            self._build()
+        except Exception as error:
+            # The timeline stays partial, the GUI goes on without it
+            self.error = error
+
+    def _build(self) -> None:
+        video_player: VideoPlayer | None = None
+        # Frames of the current batch, with their stored detections or their image to detect
+        batch = []
+
+        for frame_id in range(self.indexed_frames, self.num_frames, self.step):
+            if self._stop_event.is_set():
+                break
+
+            detections = self.detection_store.get(frame_id) if self.detection_store is not None else None
+            if detections is not None:
+                batch.append((frame_id, detections))
+            else:
+                if self.detect is None:
+                    break
+                # The frames are only decoded from the first one missing in the store, through the keyframe seek
+                # and the decoder options of the video player. Without frame cache, the skipped frames are grabbed
+                if video_player is None:
+                    video_player = VideoPlayer(self.filename, frame_cache_bytes=0,
+                                               processing_size=self.processing_size)
+                frame = video_player.decode_frame(frame_id)
+                if frame is None:
+                    break
+                batch.append((frame_id, frame))
+
+            if sum(isinstance(item, np.ndarray) for _, item in batch) >= self.batch_size:
+                self._add_batch(batch, video_player)
+                batch = []
+
+        if batch and not self._stop_event.is_set():
+            self._add_batch(batch, video_player)
+        if self.detection_store is not None:
+            self.detection_store.flush()
+
+    def _add_batch(self, batch: list, video_player: Optional[VideoPlayer]) -> None:
+        frame_ids = [frame_id for frame_id, item in batch if isinstance(item, np.ndarray)]
+        detected = iter(self.detect([item for _, item in batch if isinstance(item, np.ndarray)])
+                        if frame_ids else [])
+
+        for frame_id, item in batch:
+            if isinstance(item, np.ndarray):
+                detections = next(detected)
+                detections.frame_id = frame_id
+                if self.detection_store is not None:
+                    # The store keeps the detections in source coordinates
+                    self.detection_store.put(detections.scaled(*video_player.get_source_scale()))
+                with self._lock:
+                    self.detected_frames += 1
+            else:
+                detections = item
+            self.add(detections)
@@ -0,0 +1,255 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Policies applied when the inference lags behind the submitted frames:
+#  - 'none': every frame is processed, submit blocks until there is room in the queue
+#  - 'drop_oldest': the oldest pending frame is skipped when the queue is full
+#  - 'keep_latest': each batch only takes the most recent frames, all the older pending frames are skipped
+SKIP_POLICIES = ['none', 'drop_oldest', 'keep_latest']
+
+BOX_COLOR = (0, 255, 0)  # Green color for bounding box
+
+
+class Detections:
+    """
+    Detections of the model on one frame, as numpy arrays.
+    """
+    def __init__(self, frame_id: int, boxes=None, classes=None, confidences=None, names: dict = None):
+        self.frame_id: int = frame_id
+        # Bounding box coordinates [x1, y1, x2, y2], class indices and confidence scores
+        self.boxes: np.ndarray = np.zeros((0, 4), np.float32) if boxes is None else boxes
+        self.classes: np.ndarray = np.zeros(0, np.int32) if classes is None else classes
+        self.confidences: np.ndarray = np.zeros(0, np.float32) if confidences is None else confidences
+        self.names: dict = names or {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def scaled(self, scale_x: float, scale_y: float) -> 'Detections':
+        """
+        Get the detections with the boxes scaled, e.g. from the processing size to the source size.
+        """
+        if scale_x == 1.0 and scale_y == 1.0:
+            return self
+        boxes = self.boxes * np.array([scale_x, scale_y, scale_x, scale_y], np.float32)
+        return Detections(self.frame_id, boxes, self.classes, self.confidences, self.names)
+
+    @classmethod
+    def from_result(cls, frame_id: int, result) -> 'Detections':
+        """
+        Convert a YOLO result to detections.
+
+        The boxes, classes and confidences are copied from the device in a single transfer.
+        :param frame_id: the id of the frame the result was computed on.
+        :param result: the ultralytics result.
+        :return: the detections.
+        """
+        data = result.boxes.data.cpu().numpy()  # [x1, y1, x2, y2, confidence, class] per box
+        return cls(frame_id, data[:, :4].astype(np.float32), data[:, 5].astype(np.int32),
+                   data[:, 4].astype(np.float32), result.names)
+
+
+def draw_detections(image, detections: Detections):
+    """
+    Draw the bounding boxes and the labels of the detections on the image, in place.
+    :param image: the BGR image.
+    :param detections: the detections to draw.
+    :return: the image.
+    """
+    for (x1, y1, x2, y2), class_id, confidence in zip(detections.boxes.astype(int), detections.classes,
+                                                      detections.confidences):
+        label = f"{detections.names.get(int(class_id), class_id)}: {confidence:.2f}"  # Class label and confidence
+
+        # Draw bounding box and label
+        cv2.rectangle(image, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        cv2.putText(image, label, (x1 + 5, y2 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 2)
+
+    return image
+
+
+class DetectionWorker:
+    """
+    Run the object detection off the GUI thread, on batches of consecutive frames.
+
+    The GUI thread submits the frames tagged by their frame id, and only overlays the detections
+    once they are ready.
+    """
+    def __init__(self, model, batch_size: int = 4, skip_policy: str = 'keep_latest', max_pending: int = 8,
+                 max_results: int = 256, batch_timeout: float = 0.05, confidence: float = 0.25,
+                 on_detections=None):
+        if skip_policy not in SKIP_POLICIES:
+            raise ValueError(f"Invalid skip policy. Supported policies are: {', '.join(SKIP_POLICIES)}")
+
+        self.model = model
+        self.batch_size: int = max(1, batch_size)
+        self.skip_policy: str = skip_policy
+        self.max_pending: int = max(self.batch_size, max_pending)
+        self.max_results: int = max_results
+        # Maximum time to wait for a full batch once a frame is pending, in seconds
+        self.batch_timeout: float = batch_timeout
+        self.confidence: float = confidence
+        # Called from the worker thread with the detections of each batch, e.g. to store them
+        self.on_detections = on_detections
+
+        # Frames waiting for inference and detections by frame id, shared with the worker thread
+        self._pending: deque = deque()
+        self._results: OrderedDict = OrderedDict()
+        self._condition = threading.Condition()
+        # Bumped by clear: a batch taken before, e.g. of the previous video, is dropped once inferred.
+        # on_detections runs under the callback lock, so no stale batch is handed out once clear returns
+        self._generation: int = 0
+        self._callback_lock = threading.Lock()
+
+        # Counters
+        self.submitted_frames: int = 0
+        self.processed_frames: int = 0
+        self.skipped_frames: int = 0
+        self.batches: int = 0
+        self.last_batch_time: float = 0.0
+
+        # Error raised by the model, it stops the worker and is raised again to the GUI thread
+        self.error: Exception | None = None
+        self._running: bool = True
+        self._thread = threading.Thread(target=self._inference_loop, name='detection-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame_id: int, image) -> None:
+        """
+        Queue a frame for inference.
+        :param frame_id: the id of the frame.
+        :param image: the BGR image, it must not be modified until it is processed.
+        :return:
+        """
+        with self._condition:
+            self._raise_error()
+            if frame_id in self._results or any(pending_id == frame_id for pending_id, _ in self._pending):
+                return
+
+            if self.skip_policy == 'none':
+                self._condition.wait_for(lambda: len(self._pending) < self.max_pending or not self._running)
+                self._raise_error()
+            elif len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.skipped_frames += 1
+
+            self._pending.append((frame_id, image))
+            self.submitted_frames += 1
+            self._condition.notify_all()
+
+    def get(self, frame_id: int, timeout: float = 0.0) -> Optional[Detections]:
+        """
+        Get the detections of a frame.
+        :param frame_id: the id of the frame.
+        :param timeout: the time to wait for the detections, in seconds.
+        :return: the detections, or None if they are not ready.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: frame_id in self._results or not self._running, timeout)
+            self._raise_error()
+            return self._results.get(frame_id)
+
+    def _raise_error(self) -> None:
+        # Called with the condition held
+        if self.error is not None:
+            raise self.error
+
+    def get_latest(self, frame_id: int, max_age: int = 0) -> Optional[Detections]:
+        """
+        Get the most recent detections computed at or before the given frame.
+        :param frame_id: the id of the displayed frame.
+        :param max_age: the maximum distance in frames between the detections and the displayed frame.
+        :return: the detections, or None if there are no recent enough detections.
+        """
+        with self._condition:
+            for result_id in range(frame_id, frame_id - max_age - 1, -1):
+                if result_id in self._results:
+                    return self._results[result_id]
+        return None
+
+    def get_stats(self) -> dict:
+        return {'pending_frames': len(self._pending),
+                'submitted_frames': self.submitted_frames,
+                'processed_frames': self.processed_frames,
+                'skipped_frames': self.skipped_frames,
+                'batches': self.batches,
+                'last_batch_time': self.last_batch_time}
+
+    def clear(self) -> None:
+        """
+        Forget the pending frames and the detections, e.g. when another video is loaded.
+        :return:
+        """
+        with self._callback_lock, self._condition:
+            self._generation += 1
+            self._pending.clear()
+            self._results.clear()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _next_batch(self) -> list:
+        if self.skip_policy == 'keep_latest':
+            # Inference lags behind: skip the older frames and only process the most recent ones
+            while len(self._pending) > self.batch_size:
+                self._pending.popleft()
+                self.skipped_frames += 1
+
+        batch = []
+        while self._pending and len(batch) < self.batch_size:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _inference_loop(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or not self._running)
+                # Give the GUI thread a chance to fill the batch
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size or not self._running,
+                                         self.batch_timeout)
+                if not self._running:
+                    break
+                batch = self._next_batch()
+                generation = self._generation
+                # Let the GUI thread submit again while the model runs
+                self._condition.notify_all()
+
+            start = time.perf_counter()
+            try:
+                results = self.model([image for _, image in batch], conf=self.confidence, verbose=False)
+                detections = [Detections.from_result(frame_id, result)
+                              for (frame_id, _), result in zip(batch, results)]
+            except Exception as error:
+                # E.g. missing weights: stop, and let the waiting and the next calls raise instead of timing out
+                with self._condition:
+                    self.error = error
+                    self._running = False
+                    self._condition.notify_all()
+                return
+            self.last_batch_time = time.perf_counter() - start
+
+            with self._callback_lock:
+                if generation != self._generation:
+                    # The worker was cleared while the batch ran
+                    continue
+                if self.on_detections is not None:
+                    self.on_detections(detections)
+                self._store_results(detections, len(batch))
+
+    def _store_results(self, detections: list, nb_frames: int) -> None:
+        with self._condition:
+            for frame_detections in detections:
+                self._results[frame_detections.frame_id] = frame_detections
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+            self.processed_frames += nb_frames
+            self.batches += 1
+            self._condition.notify_all()
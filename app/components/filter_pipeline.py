@@ -0,0 +1,250 @@
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.detection_worker import draw_detections
+
+# Pixel formats of the images flowing through the pipeline
+BGR = 'bgr'
+GRAY = 'gray'
+CONVERSIONS = {(BGR, GRAY): cv2.COLOR_BGR2GRAY, (GRAY, BGR): cv2.COLOR_GRAY2BGR}
+
+# Edge overlay: Canny thresholds, size of the denoising blur, color of the edges (BGR), and weight of the
+# current frame in the temporal average of the smoothed variant
+EDGE_THRESHOLDS = (50, 150)
+EDGE_BLUR_SIZE = (5, 5)
+EDGE_COLOR = (0, 255, 0)
+EDGE_SMOOTHING = 0.4
+
+# Registered filter stages, by name, in menu order
+FILTER_REGISTRY: OrderedDict = OrderedDict()
+
+
+def register_filter(stage_class):
+    """
+    Class decorator adding a filter stage to the registry.
+    """
+    FILTER_REGISTRY[stage_class.name] = stage_class
+    return stage_class
+
+
+def get_filter_name(label: str) -> str:
+    """
+    Get the name of a registered filter from its menu label.
+    """
+    for name, stage_class in FILTER_REGISTRY.items():
+        if stage_class.label == label:
+            return name
+    raise ValueError(f"Unknown filter: {label}")
+
+
+def get_image_format(image) -> str:
+    return GRAY if image.ndim == 2 else BGR
+
+
+class FilterContext:
+    """
+    Information about the frame being filtered, shared by the stages of the pipeline.
+    """
+    def __init__(self, source, frame_id: int = None, image_filter=None, wait_for_detections: bool = True,
+                 detections=None):
+        # The unfiltered frame, it must not be modified
+        self.source = source
+        self.frame_id: int = frame_id
+        self.image_filter = image_filter
+        self.wait_for_detections: bool = wait_for_detections
+        # Detections to draw instead of running the model, e.g. mapped to the source size
+        self.detections = detections
+
+
+class FilterStage:
+    """
+    Base class of the filter stages.
+
+    A stage declares the pixel format it reads (None for any) and writes. In-place stages modify the image they receive,
+    the pipeline makes sure they never modify the decoded frame.
+    """
+    name: str = ''
+    label: str = ''
+    input_format: Optional[str] = BGR
+    output_format: str = BGR
+    in_place: bool = False
+
+    def apply(self, image, context: FilterContext):
+        raise NotImplementedError
+
+
+@register_filter
+class GrayStage(FilterStage):
+    name = 'gray'
+    label = 'Gray'
+    # Frames decoded straight to gray are passed through
+    input_format = None
+    output_format = GRAY
+
+    def apply(self, image, context: FilterContext):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+@register_filter
+class ObjectDetectionStage(FilterStage):
+    name = 'object_detection'
+    label = 'Object Detection'
+    input_format = BGR
+    output_format = BGR
+    in_place = True
+
+    def apply(self, image, context: FilterContext):
+        # The model runs on the unfiltered frame, the boxes are drawn on the current image
+        detections = context.detections
+        if detections is None:
+            detections = context.image_filter.get_detections(context.frame_id, context.wait_for_detections)
+        context.image_filter.detections = detections
+        if detections is not None:
+            draw_detections(image, detections)
+        return image
+
+
+@register_filter
+class DetectEdgesStage(FilterStage):
+    """
+    Overlay the Canny edges of the frame.
+
+    The intermediate images are written to buffers allocated once per resolution, so no array is allocated per frame.
+    With temporal smoothing, the edges are averaged with the ones of the previous frames, which removes the flicker
+    of the edges of noisy or compressed videos.
+    """
+    name = 'detect_edges'
+    label = 'Detect edges'
+    input_format = BGR
+    output_format = BGR
+    in_place = True
+    # Weight of the current frame in the running average of the edges, 1 to disable the temporal smoothing
+    smoothing: float = 1.0
+
+    def __init__(self):
+        self._shape: tuple | None = None
+        self._blurred: np.ndarray | None = None
+        self._edges: np.ndarray | None = None
+        self._color: np.ndarray | None = None
+        # Running average of the edges, and the frame it was last updated with
+        self._average: np.ndarray | None = None
+        self._mask: np.ndarray | None = None
+        self._previous_frame_id: int | None = None
+
+    def _allocate(self, shape: tuple) -> None:
+        self._shape = shape
+        self._blurred = np.empty(shape[:2], np.uint8)
+        self._edges = np.empty(shape[:2], np.uint8)
+        self._color = np.empty(shape, np.uint8)
+        self._color[:] = EDGE_COLOR
+        self._average = np.zeros(shape[:2], np.float32)
+        self._mask = np.empty(shape[:2], np.uint8)
+        self._previous_frame_id = None
+
+    def apply(self, image, context: FilterContext):
+        if image.shape != self._shape:
+            self._allocate(image.shape)
+
+        cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=self._blurred)
+        cv2.GaussianBlur(self._blurred, EDGE_BLUR_SIZE, 0, dst=self._blurred)
+        cv2.Canny(self._blurred, *EDGE_THRESHOLDS, edges=self._edges)
+
+        mask = self._edges
+        if self.smoothing < 1.0:
+            # The average restarts after a seek, the previous edges belong to another part of the video
+            is_next_frame = self._previous_frame_id is not None and context.frame_id == self._previous_frame_id + 1
+            if is_next_frame:
+                cv2.accumulateWeighted(self._edges, self._average, self.smoothing)
+            else:
+                self._average[:] = self._edges
+            self._previous_frame_id = context.frame_id
+            # A pixel is an edge if it was one in most of the recent frames
+            cv2.compare(self._average, 127, cv2.CMP_GT, dst=self._mask)
+            mask = self._mask
+
+        cv2.copyTo(self._color, mask, image)
+        return image
+
+
+@register_filter
+class SmoothedEdgesStage(DetectEdgesStage):
+    name = 'smoothed_edges'
+    label = 'Smoothed edges'
+    smoothing = EDGE_SMOOTHING
+
+
+class FilterPipeline:
+    """
+    Chain of filter stages.
+
+    The format conversions are only done when two adjacent stages disagree, the decoded frame is copied at most
+    once (before the first in-place stage that would modify it), and each stage is timed.
+    """
+    def __init__(self, filter_types: list):
+        unknown = [filter_type for filter_type in filter_types if filter_type not in FILTER_REGISTRY]
+        if unknown:
+            raise ValueError(f"Invalid filter {', '.join(unknown)}. "
+                             f"Supported filters are: {', '.join(FILTER_REGISTRY)}")
+
+        self.filter_types: list = list(filter_types)
+        self.stages: list = [FILTER_REGISTRY[filter_type]() for filter_type in filter_types]
+
+        # Accumulated time and number of calls per stage, conversions included
+        self.stage_times: dict = defaultdict(float)
+        self.stage_calls: dict = defaultdict(int)
+
+    def run(self, image, context: FilterContext, output_format: str = BGR):
+        """
+        Apply the stages to the image.
+        :param image: the decoded frame, it is never modified.
+        :param context: the information shared by the stages.
+        :param output_format: the format of the returned image, None to keep the format of the last stage.
+        :return: the filtered image.
+        """
+        current_format = get_image_format(image)
+        # Whether the current image belongs to the pipeline and can be modified in place
+        is_owned = False
+
+        for stage in self.stages:
+            if stage.input_format is not None and current_format != stage.input_format:
+                image = self._convert(image, current_format, stage.input_format)
+                current_format, is_owned = stage.input_format, True
+            if stage.in_place and not is_owned:
+                image = self._timed('copy', image.copy)
+                is_owned = True
+
+            start = time.perf_counter()
+            result = stage.apply(image, context)
+            self._record(stage.name, start)
+
+            is_owned = is_owned or result is not image
+            image, current_format = result, stage.output_format
+
+        if output_format is not None and current_format != output_format:
+            image = self._convert(image, current_format, output_format)
+        return image
+
+    def get_timings(self) -> dict:
+        """
+        Get the mean time per call of each stage, in milliseconds.
+        """
+        return {name: 1000 * self.stage_times[name] / self.stage_calls[name] for name in self.stage_calls}
+
+    def _convert(self, image, from_format: str, to_format: str):
+        return self._timed('convert', cv2.cvtColor, image, CONVERSIONS[(from_format, to_format)])
+
+    def _timed(self, name: str, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self._record(name, start)
+        return result
+
+    def _record(self, name: str, start: float) -> None:
+        self.stage_times[name] += time.perf_counter() - start
+        self.stage_calls[name] += 1
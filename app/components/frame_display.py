@@ -0,0 +1,184 @@
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from app.profiling import StageProfiler
+
+# Size of the image element of the GUI
+DISPLAY_SIZE = (854, 480)
+DISPLAY_BACKENDS = ['auto', 'photo_image', 'ppm']
+
+
+def fit_size(frame_size: tuple, display_size: tuple) -> tuple:
+    """
+    Get the largest size with the aspect ratio of the frame that fits in the display.
+    :param frame_size: the (width, height) of the frame.
+    :param display_size: the (width, height) of the display.
+    :return: the (width, height) of the scaled frame.
+    """
+    scale = min(display_size[0] / frame_size[0], display_size[1] / frame_size[1])
+    return max(1, round(frame_size[0] * scale)), max(1, round(frame_size[1] * scale))
+
+
+class FrameDisplay:
+    """
+    Show BGR frames in a PySimpleGUI image element, and measure the per-frame cost.
+
+    The work is split in prepare, which only touches numpy buffers, and show, which hands the result to Tk,
+    so the two can be measured separately.
+    """
+    def __init__(self, image_element=None, display_size: tuple = DISPLAY_SIZE):
+        self.image_element = image_element
+        self.display_size: tuple = display_size
+
+        # Accumulated cost of the displayed frames, in seconds
+        self.nb_frames: int = 0
+        self.prepare_time: float = 0.0
+        self.show_time: float = 0.0
+        # Records the encode and show times of each frame, when set and enabled
+        self.profiler: StageProfiler | None = None
+
+    def prepare(self, frame):
+        raise NotImplementedError
+
+    def show(self, prepared) -> None:
+        raise NotImplementedError
+
+    def update(self, frame) -> None:
+        """
+        Show a frame in the image element.
+        :param frame: the BGR frame.
+        :return:
+        """
+        start = time.perf_counter()
+        prepared = self.prepare(frame)
+        prepared_time = time.perf_counter()
+        self.show(prepared)
+
+        shown_time = time.perf_counter()
+
+        self.nb_frames += 1
+        self.prepare_time += prepared_time - start
+        self.show_time += shown_time - prepared_time
+        if self.profiler is not None:
+            self.profiler.record('encode', prepared_time - start)
+            self.profiler.record('show', shown_time - prepared_time)
+
+    def get_stats(self) -> dict:
+        """
+        Get the mean per-frame cost of the display, in milliseconds.
+        """
+        nb_frames = max(self.nb_frames, 1)
+        return {'frames': self.nb_frames,
+                'prepare_ms': 1000 * self.prepare_time / nb_frames,
+                'show_ms': 1000 * self.show_time / nb_frames,
+                'total_ms': 1000 * (self.prepare_time + self.show_time) / nb_frames}
+
+
+class PPMFrameDisplay(FrameDisplay):
+    """
+    Previous display path: the full frame is serialized to PPM bytes, then parsed again by Tk.
+    """
+    def prepare(self, frame):
+        # The gray frames are encoded as PGM, which Tk parses like PPM
+        return cv2.imencode('.pgm' if frame.ndim == 2 else '.ppm', frame)[1].tobytes()
+
+    def show(self, prepared) -> None:
+        self.image_element.update(data=prepared)
+
+
+class PhotoImageFrameDisplay(FrameDisplay):
+    """
+    Display path with as few copies as possible.
+
+    The frame is scaled once to the display size and converted to RGBA in preallocated buffers, wrapped by a PIL
+    image without copy (PIL only shares the memory of 4-channel buffers, not RGB ones), and pasted in a Tk photo
+    image that is reused from one frame to the next.
+    """
+    def __init__(self, image_element=None, display_size: tuple = DISPLAY_SIZE):
+        super().__init__(image_element, display_size)
+        self._frame_shape: tuple | None = None
+        self._resized: np.ndarray | None = None
+        self._rgba: np.ndarray | None = None
+        self._pil_image: Image.Image | None = None
+        self._photo_image: ImageTk.PhotoImage | None = None
+
+    def _allocate(self, frame_shape: tuple) -> None:
+        # The buffers are only allocated again when the resolution of the video changes
+        self._frame_shape = frame_shape
+        width, height = fit_size((frame_shape[1], frame_shape[0]), self.display_size)
+        self._resized = np.empty((height, width) + frame_shape[2:], np.uint8)
+        self._rgba = np.empty((height, width, 4), np.uint8)
+        self._pil_image = Image.frombuffer('RGBA', (width, height), self._rgba, 'raw', 'RGBA', 0, 1)
+        self._photo_image = None
+
+    def prepare(self, frame):
+        if frame.shape != self._frame_shape:
+            self._allocate(frame.shape)
+
+        height, width = self._rgba.shape[:2]
+        if frame.shape[:2] == (height, width):
+            source = frame
+        else:
+            cv2.resize(frame, (width, height), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+            source = self._resized
+
+        if source.ndim == 2:
+            cv2.cvtColor(source, cv2.COLOR_GRAY2RGBA, dst=self._rgba)
+        else:
+            cv2.cvtColor(source, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+        # The PIL image shares the memory of the RGBA buffer
+        return self._pil_image
+
+    def show(self, prepared) -> None:
+        if self._photo_image is None:
+            self._photo_image = ImageTk.PhotoImage(prepared)
+            self.image_element.update(data=self._photo_image)
+        else:
+            # The Tk image is updated in place, the widget refreshes by itself
+            self._photo_image.paste(prepared)
+
+
+class AutoFrameDisplay(FrameDisplay):
+    """
+    Display path chosen from the size of each frame.
+
+    The photo image path is the cheaper one for the frames at or above the display size: it scales them down
+    once and hands them to Tk without encoding. Scaling up the frames smaller than the display costs more than
+    encoding them to PPM, so they are shown at their own size through the PPM path.
+    """
+    def __init__(self, image_element=None, display_size: tuple = DISPLAY_SIZE):
+        super().__init__(image_element, display_size)
+        self.photo_image_display: PhotoImageFrameDisplay = PhotoImageFrameDisplay(image_element, display_size)
+        self.ppm_display: PPMFrameDisplay = PPMFrameDisplay(image_element, display_size)
+        self._last_display: FrameDisplay | None = None
+
+    def get_display(self, frame) -> FrameDisplay:
+        height, width = frame.shape[:2]
+        if fit_size((width, height), self.display_size)[0] > width:
+            return self.ppm_display
+        return self.photo_image_display
+
+    def prepare(self, frame):
+        display = self.get_display(frame)
+        return display, display.prepare(frame)
+
+    def show(self, prepared) -> None:
+        display, prepared = prepared
+        if display is not self._last_display and display is self.photo_image_display:
+            # The element showed the PPM frames meanwhile, the photo image must be set on it again
+            self.photo_image_display._photo_image = None
+        self._last_display = display
+        display.show(prepared)
+
+
+def create_frame_display(backend: str, image_element=None, display_size: tuple = DISPLAY_SIZE) -> FrameDisplay:
+    if backend == 'auto':
+        return AutoFrameDisplay(image_element, display_size)
+    if backend == 'photo_image':
+        return PhotoImageFrameDisplay(image_element, display_size)
+    if backend == 'ppm':
+        return PPMFrameDisplay(image_element, display_size)
+    raise ValueError(f"Invalid display backend. Supported backends are: {', '.join(DISPLAY_BACKENDS)}")
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import cv2
+
+from app.components.keyframe_index import KeyframeIndex, seek_capture
+
+
+class FramePrefetcher:
+    """
+    Decode frames ahead of the playhead in a background thread.
+
+    The decoder thread owns its own cv2.VideoCapture and fills a bounded ring of decoded frames.
+    The GUI thread only pops frames that are already decoded, so the decode time no longer adds up
+    to the GUI timeout during playback.
+    """
+    def __init__(self, filename: str, capacity: int = 32, keyframe_index: Optional[KeyframeIndex] = None,
+                 transform=None, open_decoder=None):
+        self.filename: str = filename
+        # Opens the capture of the decoder thread, a cv2.VideoCapture by default
+        self.open_decoder = open_decoder or (lambda: cv2.VideoCapture(self.filename))
+        self.capacity: int = max(1, capacity)
+        self.keyframe_index: KeyframeIndex | None = keyframe_index
+        # Applied to each frame in the decoder thread, e.g. to downscale it
+        self.transform = transform
+
+        # Ring of (frame_id, frame) tuples, shared between the decoder and the GUI thread
+        self._ring: deque = deque()
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running: bool = False
+
+        # Decoder position and seek bookkeeping
+        self._next_frame_id: int = 0
+        self._seek_pending: bool = True
+        self._generation: int = 0
+        self.end_of_stream: bool = False
+
+        # Counters
+        self.decoded_frames: int = 0
+        self.dropped_frames: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of decoded frames ready to be popped.
+        """
+        return len(self._ring)
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def start(self, frame_id: int = 0) -> None:
+        """
+        Start the decoder thread at the given frame id.
+        :param frame_id: the id of the first frame to decode.
+        :return:
+        """
+        if self._running:
+            self.seek(frame_id)
+            return
+
+        with self._condition:
+            self._running = True
+            self._next_frame_id = int(frame_id)
+            self._seek_pending = True
+            self.end_of_stream = False
+
+        self._thread = threading.Thread(target=self._decode_loop, name='frame-prefetcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the decoder thread and flush the ring.
+        :return:
+        """
+        with self._condition:
+            self._running = False
+            self._flush()
+            self._condition.notify_all()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def seek(self, frame_id: int) -> None:
+        """
+        Flush the ring and restart decoding from the given frame id.
+        :param frame_id: the id of the next frame to decode.
+        :return:
+        """
+        with self._condition:
+            self._seek(frame_id)
+
+    def is_ready(self, frame_id: int) -> bool:
+        """
+        Whether popping the given frame would return at once, i.e. it is decoded or no frame will come.
+        :param frame_id: the id of the frame.
+        :return:
+        """
+        with self._condition:
+            if self.end_of_stream or not self._running:
+                return True
+            # The older frames of the ring are dropped by pop
+            return bool(self._ring) and frame_id <= self._ring[-1][0]
+
+    def pop(self, frame_id: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        Pop the next decoded frame.
+
+        Block until a frame is ready, the end of the video is reached or the timeout expires.
+        If a frame id is given, the older frames of the ring are dropped, and the decoder is restarted
+        if the frame is neither in the ring nor about to be decoded.
+        :param frame_id: the id of the frame to pop, None to pop the oldest frame of the ring.
+        :param timeout: the maximum time to wait in seconds, None to wait until a frame is ready.
+        :return: a (frame_id, frame) tuple, or None if no frame is available.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            if frame_id is not None:
+                lowest_frame_id = self._ring[0][0] if self._ring else self._next_frame_id
+                if not lowest_frame_id <= frame_id <= self._next_frame_id + self.capacity:
+                    self._seek(frame_id)
+
+            while True:
+                if frame_id is not None:
+                    self._drop_before(frame_id)
+
+                if self._ring:
+                    item = self._ring.popleft()
+                    # Wake up the decoder as a slot is now free
+                    self._condition.notify_all()
+                    return item
+
+                if self.end_of_stream or not self._running:
+                    return None
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def get_stats(self) -> dict:
+        return {'queue_depth': self.queue_depth,
+                'capacity': self.capacity,
+                'decoded_frames': self.decoded_frames,
+                'dropped_frames': self.dropped_frames}
+
+    def _flush(self) -> None:
+        # Frames decoded but never displayed are counted as dropped
+        self.dropped_frames += len(self._ring)
+        self._ring.clear()
+
+    def _drop_before(self, frame_id: int) -> None:
+        while self._ring and self._ring[0][0] < frame_id:
+            self._ring.popleft()
+            self.dropped_frames += 1
+            self._condition.notify_all()
+
+    def _seek(self, frame_id: int) -> None:
+        self._flush()
+        self._next_frame_id = int(frame_id)
+        self._seek_pending = True
+        self.end_of_stream = False
+        # Any frame decoded before the seek is now stale
+        self._generation += 1
+        self._condition.notify_all()
+
+    def _decode_loop(self) -> None:
+        capture = self.open_decoder()
+        # Id of the next frame the capture will decode
+        position = 0
+
+        while True:
+            with self._condition:
+                # Wait for a free slot or a seek request
+                self._condition.wait_for(lambda: not self._running or self._seek_pending
+                                         or (len(self._ring) < self.capacity and not self.end_of_stream))
+                if not self._running:
+                    break
+
+                seek_to = self._next_frame_id if self._seek_pending else None
+                self._seek_pending = False
+                generation = self._generation
+                frame_id = self._next_frame_id
+
+            # Seek and decode outside the lock so the GUI thread can pop meanwhile
+            if seek_to is not None and seek_to != position:
+                position = seek_capture(capture, position, seek_to, self.keyframe_index)
+            ret, frame = capture.read()
+            if ret:
+                position += 1
+                if self.transform is not None:
+                    frame = self.transform(frame)
+
+            with self._condition:
+                if generation != self._generation:
+                    # A seek happened while decoding, this frame is stale
+                    if ret:
+                        self.dropped_frames += 1
+                    continue
+
+                if not ret:
+                    self.end_of_stream = True
+                else:
+                    self._ring.append((frame_id, frame))
+                    self._next_frame_id += 1
+                    self.decoded_frames += 1
+
+                self._condition.notify_all()
+
+        capture.release()
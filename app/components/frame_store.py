@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.detection_store import hash_file
+
+# Default folder of the frame stores, on the local disk
+FRAME_STORE_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'enacuity', 'frames')
+# Maximum size of a frame store, longer or larger videos are decoded as usual
+FRAME_STORE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+# Number of frames written between two updates of the metadata
+FRAME_STORE_FLUSH_EVERY = 256
+
+
+class FrameStore:
+    """
+    Decoded frames of a video, materialized once in a memory-mapped uint8 array on the local disk.
+
+    The store is keyed by the content hash of the video, the size and the channels of the frames.
+    The frames are written in order by materialize, typically in a background thread: the frames already written
+    are served as zero-copy, read-only slices of the memory map, and an interrupted materialization
+    resumes where it stopped.
+    """
+    def __init__(self, filename: str, num_frames: int, frame_shape: tuple):
+        """
+        :param filename: the .npy file of the store.
+        :param num_frames: the number of frames of the video.
+        :param frame_shape: the shape of one frame, (height, width) or (height, width, channels).
+        """
+        self.filename: str = filename
+        self.metadata_filename: str = os.path.splitext(filename)[0] + '.json'
+        self.num_frames: int = num_frames
+        self.frame_shape: tuple = tuple(frame_shape)
+
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # Number of frames written, they are the first ones of the video
+        self.num_stored: int = self._load_metadata()
+        mode = 'r+' if self.num_stored > 0 and os.path.exists(filename) else 'w+'
+        if mode == 'w+':
+            self.num_stored = 0
+        self.frames: np.ndarray = np.lib.format.open_memmap(filename, mode=mode, dtype=np.uint8,
+                                                            shape=(num_frames,) + self.frame_shape)
+
+    @classmethod
+    def open(cls, video_filename: str, num_frames: int, frame_shape: tuple, root: Optional[str] = None,
+             max_bytes: int = FRAME_STORE_MAX_BYTES) -> Optional['FrameStore']:
+        """
+        Open the frame store of a video.
+        :param video_filename: the video filepath.
+        :param num_frames: the number of frames of the video.
+        :param frame_shape: the shape of one stored frame.
+        :param root: the folder of the stores, FRAME_STORE_ROOT by default.
+        :param max_bytes: the maximum size of the store.
+        :return: the frame store, or None if the video is too large for the cap or the store cannot be written.
+        """
+        if num_frames <= 0 or num_frames * int(np.prod(frame_shape)) > max_bytes:
+            return None
+
+        root = root or FRAME_STORE_ROOT
+        shape_name = 'x'.join(str(dimension) for dimension in frame_shape)
+        filename = os.path.join(root, f'{hash_file(video_filename)}-{shape_name}.npy')
+        try:
+            os.makedirs(root, exist_ok=True)
+            return cls(filename, num_frames, frame_shape)
+        except OSError:
+            return None
+
+    def _load_metadata(self) -> int:
+        try:
+            with open(self.metadata_filename) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return 0
+        if metadata.get('num_frames') != self.num_frames:
+            return 0
+        return metadata.get('num_stored', 0)
+
+    def flush(self) -> None:
+        self.frames.flush()
+        try:
+            with open(self.metadata_filename, 'w') as metadata_file:
+                json.dump({'num_frames': self.num_frames, 'num_stored': self.num_stored}, metadata_file)
+        except OSError:
+            pass
+
+    @property
+    def is_complete(self) -> bool:
+        return self.num_stored >= self.num_frames
+
+    def __contains__(self, frame_id: int):
+        return 0 <= frame_id < self.num_stored
+
+    def get(self, frame_id: int):
+        """
+        Get a stored frame, without copy.
+        :param frame_id: the id of the frame.
+        :return: a read-only view of the frame, or None if it is not stored yet.
+        """
+        if frame_id not in self:
+            return None
+        frame = self.frames[frame_id]
+        frame.flags.writeable = False
+        return frame
+
+    def materialize(self, open_decoder, transform=None) -> None:
+        """
+        Decode the missing frames of the video into the store.
+        :param open_decoder: the function opening a decoder on the video.
+        :param transform: applied to each decoded frame before it is stored, e.g. to downscale it.
+        :return:
+        """
+        if self.is_complete:
+            return
+
+        decoder = open_decoder()
+        if self.num_stored > 0:
+            decoder.set(cv2.CAP_PROP_POS_FRAMES, self.num_stored)
+
+        while not self._stop_event.is_set() and not self.is_complete:
+            ret, frame = decoder.read()
+            if not ret:
+                break
+            if transform is not None:
+                frame = transform(frame)
+            self.frames[self.num_stored] = frame
+            # The frame is only served once it is fully written
+            self.num_stored += 1
+            if self.num_stored % FRAME_STORE_FLUSH_EVERY == 0:
+                self.flush()
+
+        decoder.release()
+        self.flush()
+
+    def start(self, open_decoder, transform=None) -> None:
+        """
+        Materialize the store in a background thread.
+        """
+        if self.is_complete or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.materialize, args=(open_decoder, transform),
+                                        name='frame-store', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
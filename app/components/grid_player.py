@@ -0,0 +1,171 @@
+import math
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.decode_scheduler import DECODE_WORKERS, STREAM_PREFETCH_SIZE, DecodeScheduler
+from app.components.frame_display import DISPLAY_SIZE, fit_size
+from app.components.video_player import VideoPlayer
+
+
+def get_grid_shape(nb_cells: int, columns: Optional[int] = None) -> tuple:
+    """
+    Get the (columns, rows) of a grid, as square as possible by default.
+    """
+    columns = columns or math.ceil(math.sqrt(nb_cells))
+    return columns, math.ceil(nb_cells / columns)
+
+
+class GridCompositor:
+    """
+    Composite the frames of several videos into one BGR buffer, shown with a single update of the image element.
+
+    The buffer is allocated once, each frame is resized straight into its cell and letterboxed.
+    """
+    def __init__(self, nb_cells: int, size: tuple = DISPLAY_SIZE, columns: Optional[int] = None):
+        """
+        :param nb_cells: the number of videos.
+        :param size: the maximum (width, height) of the whole grid.
+        :param columns: the number of columns, None for a grid as square as possible.
+        """
+        self.columns, self.rows = get_grid_shape(nb_cells, columns)
+        self.cell_size: tuple = (size[0] // self.columns, size[1] // self.rows)
+        self.buffer: np.ndarray = np.zeros((self.rows * self.cell_size[1], self.columns * self.cell_size[0], 3),
+                                           np.uint8)
+
+    def get_cell(self, index: int) -> np.ndarray:
+        """
+        Get the view of the buffer of a cell.
+        """
+        row, column = divmod(index, self.columns)
+        width, height = self.cell_size
+        return self.buffer[row * height:(row + 1) * height, column * width:(column + 1) * width]
+
+    def update(self, index: int, frame) -> None:
+        """
+        Draw a BGR or gray frame in its cell, centered and scaled to fit.
+        :param index: the index of the cell.
+        :param frame: the frame.
+        """
+        cell = self.get_cell(index)
+        width, height = fit_size((frame.shape[1], frame.shape[0]), self.cell_size)
+        if (width, height) != self.cell_size:
+            cell[:] = 0
+        x, y = (self.cell_size[0] - width) // 2, (self.cell_size[1] - height) // 2
+        target = cell[y:y + height, x:x + width]
+
+        if (frame.shape[1], frame.shape[0]) != (width, height):
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        if frame.ndim == 2:
+            cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=target)
+        else:
+            target[:] = frame
+
+    def clear(self, index: int) -> None:
+        self.get_cell(index)[:] = 0
+
+
+class GridPlayer:
+    """
+    Play several videos side by side, synchronized on the timeline of the longest one.
+
+    The frames are decoded at the size of the cells by a DecodeScheduler shared by all the videos, and composited
+    into one buffer. A video whose frame is not decoded yet keeps its previous frame, so a slow video never stalls
+    the others.
+    """
+    def __init__(self, filenames: list, size: tuple = DISPLAY_SIZE, columns: Optional[int] = None,
+                 workers: int = DECODE_WORKERS, prefetch_size: int = STREAM_PREFETCH_SIZE):
+        """
+        :param filenames: the video filepaths.
+        :param size: the maximum (width, height) of the grid.
+        :param columns: the number of columns, None for a grid as square as possible.
+        :param workers: the number of decoding threads shared by the videos.
+        :param prefetch_size: the number of frames decoded ahead of the playhead of each video.
+        """
+        if not filenames:
+            raise ValueError("The grid needs at least one video")
+
+        self.compositor: GridCompositor = GridCompositor(len(filenames), size, columns)
+        # The frames are decoded straight to the cell size. The scheduler keeps its own frames, no cache is needed
+        self.video_players: list = [VideoPlayer(filename, frame_cache_bytes=0,
+                                                processing_size=self.compositor.cell_size)
+                                    for filename in filenames]
+        self.scheduler: DecodeScheduler = DecodeScheduler(self.video_players, workers, prefetch_size)
+
+        # The longest video drives the timeline
+        self.master: VideoPlayer = max(self.video_players,
+                                       key=lambda video_player: video_player.metadata.duration)
+        self.num_frames: int = self.master.num_frames
+        self.fps: float = self.master.fps
+        self.current_frame_id: int = 0
+        # Frame id shown in each cell, -1 if none yet
+        self.shown_frame_ids: list = [-1] * len(self.video_players)
+        self.stale_frames: int = 0
+
+    def get_stream_frame_id(self, stream_index: int, frame_id: int) -> Optional[int]:
+        """
+        Get the frame of a video shown at a frame of the timeline.
+        :return: the frame id, or None if the video is already over.
+        """
+        video_player = self.video_players[stream_index]
+        if video_player is self.master or self.fps <= 0:
+            stream_frame_id = frame_id
+        else:
+            stream_frame_id = int(frame_id / self.fps * video_player.fps)
+        if video_player.num_frames > 0 and stream_frame_id >= video_player.num_frames:
+            return None
+        return stream_frame_id
+
+    def seek(self, frame_id: int) -> None:
+        """
+        Move all the videos to a frame of the timeline, the decoding starts in the background.
+        """
+        self.current_frame_id = int(frame_id)
+        for stream_index in range(len(self.video_players)):
+            stream_frame_id = self.get_stream_frame_id(stream_index, frame_id)
+            if stream_frame_id is not None:
+                self.scheduler.seek(stream_index, stream_frame_id)
+
+    def read(self, frame_id: int, timeout: float = 0.0):
+        """
+        Composite the frames of all the videos at a frame of the timeline.
+        :param frame_id: the frame of the timeline.
+        :param timeout: the maximum time to wait for all the videos together, 0 to keep the previous frame of the
+            videos that are not decoded yet (during playback).
+        :return: the composited BGR buffer, it is reused by the next read.
+        """
+        self.current_frame_id = int(frame_id)
+        # The videos that are over keep their last frame, the ones already showing their frame are skipped
+        stream_frame_ids = {}
+        for stream_index in range(len(self.video_players)):
+            stream_frame_id = self.get_stream_frame_id(stream_index, frame_id)
+            if stream_frame_id is not None and stream_frame_id != self.shown_frame_ids[stream_index]:
+                stream_frame_ids[stream_index] = stream_frame_id
+        if not stream_frame_ids:
+            return self.compositor.buffer
+
+        frames = self.scheduler.get_many(stream_frame_ids, timeout)
+        for stream_index, frame in frames.items():
+            if frame is None:
+                self.stale_frames += 1
+                continue
+            self.compositor.update(stream_index, frame)
+            self.shown_frame_ids[stream_index] = stream_frame_ids[stream_index]
+        return self.compositor.buffer
+
+    def is_complete(self, frame_id: int) -> bool:
+        """
+        Whether all the videos show their frame at a frame of the timeline, or are already over.
+        """
+        for stream_index, shown_frame_id in enumerate(self.shown_frame_ids):
+            stream_frame_id = self.get_stream_frame_id(stream_index, frame_id)
+            if stream_frame_id is not None and stream_frame_id != shown_frame_id:
+                return False
+        return True
+
+    def get_stats(self) -> dict:
+        return {**self.scheduler.get_stats(), 'stale_frames': self.stale_frames}
+
+    def close(self) -> None:
+        self.scheduler.close()
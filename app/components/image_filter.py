@@ -1,71 +1,294 @@
-import cv2
-from ultralytics import YOLO
+import threading
+import time
+
+from app.components.detection_store import DetectionStore
+from app.components.detection_worker import DetectionWorker, Detections
+from app.components.filter_pipeline import BGR, FILTER_REGISTRY, FilterContext, FilterPipeline
+from app.components.motion_gate import (FULL, MOTION_GATING_PRESETS, REGION, SKIP, MotionGate,
+                                        merge_region_detections, reuse_detections)
+
+FILTER_LIST = list(FILTER_REGISTRY)
+# Labels of the filters in the Filter menu of the GUI
+FILTER_LABELS = [stage_class.label for stage_class in FILTER_REGISTRY.values()]
+# Weights of the pretrained YOLO model, and minimum confidence of the detections
+MODEL_WEIGHTS = "../../models/yolov8n.pt"
+CONFIDENCE_THRESHOLD = 0.25
+# Time to wait for the detection worker when the exact detections of the frame are needed, in seconds
+DETECTION_TIMEOUT = 2.0
+# Maximum distance in frames between the displayed frame and the detections overlaid during playback
+MAX_DETECTION_AGE = 15
 
-FILTER_LIST = ['gray', 'object_detection']
 
 class ImageFilter:
     def __init__(self, image=None):
         self.image = image
         self.filtered_image = None
-        self.model = YOLO("../../models/yolov8n.pt")  # Pretrained YOLO model
+        # The pretrained YOLO model is only loaded on the first object detection, see the model property
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Image filter whose model is run instead of loading another one, see share_model
+        self._model_owner: ImageFilter | None = None
+        # The model is shared by the detection worker and the detection timeline, it runs one batch at a time
+        self._predict_lock = threading.Lock()
+        self.model_load_time: float = 0.0
+        self.confidence: float = CONFIDENCE_THRESHOLD
         self.filter_type: str = 'gray'
+        self.pipeline: FilterPipeline = FilterPipeline([self.filter_type])
+        # Format of the filtered images, None to keep the format of the last stage (e.g. gray)
+        self.output_format: str | None = BGR
+        self.detection_worker: DetectionWorker | None = None
+        # Detections drawn on the last filtered image
+        self.detections: Detections | None = None
+        # Skip the detection of the frames that barely changed since the last detected one
+        self.motion_gating: str = 'Off'
+        self.motion_gate: MotionGate = MotionGate(MOTION_GATING_PRESETS[self.motion_gating])
+        # Last detections computed, and reused by the motion gate
+        self.last_detections: Detections | None = None
+        # Detections already computed on the current video, persisted across sessions in source coordinates
+        self.detection_store: DetectionStore | None = None
+        # Factors mapping the coordinates of the filtered images to the source frames
+        self.source_scale: tuple = (1.0, 1.0)
+
+    @property
+    def model(self):
+        """
+        Pretrained YOLO model, loaded on first use.
+
+        Ultralytics and torch are only imported here, so the other filters never pay for them.
+        """
+        if self._model_owner is not None:
+            return self._model_owner.model
+        with self._model_lock:
+            if self._model is None:
+                start = time.perf_counter()
+                from ultralytics import YOLO
+                self._model = YOLO(MODEL_WEIGHTS)
+                self.model_load_time = time.perf_counter() - start
+        return self._model
+
+    @property
+    def is_model_loaded(self) -> bool:
+        if self._model_owner is not None:
+            return self._model_owner.is_model_loaded
+        return self._model is not None
+
+    def share_model(self, image_filter: 'ImageFilter') -> None:
+        """
+        Run the model of another image filter instead of loading a second one, e.g. for an export next to the GUI.
+
+        The batches of both filters go through the predict lock of the other filter, one at a time.
+        :param image_filter: the image filter owning the model.
+        :return:
+        """
+        self._model_owner = image_filter
+        self.confidence = image_filter.confidence
+
+    def warm_up_model(self):
+        """
+        Load the model in a background thread, so the first object detection does not wait for it.
+        :return: the loading thread.
+        """
+        thread = threading.Thread(target=lambda: self.model, name='model-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def predict(self, images, **kwargs):
+        """
+        Run the model on a batch of images, the model is loaded if necessary.
+        """
+        if self._model_owner is not None:
+            return self._model_owner.predict(images, **kwargs)
+        model = self.model
+        with self._predict_lock:
+            return model(images, **kwargs)
+
+    def detect(self, images: list) -> list:
+        """
+        Run the model on a batch of images, e.g. for the detection timeline.
+        :param images: the BGR images.
+        :return: the Detections of each image, their frame id is 0.
+        """
+        results = self.predict(images, conf=self.confidence, verbose=False)
+        return [Detections.from_result(0, result) for result in results]
 
     def set_filter_type(self, filter_type):
-        self.filter_type = filter_type
+        self.set_filter_types([filter_type])
 
-    def update_filtered_image(self, image):
-        self.image = image
-        self.filtered_image = self.image.copy()
+    def set_filter_types(self, filter_types: list):
+        """
+        Chain several filters, applied in the given order.
+        :param filter_types: the names of the filters, from FILTER_LIST.
+        :return:
+        """
+        self.pipeline = FilterPipeline(filter_types)
+        self.filter_type = filter_types[-1] if filter_types else ''
 
-        if self.filter_type == 'gray':
-            self.filtered_image = self.gray_filter()
-        elif self.filter_type == 'object_detection':
-            self.filtered_image = self.object_detection_filter()
-        elif self.filter_type == 'detect_edges':
-            self.filtered_image = self.detect_edges()
+    def start_detection_worker(self, batch_size: int = 4, skip_policy: str = 'keep_latest'):
+        """
+        Run the object detection in a background thread, on batches of consecutive frames.
+        :param batch_size: the number of frames per model call.
+        :param skip_policy: the policy applied when the inference lags behind, see SKIP_POLICIES.
+        :return:
+        """
+        self.stop_detection_worker()
+        self.detection_worker = DetectionWorker(self.predict, batch_size=batch_size, skip_policy=skip_policy,
+                                                confidence=self.confidence, on_detections=self.store_detections)
 
-        return self.filtered_image
+    def stop_detection_worker(self):
+        if self.detection_worker is not None:
+            self.detection_worker.stop()
+            self.detection_worker = None
 
-    def gray_filter(self):
-        gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
-        gray_bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)  # Convert to 3-channel BGR
-        self.filtered_image = gray_bgr
+    def set_video(self, filename: str, source_scale: tuple = (1.0, 1.0)):
+        """
+        Open the detection store of a new video, and forget the in-memory detections of the previous one.
+        :param filename: the video filepath.
+        :param source_scale: the factors mapping the coordinates of the processed frames to the source frames.
+        :return:
+        """
+        # Clear the worker first: a batch of the previous video still running is never stored under the new one
+        if self.detection_worker is not None:
+            self.detection_worker.clear()
+        self.source_scale = source_scale
+        self.last_detections = None
+        self.motion_gate.reset()
+        if self.detection_store is not None:
+            self.detection_store.flush()
+
+        self.detection_store = DetectionStore.open(filename, MODEL_WEIGHTS, self.confidence)
+
+    def store_detections(self, detections: list):
+        if self.detection_store is not None:
+            for frame_detections in detections:
+                self.detection_store.put(frame_detections.scaled(*self.source_scale))
+
+    def close(self):
+        """
+        Stop the detection worker and write the pending detections to disk.
+        """
+        self.stop_detection_worker()
+        if self.detection_store is not None:
+            self.detection_store.flush()
+
+    def update_filtered_image(self, image, frame_id: int = None, wait_for_detections: bool = True):
+        """
+        Apply the selected filters to the image.
+        :param image: the BGR image, it is not modified.
+        :param frame_id: the id of the frame, required to run the object detection in the background.
+        :param wait_for_detections: whether to wait for the detections of this exact frame,
+            or to overlay the most recent detections available (during playback).
+        :return: the filtered image.
+        """
+        self.image = image
+        self.detections = None
+
+        context = FilterContext(image, frame_id, self, wait_for_detections)
+        self.filtered_image = self.pipeline.run(image, context, self.output_format)
         return self.filtered_image
 
+    def filter_source_image(self, source_image, frame_id: int = None):
+        """
+        Apply the current filters to the frame at the source size, e.g. to save it.
 
-    def object_detection_filter(self):
-        result = self.model(self.image, verbose=False)[0]
-        self.filtered_image = self.image.copy()
+        The detections of the last filtered image are mapped back to the source coordinates, or read from the
+        detection store, instead of running the model again: the model may be in use by the detection worker,
+        and it would run on the processing-size image. Without detections, no box is drawn.
+        :param source_image: the BGR frame at the source size.
+        :param frame_id: the id of the frame, to look up its stored detections.
+        :return: the filtered frame at the source size.
+        """
+        displayed_detections = self.detections
+        if displayed_detections is not None:
+            detections = displayed_detections.scaled(*self.source_scale)
+        else:
+            detections = self.detection_store.get(frame_id) \
+                if self.detection_store is not None and frame_id is not None else None
+            if detections is None:
+                detections = Detections(frame_id)
+        context = FilterContext(source_image, frame_id, self, detections=detections)
 
-        # Assuming result is the output from the YOLO model
-        # Extract boxes, classes, and confidence scores
-        boxes = result.boxes.xyxy.cpu().numpy()  # Bounding box coordinates [x1, y1, x2, y2]
-        classes = result.boxes.cls.cpu().numpy().astype(int)  # Class indices
-        confidences = result.boxes.conf.cpu().numpy()  # Confidence scores
+        source_filtered_image = self.pipeline.run(source_image, context, BGR)
+        # Running the pipeline sets the detections, keep the ones of the displayed frame
+        self.detections = displayed_detections
+        return source_filtered_image
 
-        # Draw bounding boxes
-        for i in range(len(boxes)):
-            x1, y1, x2, y2 = boxes[i]  # Get coordinates
-            class_id = classes[i]  # Get class ID
-            confidence = confidences[i]  # Get confidence score
+    def get_stage_timings(self) -> dict:
+        """
+        Get the mean time per call of each stage of the pipeline, in milliseconds.
+        """
+        return self.pipeline.get_timings()
 
-            label = f"{result.names[class_id]}: {confidence:.2f}"  # Class label and confidence
-            color = (0, 255, 0)  # Green color for bounding box
+    def get_detections(self, frame_id: int = None, wait_for_detections: bool = True):
+        """
+        Get the detections of the model on the current image.
 
-            # Draw bounding box and label
-            cv2.rectangle(self.filtered_image, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)  # Bounding box
-            cv2.putText(self.filtered_image, label, (int(x1) + 5, int(y2) - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)  # Label
+        The detections stored for this video are reused without calling the model.
+        With motion gating, a frame close to the last detected one reuses its detections, and a frame that only
+        changed in a small region is only detected on that region.
+        Without the detection worker or a frame id, the model runs on the calling thread.
+        :param frame_id: the id of the frame.
+        :param wait_for_detections: whether to wait for the detections of this exact frame.
+        :return: the detections, or None if no recent enough detections are available yet.
+        """
+        if self.detection_store is not None and frame_id is not None:
+            detections = self.detection_store.get(frame_id)
+            if detections is not None:
+                detections = detections.scaled(1 / self.source_scale[0], 1 / self.source_scale[1])
+                self.set_last_detections(detections)
+                return detections
 
-        return self.filtered_image
+        decision, region = self.motion_gate.check(self.image) if self.last_detections is not None else (FULL, None)
+        if decision == SKIP:
+            return reuse_detections(self.last_detections, frame_id)
+
+        if self.detection_worker is None or frame_id is None:
+            if decision == REGION:
+                x1, y1, x2, y2 = region
+                result = self.predict(self.image[y1:y2, x1:x2], conf=self.confidence, verbose=False)[0]
+                detections = merge_region_detections(self.last_detections, Detections.from_result(frame_id, result),
+                                                     region)
+            else:
+                result = self.predict(self.image, conf=self.confidence, verbose=False)[0]
+                detections = Detections.from_result(frame_id, result)
+                # Only the detections of whole frames are stored
+                if frame_id is not None:
+                    self.store_detections([detections])
+            self.set_last_detections(detections)
+            return detections
+
+        # The worker batches whole frames, the regions are only used on the calling thread
+        self.motion_gate.remember(frame_id, self.image)
+        self.detection_worker.submit(frame_id, self.image)
+        if wait_for_detections:
+            detections = self.detection_worker.get(frame_id, timeout=DETECTION_TIMEOUT)
+        else:
+            detections = self.detection_worker.get_latest(frame_id, max_age=MAX_DETECTION_AGE)
+        if detections is None:
+            return None
+
+        if detections.frame_id == frame_id:
+            self.set_last_detections(detections)
+        elif self.motion_gate.set_reference_frame(detections.frame_id):
+            # Older detections during playback: the gate compares the next frames to the frame they were made on
+            self.last_detections = detections
+        return detections
+
+    def set_last_detections(self, detections: Detections):
+        # The current image becomes the reference of the motion gate
+        self.last_detections = detections
+        self.motion_gate.set_reference(self.image)
+
+    def set_motion_gating(self, preset: str):
+        """
+        Set the trade-off between accuracy and speed of the object detection.
+        :param preset: the gating preset, from MOTION_GATING_PRESETS.
+        :return:
+        """
+        if preset not in MOTION_GATING_PRESETS:
+            raise ValueError(f"Invalid motion gating. Supported presets are: {', '.join(MOTION_GATING_PRESETS)}")
+        self.motion_gating = preset
+        self.motion_gate.threshold = MOTION_GATING_PRESETS[preset]
+        self.motion_gate.reset()
 
-    def detect_edges(self):
-        print('Detecting edges')
-        # current_image = self.image.copy()
-        #
-        # # Convert to grayscale
-        # gray_image = cv2.cvtColor(current_image, cv2.COLOR_BGR2GRAY)
-        #
-        # # Perform Canny Edge Detection
-        # self.filtered_image = cv2.Canny(gray_image, threshold1=0, threshold2=150)
-        #
-        return self.image
\ No newline at end of file
+    def get_motion_gate_stats(self) -> dict:
+        return self.motion_gate.get_stats()
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from typing import Optional
+
+import cv2
+
+# Folder of the cached indexes, in the user cache so the videos can live in read-only archives
+KEYFRAME_INDEX_ROOT = os.path.join(os.path.expanduser('~'), '.cache', 'enacuity', 'keyframes')
+# Extension of the cached index files
+SIDECAR_EXTENSION = '.keyframes.json'
+# Maximum number of cached index files, the least recently used ones are removed
+KEYFRAME_INDEX_MAX_FILES = 1024
+
+
+def get_sidecar_filename(filename: str, root: Optional[str] = None) -> str:
+    """
+    Get the file of the cached index of a video, named after the hash of its absolute path.
+    :param filename: the video filepath.
+    :param root: the folder of the cached indexes, KEYFRAME_INDEX_ROOT by default.
+    """
+    path_hash = hashlib.blake2b(os.path.abspath(filename).encode(), digest_size=16).hexdigest()
+    return os.path.join(root or KEYFRAME_INDEX_ROOT, path_hash + SIDECAR_EXTENSION)
+
+
+def prune_sidecars(folder: str, max_files: int) -> None:
+    """
+    Remove the least recently used sidecars of a folder, so it holds at most max_files of them.
+    :param folder: the folder of the cached indexes.
+    :param max_files: the maximum number of sidecars kept.
+    :return:
+    """
+    try:
+        entries = [entry for entry in os.scandir(folder) if entry.name.endswith(SIDECAR_EXTENSION)]
+    except OSError:
+        return
+    if len(entries) <= max_files:
+        return
+
+    entries.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def get_file_signature(filename: str) -> Optional[dict]:
+    """
+    Get the size and the modification time of a file, used to invalidate the cached sidecars.
+    :return: the signature, or None if the file cannot be read, which never matches a cached signature.
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class KeyframeIndex:
+    """
+    Index of the keyframes of a video file.
+
+    The index is built once per file by scanning the compressed packets without decoding them,
+    and can be cached in a sidecar file in the user cache, keyed by the size and mtime of the video.
+    """
+    def __init__(self, keyframes: list = None, keyframe_times: list = None, num_frames: int = 0):
+        # Sorted frame ids of the keyframes and their presentation time in milliseconds
+        self.keyframes: list = keyframes or []
+        self.keyframe_times: list = keyframe_times or []
+        self.num_frames: int = num_frames
+
+    def __len__(self):
+        return len(self.keyframes)
+
+    @classmethod
+    def build(cls, filename: str) -> 'KeyframeIndex':
+        """
+        Build the index by reading the raw packets of the video file.
+
+        The packets are only demuxed (grab without retrieve, raw format), so no frame is decoded.
+        :param filename: the video filepath.
+        :return: the keyframe index.
+        """
+        capture = cv2.VideoCapture(filename, cv2.CAP_FFMPEG, [cv2.CAP_PROP_FORMAT, -1])
+        keyframes, keyframe_times = [], []
+        num_frames = 0
+
+        while capture.grab():
+            if capture.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(num_frames)
+                keyframe_times.append(capture.get(cv2.CAP_PROP_POS_MSEC))
+            num_frames += 1
+
+        capture.release()
+        return cls(keyframes, keyframe_times, num_frames)
+
+    @classmethod
+    def load(cls, filename: str) -> Optional['KeyframeIndex']:
+        """
+        Load the index from the sidecar of the video file.
+        :param filename: the video filepath.
+        :return: the keyframe index, or None if there is no valid sidecar for the current video file.
+        """
+        sidecar_filename = get_sidecar_filename(filename)
+        try:
+            with open(sidecar_filename) as sidecar:
+                content = json.load(sidecar)
+        except (OSError, ValueError):
+            return None
+
+        # The sidecar is stale if the video changed since it was written
+        signature = get_file_signature(filename)
+        if signature is None or content.get('signature') != signature:
+            return None
+
+        # The mtime of the sidecar marks its last use, for the pruning of the cache folder
+        try:
+            os.utime(sidecar_filename)
+        except OSError:
+            pass
+        return cls(content['keyframes'], content['keyframe_times'], content['num_frames'])
+
+    def save(self, filename: str) -> None:
+        """
+        Write the index to the sidecar of the video file.
+
+        The sidecar is optional: the error is ignored if the cache folder cannot be written.
+        :param filename: the video filepath.
+        :return:
+        """
+        signature = get_file_signature(filename)
+        if signature is None:
+            return
+        content = {'signature': signature,
+                   'keyframes': self.keyframes,
+                   'keyframe_times': self.keyframe_times,
+                   'num_frames': self.num_frames}
+
+        # Write a temporary file first, so the batch workers never read a half-written sidecar
+        sidecar_filename = get_sidecar_filename(filename)
+        temporary_filename = f'{sidecar_filename}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(sidecar_filename), exist_ok=True)
+            with open(temporary_filename, 'w') as sidecar:
+                json.dump(content, sidecar)
+            os.replace(temporary_filename, sidecar_filename)
+        except OSError:
+            return
+        prune_sidecars(os.path.dirname(sidecar_filename), KEYFRAME_INDEX_MAX_FILES)
+
+    @classmethod
+    def load_or_build(cls, filename: str, use_sidecar: bool = True) -> 'KeyframeIndex':
+        """
+        Load the index from the sidecar if it is up-to-date, build it otherwise.
+        :param filename: the video filepath.
+        :param use_sidecar: whether to read and write the cached sidecar.
+        :return: the keyframe index.
+        """
+        if use_sidecar:
+            index = cls.load(filename)
+            if index is not None:
+                return index
+
+        index = cls.build(filename)
+        if use_sidecar:
+            index.save(filename)
+        return index
+
+    def nearest_keyframe(self, frame_id: int) -> Optional[int]:
+        """
+        Get the closest keyframe at or before the given frame id.
+        :param frame_id: the target frame id.
+        :return: the keyframe id, or None if the index is empty.
+        """
+        position = bisect_right(self.keyframes, frame_id)
+        if position == 0:
+            return None
+        return self.keyframes[position - 1]
+
+
+def seek_capture(capture: cv2.VideoCapture, position: int, frame_id: int,
+                 keyframe_index: Optional[KeyframeIndex] = None) -> int:
+    """
+    Move the capture so that the next read returns the given frame.
+
+    The capture jumps to the nearest keyframe and only grabs (without color conversion) the remaining frames.
+    If the target is ahead of the current position in the same group of pictures, the capture is not seeked at all.
+    :param capture: the video capture.
+    :param position: the id of the next frame the capture would read.
+    :param frame_id: the id of the frame to read next.
+    :param keyframe_index: the keyframe index of the video, None to rely on the OpenCV seek.
+    :return: the new position of the capture.
+    """
+    keyframe = keyframe_index.nearest_keyframe(frame_id) if keyframe_index else None
+
+    if keyframe is None:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+        return frame_id
+
+    if not keyframe <= position <= frame_id:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        position = keyframe
+
+    # Decode forward, without retrieving the frames, up to the target
+    while position < frame_id and capture.grab():
+        position += 1
+
+    return position
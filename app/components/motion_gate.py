@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.detection_worker import Detections
+
+# Gating presets of the Filter menu: mean absolute difference (gray levels) below which the previous detections
+# are reused. None runs the detector on every frame
+MOTION_GATING_PRESETS = OrderedDict([('Off', None), ('Low', 1.0), ('Medium', 2.5), ('High', 5.0)])
+# Size of the gray thumbnails compared, and size of the cells of the changed region
+MOTION_GATE_SIZE = (64, 36)
+MOTION_GATE_CELL_THRESHOLD = 12
+# Maximum number of consecutive reuses, so the detections never drift for long
+MOTION_GATE_MAX_SKIPS = 30
+# Number of thumbnails of the frames sent to the detection worker kept, to use the frame of late detections
+# as the reference
+MOTION_GATE_HISTORY = 64
+# The detector only runs on the changed region if it covers at most this fraction of the frame,
+# padded by this fraction of the frame size on each side
+ROI_MAX_AREA = 0.25
+ROI_PADDING = 0.05
+
+# Gating decisions
+SKIP = 'skip'
+REGION = 'region'
+FULL = 'full'
+
+
+class MotionGate:
+    """
+    Decide whether a frame needs a new detection, from a cheap difference with the last detected frame.
+
+    The frames are compared as small gray thumbnails. A frame close enough to the reference reuses its
+    detections, a frame that only changed in a small region is detected on that region only, any other frame
+    gets a full detection and becomes the new reference.
+    """
+    def __init__(self, threshold: Optional[float] = None, use_regions: bool = True):
+        """
+        :param threshold: the mean absolute difference below which a frame is skipped, None to never skip.
+        :param use_regions: whether to only detect the changed region when the change is localized.
+        """
+        self.threshold: float | None = threshold
+        self.use_regions: bool = use_regions
+
+        self._reference: np.ndarray | None = None
+        self._thumbnail = np.empty((MOTION_GATE_SIZE[1], MOTION_GATE_SIZE[0]), np.uint8)
+        self._difference = np.empty_like(self._thumbnail)
+        self.consecutive_skips: int = 0
+        # Thumbnails of the frames whose detections are pending, by frame id
+        self._history: OrderedDict = OrderedDict()
+
+        self.frames: int = 0
+        self.skipped_frames: int = 0
+        self.region_frames: int = 0
+
+    def reset(self) -> None:
+        self._reference = None
+        self.consecutive_skips = 0
+        self._history.clear()
+
+    def check(self, image) -> tuple:
+        """
+        Compare a frame to the reference.
+        :param image: the BGR or gray frame.
+        :return: the decision (SKIP, REGION or FULL) and the changed region (x1, y1, x2, y2) in image coordinates.
+        """
+        self.frames += 1
+        if self.threshold is None or self._reference is None or self.consecutive_skips >= MOTION_GATE_MAX_SKIPS:
+            return FULL, None
+
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        cv2.resize(gray, MOTION_GATE_SIZE, dst=self._thumbnail, interpolation=cv2.INTER_AREA)
+        cv2.absdiff(self._thumbnail, self._reference, dst=self._difference)
+
+        if cv2.mean(self._difference)[0] < self.threshold:
+            self.consecutive_skips += 1
+            self.skipped_frames += 1
+            return SKIP, None
+
+        if self.use_regions:
+            region = self._get_changed_region(image.shape)
+            if region is not None:
+                self.region_frames += 1
+                return REGION, region
+        return FULL, None
+
+    def _get_changed_region(self, image_shape: tuple) -> Optional[tuple]:
+        changed = cv2.threshold(self._difference, MOTION_GATE_CELL_THRESHOLD, 255, cv2.THRESH_BINARY)[1]
+        x, y, width, height = cv2.boundingRect(changed)
+        if width * height == 0 or width * height > ROI_MAX_AREA * changed.size:
+            return None
+
+        # Back to image coordinates, with some margin for the objects crossing the border of the region
+        image_height, image_width = image_shape[:2]
+        scale_x, scale_y = image_width / MOTION_GATE_SIZE[0], image_height / MOTION_GATE_SIZE[1]
+        padding_x, padding_y = ROI_PADDING * image_width, ROI_PADDING * image_height
+        return (int(max(x * scale_x - padding_x, 0)), int(max(y * scale_y - padding_y, 0)),
+                int(min((x + width) * scale_x + padding_x, image_width)),
+                int(min((y + height) * scale_y + padding_y, image_height)))
+
+    def set_reference(self, image) -> None:
+        """
+        Use a frame as the reference, once it was detected.
+        """
+        self._reference = get_thumbnail(image)
+        self.consecutive_skips = 0
+
+    def remember(self, frame_id: int, image) -> None:
+        """
+        Keep the thumbnail of a frame whose detections arrive later, e.g. from the detection worker.
+        :param frame_id: the id of the frame.
+        :param image: the BGR or gray frame.
+        :return:
+        """
+        if self.threshold is None:
+            return
+        self._history[frame_id] = get_thumbnail(image)
+        self._history.move_to_end(frame_id)
+        while len(self._history) > MOTION_GATE_HISTORY:
+            self._history.popitem(last=False)
+
+    def set_reference_frame(self, frame_id: int) -> bool:
+        """
+        Use a remembered frame as the reference, once its detections arrived.
+        :param frame_id: the id of the detected frame.
+        :return: whether the thumbnail of the frame was remembered.
+        """
+        thumbnail = self._history.get(frame_id)
+        if thumbnail is None:
+            return False
+        self._reference = thumbnail
+        self.consecutive_skips = 0
+        return True
+
+    def get_stats(self) -> dict:
+        """
+        Get the fraction of the frames whose detection was skipped, or only run on a region.
+        """
+        return {'frames': self.frames,
+                'skipped_frames': self.skipped_frames,
+                'region_frames': self.region_frames,
+                'skip_rate': self.skipped_frames / self.frames if self.frames else 0.0,
+                'region_rate': self.region_frames / self.frames if self.frames else 0.0}
+
+
+def get_thumbnail(image) -> np.ndarray:
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, MOTION_GATE_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def reuse_detections(detections: Detections, frame_id: int) -> Detections:
+    """
+    Get the detections of a previous frame, tagged with the id of the current one.
+    """
+    return Detections(frame_id, detections.boxes, detections.classes, detections.confidences, detections.names)
+
+
+def merge_region_detections(previous: Optional[Detections], region_detections: Detections,
+                            region: tuple) -> Detections:
+    """
+    Combine the detections of a region with the previous detections outside of it.
+    :param previous: the detections of the reference frame, None if there are none.
+    :param region_detections: the detections of the crop of the region, in crop coordinates.
+    :param region: the (x1, y1, x2, y2) region, in image coordinates.
+    :return: the detections of the whole frame.
+    """
+    x1, y1, x2, y2 = region
+    boxes = region_detections.boxes + np.array([x1, y1, x1, y1], np.float32)
+    classes, confidences = region_detections.classes, region_detections.confidences
+    names = dict(region_detections.names)
+
+    if previous is not None and len(previous):
+        # Keep the previous boxes centered outside of the region
+        centers_x = (previous.boxes[:, 0] + previous.boxes[:, 2]) / 2
+        centers_y = (previous.boxes[:, 1] + previous.boxes[:, 3]) / 2
+        outside = ~((centers_x >= x1) & (centers_x < x2) & (centers_y >= y1) & (centers_y < y2))
+        boxes = np.concatenate([previous.boxes[outside], boxes])
+        classes = np.concatenate([previous.classes[outside], classes])
+        confidences = np.concatenate([previous.confidences[outside], confidences])
+        names = {**previous.names, **names}
+
+    return Detections(region_detections.frame_id, boxes, classes, confidences, names)
@@ -0,0 +1,84 @@
+import time
+
+
+class PlaybackClock:
+    """
+    Real-time playback clock.
+
+    The frame to show is computed from the time elapsed since the playback started, on a monotonic clock,
+    instead of showing one frame per GUI timeout: the time spent decoding, filtering and displaying a frame
+    does not slow the playback down. The frames whose time has passed are dropped, i.e. never decoded or filtered.
+    """
+    def __init__(self, fps: float, clock=time.monotonic):
+        """
+        :param fps: the frame rate of the video.
+        :param clock: the function returning the current time in seconds, monotonic.
+        """
+        self.fps: float = fps if fps > 0 else 1.0
+        self.clock = clock
+
+        # Time and frame the current playback run started from
+        self.start_time: float = 0.0
+        self.start_frame_id: int = 0
+        self.is_running: bool = False
+        self.last_frame_id: int | None = None
+
+        # Counters over all the playback runs
+        self.displayed_frames: int = 0
+        self.dropped_frames: int = 0
+        self.playing_time: float = 0.0
+
+    def start(self, frame_id: int) -> None:
+        """
+        Start, or restart after a seek, the playback from a frame.
+        :param frame_id: the id of the first frame to show.
+        :return:
+        """
+        if self.is_running:
+            self.playing_time += self.clock() - self.start_time
+        self.start_time = self.clock()
+        self.start_frame_id = frame_id
+        self.last_frame_id = None
+        self.is_running = True
+
+    def stop(self) -> None:
+        if self.is_running:
+            self.playing_time += self.clock() - self.start_time
+            self.is_running = False
+
+    def get_target_frame_id(self) -> int:
+        """
+        Get the id of the frame that should be shown now.
+        """
+        return self.start_frame_id + int((self.clock() - self.start_time) * self.fps)
+
+    def get_time_to_frame(self, frame_id: int) -> float:
+        """
+        Get the time left before a frame should be shown, in seconds, 0 if it is already late.
+        """
+        frame_time = self.start_time + (frame_id - self.start_frame_id) / self.fps
+        return max(frame_time - self.clock(), 0.0)
+
+    def record_frame(self, frame_id: int) -> None:
+        """
+        Count a shown frame, and the frames skipped since the previous one.
+        :param frame_id: the id of the shown frame.
+        :return:
+        """
+        previous_frame_id = self.last_frame_id if self.last_frame_id is not None else self.start_frame_id - 1
+        self.dropped_frames += max(frame_id - previous_frame_id - 1, 0)
+        self.displayed_frames += 1
+        self.last_frame_id = frame_id
+
+    def get_stats(self) -> dict:
+        """
+        Get the frame rate achieved over the playback, and the number of shown and dropped frames.
+        """
+        playing_time = self.playing_time
+        if self.is_running:
+            playing_time += self.clock() - self.start_time
+
+        return {'target_fps': self.fps,
+                'achieved_fps': self.displayed_frames / playing_time if playing_time > 0 else 0.0,
+                'displayed_frames': self.displayed_frames,
+                'dropped_frames': self.dropped_frames}
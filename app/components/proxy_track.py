@@ -0,0 +1,215 @@
+import json
+import math
+import os
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.components.frame_display import fit_size
+from app.components.keyframe_index import KeyframeIndex, get_file_signature
+
+# Extensions of the thumbnails and of their metadata, written next to the video file
+PROXY_EXTENSION = '.proxy.npy'
+PROXY_METADATA_EXTENSION = '.proxy.json'
+# Maximum size of the thumbnails, and number of frames per thumbnail
+PROXY_SIZE = (160, 90)
+PROXY_STEP = 4
+# Maximum number of keyframes decoded by the coarse pass, spread over the video
+PROXY_COARSE_THUMBNAILS = 64
+# Number of thumbnails built between two writes of the metadata
+PROXY_FLUSH_EVERY = 64
+
+
+def get_proxy_filenames(filename: str) -> tuple:
+    return filename + PROXY_EXTENSION, filename + PROXY_METADATA_EXTENSION
+
+
+class ProxyTrack:
+    """
+    Low-resolution thumbnails of a video, shown instantly while the slider is dragged.
+
+    One thumbnail is kept every `step` frames, in a memory-mapped array written next to the video file.
+    The thumbnails are built in the background: the keyframes first, since they are decoded without the rest
+    of their group of pictures, so a coarse preview of the whole video is available almost at once,
+    then all the other slots in one sequential pass. A partly built proxy is usable, the nearest built thumbnail
+    is returned, and the build resumes where it stopped when the video is opened again.
+    """
+    def __init__(self, filename: str, num_frames: int, frame_size: tuple,
+                 keyframe_index: Optional[KeyframeIndex] = None, step: int = PROXY_STEP,
+                 size: tuple = PROXY_SIZE, use_sidecar: bool = True, open_decoder=None):
+        """
+        :param filename: the video filepath.
+        :param num_frames: the number of frames of the video.
+        :param frame_size: the (width, height) of the source frames.
+        :param keyframe_index: the keyframes of the video, built first when available.
+        :param step: the number of frames per thumbnail.
+        :param size: the maximum (width, height) of the thumbnails.
+        :param use_sidecar: whether to keep the thumbnails on disk, next to the video file.
+        :param open_decoder: opens the BGR decoder of the build, a cv2.VideoCapture by default.
+        """
+        self.filename: str = filename
+        self.keyframe_index: KeyframeIndex | None = keyframe_index
+        self.step: int = step
+        self.use_sidecar: bool = use_sidecar
+        self.open_decoder = open_decoder or (lambda: cv2.VideoCapture(self.filename))
+        if frame_size[0] > 0 and frame_size[1] > 0:
+            self.width, self.height = fit_size(frame_size, size)
+            self.num_slots: int = max(math.ceil(num_frames / step), 0)
+        else:
+            # The size of the frames is unknown, e.g. the video could not be probed: there is nothing to build
+            self.width, self.height = size
+            self.num_slots = 0
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.capture: cv2.VideoCapture | None = None
+
+        # Thumbnails, and id of the frame each slot holds (-1 if not built yet)
+        self.thumbnails: np.ndarray | None = None
+        self.frame_ids: np.ndarray | None = None
+        self.built_slots: int = 0
+        self._open()
+
+    def _open(self) -> None:
+        shape = (self.num_slots, self.height, self.width, 3)
+        if not self.use_sidecar or self.num_slots == 0:
+            self.thumbnails = np.zeros(shape, np.uint8)
+            self.frame_ids = np.full(self.num_slots, -1, np.int64)
+            return
+
+        proxy_filename, metadata_filename = get_proxy_filenames(self.filename)
+        metadata = self._load_metadata(metadata_filename)
+        try:
+            if metadata is not None and os.path.exists(proxy_filename):
+                # Resume the build of the previous session
+                self.thumbnails = np.load(proxy_filename, mmap_mode='r+')
+                self.frame_ids = np.array(metadata['frame_ids'], np.int64)
+            else:
+                self.thumbnails = np.lib.format.open_memmap(proxy_filename, mode='w+', dtype=np.uint8, shape=shape)
+                self.frame_ids = np.full(self.num_slots, -1, np.int64)
+        except (OSError, ValueError):
+            # The folder of the video is not writable: keep the thumbnails in memory
+            self.use_sidecar = False
+            self._open()
+            return
+        self.built_slots = int(np.count_nonzero(self.frame_ids >= 0))
+
+    def _load_metadata(self, metadata_filename: str) -> Optional[dict]:
+        try:
+            with open(metadata_filename) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (OSError, ValueError):
+            return None
+
+        # The proxy is stale if the video or the proxy settings changed
+        expected = {'signature': get_file_signature(self.filename), 'step': self.step,
+                    'size': [self.width, self.height]}
+        if expected['signature'] is None or any(metadata.get(key) != value for key, value in expected.items()) \
+                or len(metadata.get('frame_ids', [])) != self.num_slots:
+            return None
+        return metadata
+
+    def flush(self) -> None:
+        """
+        Write the built thumbnails and their frame ids to disk.
+        """
+        if not self.use_sidecar:
+            return
+
+        with self._lock:
+            frame_ids = self.frame_ids.tolist()
+        self.thumbnails.flush()
+        metadata = {'signature': get_file_signature(self.filename), 'step': self.step,
+                    'size': [self.width, self.height], 'frame_ids': frame_ids}
+        try:
+            with open(get_proxy_filenames(self.filename)[1], 'w') as metadata_file:
+                json.dump(metadata, metadata_file)
+        except OSError:
+            pass
+
+    @property
+    def progress(self) -> float:
+        return self.built_slots / self.num_slots if self.num_slots else 1.0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.built_slots >= self.num_slots
+
+    def get(self, frame_id: int):
+        """
+        Get the thumbnail closest to a frame.
+        :param frame_id: the id of the frame.
+        :return: the thumbnail, or None if none is built yet.
+        """
+        if self.built_slots == 0:
+            return None
+
+        slot = min(max(int(frame_id) // self.step, 0), self.num_slots - 1)
+        with self._lock:
+            if self.frame_ids[slot] < 0:
+                built = np.flatnonzero(self.frame_ids >= 0)
+                slot = built[np.abs(built - slot).argmin()]
+            return self.thumbnails[slot].copy()
+
+    def start(self) -> None:
+        """
+        Build the missing thumbnails in a background thread.
+        """
+        if self.is_complete or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._build, name='proxy-track', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _build(self) -> None:
+        self.capture = self.open_decoder()
+
+        # Coarse pass: a few keyframes spread over the video, each is decoded on its own
+        keyframes = self.keyframe_index.keyframes if self.keyframe_index is not None else []
+        keyframes = keyframes[::max(len(keyframes) // PROXY_COARSE_THUMBNAILS, 1)]
+        for keyframe in keyframes:
+            if self._stop_event.is_set():
+                break
+            if keyframe // self.step >= self.num_slots or self.frame_ids[keyframe // self.step] >= 0:
+                continue
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            ret, frame = self.capture.read()
+            if ret:
+                self._store(keyframe, frame)
+
+        # Fine pass: one sequential decode from the first missing slot, only the frames of the missing slots
+        # are retrieved. The stream can hold more frames than the header counted, the pass stops at the last slot
+        missing_slots = np.flatnonzero(self.frame_ids < 0)
+        if not self._stop_event.is_set() and len(missing_slots):
+            frame_id = int(missing_slots[0]) * self.step
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+            while not self._stop_event.is_set() and not self.is_complete and frame_id < self.num_slots * self.step \
+                    and self.capture.grab():
+                if frame_id % self.step == 0 and self.frame_ids[frame_id // self.step] < 0:
+                    ret, frame = self.capture.retrieve()
+                    if ret:
+                        self._store(frame_id, frame)
+                frame_id += 1
+
+        self.capture.release()
+        self.flush()
+
+    def _store(self, frame_id: int, frame) -> None:
+        thumbnail = cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        with self._lock:
+            self.thumbnails[frame_id // self.step] = thumbnail
+            self.frame_ids[frame_id // self.step] = frame_id
+            self.built_slots += 1
+
+        if self.built_slots % PROXY_FLUSH_EVERY == 0:
+            self.flush()
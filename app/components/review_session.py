@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+import os
+import struct
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+
+from app.components.filter_pipeline import FilterPipeline
+from app.components.frame_display import DISPLAY_SIZE
+from app.components.image_filter import FILTER_LIST, ImageFilter
+from app.components.playback_clock import PlaybackClock
+from app.components.video_player import SUPPORTED_FORMATS, VideoPlayer
+
+# Quality of the JPEG frames streamed to the clients
+JPEG_QUALITY = 80
+# Number of encoded frames kept per video, shared by all the clients watching it
+ENCODED_CACHE_SIZE = 256
+# Maximum number of frames waiting to be sent to one client, the oldest ones are dropped for a slow client
+CLIENT_QUEUE_SIZE = 2
+# Header of the binary messages: the frame id as a big-endian int64, followed by the JPEG data
+FRAME_HEADER = struct.Struct('>q')
+
+logger = logging.getLogger(__name__)
+
+
+def pack_frame(frame_id: int, jpeg: bytes) -> bytes:
+    return FRAME_HEADER.pack(frame_id) + jpeg
+
+
+def unpack_frame(message: bytes) -> tuple:
+    """
+    Split a binary message of the server into the frame id and the JPEG data.
+    """
+    return FRAME_HEADER.unpack_from(message)[0], message[FRAME_HEADER.size:]
+
+
+class SharedVideo:
+    """
+    A video opened by the review server, shared by all the clients watching it.
+
+    The decoder, the model and the detection store are loaded once. The decoded frames are cached by the video
+    player and the encoded frames by filter, so a frame watched by several clients is only decoded, filtered and
+    encoded once. The decoder and the model are not thread-safe: the frames are rendered one at a time.
+    """
+    def __init__(self, filename: str, processing_size: Optional[tuple] = DISPLAY_SIZE,
+                 jpeg_quality: int = JPEG_QUALITY, cache_size: int = ENCODED_CACHE_SIZE):
+        """
+        :param filename: the video filepath.
+        :param processing_size: the (width, height) the frames are downscaled to, None for the source size.
+        :param jpeg_quality: the JPEG quality of the streamed frames.
+        :param cache_size: the number of encoded frames kept.
+        """
+        self.filename: str = filename
+        self.video_player: VideoPlayer = VideoPlayer(filename, processing_size=processing_size)
+        self.image_filter: ImageFilter = ImageFilter()
+        self.image_filter.set_video(filename, self.video_player.get_source_scale())
+        # One pipeline per filter combination, the stages keep state between frames (e.g. the smoothed edges)
+        self._pipelines: dict = {}
+        self.jpeg_quality: int = jpeg_quality
+
+        self._lock = threading.Lock()
+        self._encoded: OrderedDict = OrderedDict()
+        self.cache_size: int = cache_size
+        self.clients: int = 0
+        self.hits: int = 0
+        self.renders: int = 0
+
+    def get_metadata(self) -> dict:
+        return {'num_frames': self.video_player.num_frames, 'fps': self.video_player.fps,
+                'width': self.video_player.processing_size[0], 'height': self.video_player.processing_size[1],
+                'filters': FILTER_LIST}
+
+    def render(self, frame_id: int, filter_types: tuple = ()) -> Optional[bytes]:
+        """
+        Get a frame with filters applied, as JPEG data. Blocking, run it in a thread from the event loop.
+        :param frame_id: the id of the frame.
+        :param filter_types: the filters to apply, from FILTER_LIST.
+        :return: the JPEG data, or None if the frame cannot be decoded.
+        """
+        key = (frame_id, tuple(filter_types))
+        with self._lock:
+            jpeg = self._encoded.get(key)
+            if jpeg is not None:
+                self._encoded.move_to_end(key)
+                self.hits += 1
+                return jpeg
+
+            ret, frame = self.video_player.set_current_frame_from_frame_id(frame_id)
+            if not ret:
+                return None
+            if filter_types:
+                pipeline = self._pipelines.get(key[1])
+                if pipeline is None:
+                    pipeline = self._pipelines[key[1]] = FilterPipeline(list(filter_types))
+                self.image_filter.pipeline = pipeline
+                frame = self.image_filter.update_filtered_image(frame, frame_id)
+
+            jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])[1].tobytes()
+            self.renders += 1
+            self._encoded[key] = jpeg
+            while len(self._encoded) > self.cache_size:
+                self._encoded.popitem(last=False)
+            return jpeg
+
+    def get_stats(self) -> dict:
+        return {'clients': self.clients, 'renders': self.renders, 'cache_hits': self.hits,
+                'frame_cache': self.video_player.get_cache_stats()}
+
+    def close(self) -> None:
+        self.image_filter.close()
+
+
+class VideoRegistry:
+    """
+    The videos of a folder opened by the review server, shared by the clients and closed after the last one leaves.
+    """
+    def __init__(self, root: str, open_video=SharedVideo):
+        """
+        :param root: the folder of the videos, the clients cannot open files outside of it.
+        :param open_video: opens a SharedVideo from a filepath.
+        """
+        self.root: str = os.path.realpath(root)
+        self.open_video = open_video
+        self.videos: dict = {}
+        # Created in the event loop of the server, on the first client
+        self._lock: asyncio.Lock | None = None
+
+    def get_filename(self, name: str) -> str:
+        filename = os.path.realpath(os.path.join(self.root, name))
+        if (os.path.commonpath([filename, self.root]) != self.root or not os.path.isfile(filename)
+                or os.path.splitext(filename)[1].lower() not in SUPPORTED_FORMATS):
+            raise ValueError(f"Unknown video {name}")
+        return filename
+
+    def list_videos(self) -> list:
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS
+                      and os.path.isfile(os.path.join(self.root, name)))
+
+    async def acquire(self, name: str) -> SharedVideo:
+        """
+        Get the shared video of a client, opened in a thread if no other client watches it.
+        """
+        filename = self.get_filename(name)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            video = self.videos.get(filename)
+            if video is None:
+                video = self.videos[filename] = await asyncio.to_thread(self.open_video, filename)
+            video.clients += 1
+            return video
+
+    async def release(self, video: SharedVideo) -> None:
+        async with self._lock:
+            video.clients -= 1
+            if video.clients <= 0:
+                self.videos.pop(video.filename, None)
+                await asyncio.to_thread(video.close)
+
+    def get_stats(self) -> dict:
+        return {os.path.relpath(filename, self.root): video.get_stats() for filename, video in self.videos.items()}
+
+
+class ReviewClient:
+    """
+    The state of one client of the review server: its position, its filters and its playback.
+
+    The frames are sent through a small queue: a client that reads slower than the playback gets the latest frames,
+    the older ones are dropped, and no frame is rendered for it while its queue is full. Replies to the commands
+    are sent as JSON, the frames as binary messages (see pack_frame).
+    """
+    def __init__(self, video: SharedVideo, send_bytes, send_json, queue_size: int = CLIENT_QUEUE_SIZE):
+        """
+        :param video: the shared video watched by the client.
+        :param send_bytes: the coroutine sending a binary message to the client.
+        :param send_json: the coroutine sending a JSON message to the client.
+        :param queue_size: the maximum number of frames waiting to be sent.
+        """
+        self.video: SharedVideo = video
+        self._send_bytes = send_bytes
+        self._send_json = send_json
+        self._send_lock = asyncio.Lock()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+        self.frame_id: int = 0
+        self.filter_types: tuple = ()
+        self.playback_clock: PlaybackClock = PlaybackClock(video.video_player.fps)
+        self._play_task: asyncio.Task | None = None
+        self.sent_frames: int = 0
+        self.dropped_frames: int = 0
+
+    @property
+    def is_playing(self) -> bool:
+        return self._play_task is not None and not self._play_task.done()
+
+    async def handle_message(self, message: Optional[str]) -> None:
+        """
+        Parse a text message of the client and apply its command, a malformed message gets an error reply.
+        :param message: the text of the message, None for a binary message.
+        :return:
+        """
+        try:
+            command = json.loads(message)
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'message': "Invalid message, the commands are JSON objects"})
+            return
+        await self.handle(command)
+
+    async def handle(self, command: dict) -> None:
+        """
+        Apply a command of the client: seek, play, pause or filter.
+
+        An invalid command gets an error reply, the session goes on.
+        """
+        if not isinstance(command, dict):
+            await self.send_json({'type': 'error', 'message': "Invalid command, expected a JSON object"})
+            return
+
+        command_type = command.get('type')
+        if command_type == 'seek':
+            try:
+                frame_id = int(command['frame_id'])
+            except (KeyError, TypeError, ValueError, OverflowError):
+                await self.send_json({'type': 'error', 'message': "Invalid seek, frame_id must be an integer"})
+                return
+            await self.show(frame_id)
+            if self.is_playing:
+                self.playback_clock.start(self.frame_id + 1)
+        elif command_type == 'play':
+            self.play()
+        elif command_type == 'pause':
+            await self.pause()
+        elif command_type == 'filter':
+            filter_types = command.get('filters', [])
+            if not isinstance(filter_types, list) or not all(isinstance(filter_type, str)
+                                                             for filter_type in filter_types):
+                await self.send_json({'type': 'error', 'message': "Invalid filters, expected a list of names"})
+                return
+            unknown = [filter_type for filter_type in filter_types if filter_type not in FILTER_LIST]
+            if unknown:
+                await self.send_json({'type': 'error', 'message': f"Invalid filter {', '.join(unknown)}"})
+                return
+            self.filter_types = tuple(filter_types)
+            await self.show(self.frame_id)
+        else:
+            await self.send_json({'type': 'error', 'message': f"Invalid command {command_type}"})
+
+    async def show(self, frame_id: int) -> bool:
+        """
+        Render a frame with the filters of the client, and queue it.
+        :return: whether the frame was rendered.
+        """
+        num_frames = self.video.video_player.num_frames
+        frame_id = min(max(frame_id, 0), max(num_frames - 1, 0))
+        jpeg = await asyncio.to_thread(self.video.render, frame_id, self.filter_types)
+        if jpeg is None:
+            return False
+
+        self.frame_id = frame_id
+        if self.queue.full():
+            # Only the latest frames matter to a slow client
+            self.queue.get_nowait()
+            self.dropped_frames += 1
+        self.queue.put_nowait(pack_frame(frame_id, jpeg))
+        return True
+
+    def play(self) -> None:
+        if self.is_playing:
+            return
+        self.playback_clock.start(self.frame_id + 1)
+        self._play_task = asyncio.create_task(self._play())
+
+    async def pause(self) -> None:
+        if self._play_task is not None:
+            self._play_task.cancel()
+            try:
+                await self._play_task
+            except asyncio.CancelledError:
+                pass
+            self._play_task = None
+        self.playback_clock.stop()
+
+    async def _play(self) -> None:
+        # The task is only awaited on pause, its errors are logged and reported to the client right away
+        try:
+            await self._play_frames()
+        except Exception as error:
+            logger.exception("Playback of %s failed", self.video.filename)
+            self.playback_clock.stop()
+            await self.send_json({'type': 'error', 'message': f"Playback stopped: {error}"})
+
+    async def _play_frames(self) -> None:
+        num_frames = self.video.video_player.num_frames
+        while True:
+            target_frame_id = self.playback_clock.get_target_frame_id()
+            if num_frames > 0 and target_frame_id >= num_frames:
+                self.playback_clock.stop()
+                await self.send_json({'type': 'ended', 'frame_id': self.frame_id})
+                return
+            # The frames due while the queue of the client is full are skipped, not rendered
+            if target_frame_id > self.frame_id and not self.queue.full():
+                if not await self.show(target_frame_id):
+                    # The end of the stream is before the frame count of the header
+                    self.playback_clock.stop()
+                    await self.send_json({'type': 'ended', 'frame_id': self.frame_id})
+                    return
+                self.playback_clock.record_frame(self.frame_id)
+            await asyncio.sleep(max(self.playback_clock.get_time_to_frame(self.frame_id + 1), 0.001))
+
+    async def send_frames(self) -> None:
+        """
+        Send the queued frames to the client, until cancelled.
+        """
+        while True:
+            message = await self.queue.get()
+            async with self._send_lock:
+                await self._send_bytes(message)
+            self.sent_frames += 1
+
+    async def send_json(self, message: dict) -> None:
+        async with self._send_lock:
+            await self._send_json(message)
+
+    def get_stats(self) -> dict:
+        return {'frame_id': self.frame_id, 'sent_frames': self.sent_frames, 'dropped_frames': self.dropped_frames,
+                **self.playback_clock.get_stats()}
@@ -0,0 +1,122 @@
+import time
+from collections import deque
+from typing import Optional
+
+# Number of seek latencies kept for the statistics
+LATENCY_HISTORY = 100
+
+
+class SeekScheduler:
+    """
+    Coalesce the seek requests of the slider, so only the latest target is decoded.
+
+    A request only replaces the pending target, the seek starts once no new request came for `settle_time` seconds.
+    A seek still in flight when a new request arrives is cancelled: its frame is never shown, and the decoder
+    is restarted from the new target when it starts.
+    The latency is measured from the last request, i.e. when the slider is released, to the first frame shown.
+    """
+    def __init__(self, settle_time: float = 0.0, clock=time.monotonic):
+        """
+        :param settle_time: the time without request before the seek starts, in seconds.
+        :param clock: the function returning the current time in seconds, monotonic.
+        """
+        self.settle_time: float = settle_time
+        self.clock = clock
+
+        # Latest requested target, and seek being decoded
+        self.pending_frame_id: int | None = None
+        self.request_time: float = 0.0
+        self.in_flight_frame_id: int | None = None
+        self.start_time: float = 0.0
+
+        self.requests: int = 0
+        self.seeks: int = 0
+        self.cancelled_seeks: int = 0
+        self.latencies: deque = deque(maxlen=LATENCY_HISTORY)
+        self.decode_latencies: deque = deque(maxlen=LATENCY_HISTORY)
+
+    @property
+    def is_active(self) -> bool:
+        return self.pending_frame_id is not None or self.in_flight_frame_id is not None
+
+    def request(self, frame_id: int) -> None:
+        """
+        Request a seek, the previous pending or in-flight seek is dropped.
+        :param frame_id: the id of the frame to show.
+        :return:
+        """
+        if self.in_flight_frame_id is not None:
+            self.in_flight_frame_id = None
+            self.cancelled_seeks += 1
+        self.pending_frame_id = int(frame_id)
+        self.request_time = self.clock()
+        self.requests += 1
+
+    def cancel(self) -> None:
+        """
+        Drop the pending and in-flight seeks, e.g. when another event moved to a frame in the meantime.
+        """
+        if self.in_flight_frame_id is not None:
+            self.cancelled_seeks += 1
+        self.pending_frame_id = self.in_flight_frame_id = None
+
+    def is_settled(self) -> bool:
+        """
+        Whether the pending seek should start, i.e. no request came for settle_time seconds.
+        """
+        return self.pending_frame_id is not None and self.clock() - self.request_time >= self.settle_time
+
+    def start(self) -> int:
+        """
+        Start the pending seek.
+        :return: the id of the frame to decode.
+        """
+        self.in_flight_frame_id, self.pending_frame_id = self.pending_frame_id, None
+        self.start_time = self.clock()
+        self.seeks += 1
+        return self.in_flight_frame_id
+
+    def finish(self) -> Optional[float]:
+        """
+        Record the latency of the seek in flight, once its frame is shown.
+        :return: the latency from the last request to the frame shown in seconds, or None if no seek was in flight.
+        """
+        if self.in_flight_frame_id is None:
+            return None
+
+        now = self.clock()
+        self.latencies.append(now - self.request_time)
+        self.decode_latencies.append(now - self.start_time)
+        self.in_flight_frame_id = None
+        return self.latencies[-1]
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of coalesced and cancelled seeks, and the latencies in milliseconds.
+
+        The latency runs from the slider release to the first frame shown, the decode latency from the start
+        of the seek to the first frame shown.
+        """
+        return {'requests': self.requests,
+                'seeks': self.seeks,
+                'coalesced_requests': self.requests - self.seeks - (self.pending_frame_id is not None),
+                'cancelled_seeks': self.cancelled_seeks,
+                'last_latency_ms': 1000 * self.latencies[-1] if self.latencies else None,
+                'mean_latency_ms': _mean_ms(self.latencies),
+                'mean_decode_latency_ms': _mean_ms(self.decode_latencies)}
+
+
+def format_seek_stats(stats: dict) -> str:
+    """
+    Format the statistics of a seek scheduler on one line.
+    """
+    line = (f"{stats['seeks']} seeks for {stats['requests']} requests, "
+            f"{stats['coalesced_requests']} coalesced, {stats['cancelled_seeks']} cancelled")
+    if stats['mean_latency_ms'] is not None:
+        line += (f", {stats['mean_latency_ms']:.1f} ms mean latency "
+                 f"({stats['mean_decode_latency_ms']:.1f} ms decoding)")
+    return line
+
+
+def _mean_ms(durations: deque) -> Optional[float]:
+    return 1000 * sum(durations) / len(durations) if durations else None
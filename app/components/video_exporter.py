@@ -0,0 +1,268 @@
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+import cv2
+
+from app.components.decoders import DECODE_THREADS
+from app.components.detection_store import DetectionStore
+from app.components.image_filter import ImageFilter
+from app.components.video_player import VideoPlayer
+
+# Extensions of the exported videos, and their codec
+VIDEO_OUTPUT_FORMATS = {'.mp4': 'mp4v', '.avi': 'MJPG'}
+# Stages of the export pipeline, each one runs on its own thread
+EXPORT_STAGES = ['decode', 'filter', 'encode']
+# Maximum number of frames waiting between two stages, bounds the memory used by the export
+EXPORT_QUEUE_SIZE = 8
+# Interval at which the blocked stages check whether the export was cancelled, in seconds
+EXPORT_POLL_INTERVAL = 0.1
+
+# Marks the end of the frames in the queues
+_END = None
+
+
+def parse_frame_range(text: str, num_frames: int) -> tuple:
+    """
+    Parse a 'start-end' frame range, either bound can be omitted.
+    :param text: the frame range, e.g. '100-250', '100-' or '-250'.
+    :param num_frames: the number of frames of the video.
+    :return: the [start, end) frame range, clipped to the video.
+    """
+    start, separator, end = text.strip().partition('-')
+    if not separator:
+        raise ValueError(f"Invalid frame range {text}, expected START-END")
+    start = min(max(int(start) if start.strip() else 0, 0), num_frames)
+    end = min(max(int(end) if end.strip() else num_frames, start), num_frames)
+    return start, end
+
+
+class VideoExporter:
+    """
+    Export a frame range of a video with filters applied, as a video file.
+
+    The export is a pipeline of three threads (decode, filter, encode) connected by bounded queues, so decoding,
+    filtering and encoding of consecutive frames overlap, and a slow stage blocks the others instead of piling up
+    frames in memory. The export runs in the background, the progress and the throughput of each stage can be
+    polled at any time, e.g. from the GUI event loop.
+    """
+    def __init__(self, filename: str, output: str, start: int = 0, end: Optional[int] = None,
+                 filter_types: list = (), processing_size: Optional[tuple] = None,
+                 detection_store: Optional[DetectionStore] = None, queue_size: int = EXPORT_QUEUE_SIZE,
+                 decoder: str = 'opencv', decode_threads: int = DECODE_THREADS,
+                 image_filter: Optional[ImageFilter] = None):
+        """
+        :param filename: the video filepath.
+        :param output: the exported video (.mp4, .avi).
+        :param start: the id of the first exported frame.
+        :param end: the id of the frame after the last exported one, None for the end of the video.
+        :param filter_types: the filters applied to the frames, from FILTER_LIST. No filter exports the frames as is.
+        :param processing_size: the (width, height) the frames are downscaled to, None to export at the source size.
+        :param detection_store: the detection store of the video, to share it with the GUI. The one of image_filter
+            if None, opened if there is none.
+        :param queue_size: the maximum number of frames between two stages.
+        :param decoder: the decoder backend, from DECODER_BACKENDS.
+        :param decode_threads: the number of decoding threads, 0 to let the decoder choose.
+        :param image_filter: the image filter of the GUI, whose model is shared. A model is loaded if None.
+        """
+        if os.path.splitext(output)[1] not in VIDEO_OUTPUT_FORMATS:
+            raise ValueError(f"Invalid output format. Supported formats are: {', '.join(VIDEO_OUTPUT_FORMATS)}")
+
+        self.filename: str = filename
+        self.output: str = output
+        self.filter_types: list = list(filter_types)
+        self.image_filter: ImageFilter | None = image_filter
+        if detection_store is None and image_filter is not None:
+            detection_store = image_filter.detection_store
+        self.detection_store: DetectionStore | None = detection_store
+
+        # Decoder of the export, separate from the one of the GUI
+        self.video_player: VideoPlayer = VideoPlayer(filename, frame_cache_bytes=0, processing_size=processing_size,
+                                                     decoder=decoder, decode_threads=decode_threads)
+        self.start_frame: int = min(max(start, 0), self.video_player.num_frames)
+        self.end_frame: int = self.video_player.num_frames if end is None \
+            else min(max(end, self.start_frame), self.video_player.num_frames)
+
+        # Decoded frames waiting for the filter, and filtered frames waiting for the encoder
+        self._decode_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._encode_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop_event = threading.Event()
+        self._threads: list = []
+        # First error raised by a stage, it cancels the export
+        self.error: Exception | None = None
+
+        # Number of frames processed by each stage, and time spent processing them (waits excluded)
+        self.stage_frames: dict = {stage: 0 for stage in EXPORT_STAGES}
+        self.stage_times: dict = {stage: 0.0 for stage in EXPORT_STAGES}
+        self.start_time: float | None = None
+        self.end_time: float | None = None
+
+    @property
+    def num_frames(self) -> int:
+        return self.end_frame - self.start_frame
+
+    @property
+    def is_running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    @property
+    def is_cancelled(self) -> bool:
+        return self._stop_event.is_set()
+
+    def start(self) -> None:
+        """
+        Start the three stages of the export.
+        """
+        if self._threads:
+            return
+
+        self.start_time = time.perf_counter()
+        for stage, target in zip(EXPORT_STAGES, (self._decode, self._filter, self._encode)):
+            thread = threading.Thread(target=self._run_stage, args=(target,), name=f'export-{stage}', daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def stop(self) -> None:
+        """
+        Cancel the export, the frames already encoded are kept in the output file.
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+
+    def wait(self) -> dict:
+        """
+        Wait for the end of the export.
+        :return: the progress statistics, see get_progress.
+        """
+        for thread in self._threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.get_progress()
+
+    def _run_stage(self, target) -> None:
+        try:
+            target()
+        except Exception as error:
+            # Cancel the other stages, the error is raised by wait
+            if self.error is None:
+                self.error = error
+            self._stop_event.set()
+
+    def _put(self, frame_queue: queue.Queue, item) -> bool:
+        # Wait for a free slot, unless the export is cancelled
+        while not self._stop_event.is_set():
+            try:
+                frame_queue.put(item, timeout=EXPORT_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, frame_queue: queue.Queue):
+        while not self._stop_event.is_set():
+            try:
+                return frame_queue.get(timeout=EXPORT_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _record(self, stage: str, start: float) -> None:
+        self.stage_times[stage] += time.perf_counter() - start
+        self.stage_frames[stage] += 1
+
+    def _decode(self) -> None:
+        self.video_player.set_current_frame_id(self.start_frame)
+        try:
+            for _ in range(self.num_frames):
+                if self._stop_event.is_set():
+                    break
+                start = time.perf_counter()
+                ret, frame = self.video_player.read_next_frame()
+                if not ret:
+                    break
+                self._record('decode', start)
+                if not self._put(self._decode_queue, (self.video_player.current_frame_id, frame)):
+                    break
+        finally:
+            self._put(self._decode_queue, _END)
+
+    def _filter(self) -> None:
+        # The filter of the export runs on this thread with its own pipeline, the model of the GUI is shared
+        image_filter = ImageFilter()
+        if self.image_filter is not None:
+            image_filter.share_model(self.image_filter)
+        image_filter.set_filter_types(self.filter_types)
+        if self.detection_store is not None:
+            image_filter.detection_store = self.detection_store
+            image_filter.source_scale = self.video_player.get_source_scale()
+        elif 'object_detection' in self.filter_types:
+            image_filter.set_video(self.filename, self.video_player.get_source_scale())
+
+        try:
+            while True:
+                item = self._get(self._decode_queue)
+                if item is _END:
+                    break
+                frame_id, frame = item
+                start = time.perf_counter()
+                filtered_frame = image_filter.update_filtered_image(frame, frame_id)
+                self._record('filter', start)
+                if not self._put(self._encode_queue, filtered_frame):
+                    break
+        finally:
+            image_filter.close()
+            self._put(self._encode_queue, _END)
+
+    def _encode(self) -> None:
+        writer = None
+        try:
+            while True:
+                frame = self._get(self._encode_queue)
+                if frame is _END:
+                    break
+                start = time.perf_counter()
+                if writer is None:
+                    height, width = frame.shape[:2]
+                    fourcc = cv2.VideoWriter_fourcc(*VIDEO_OUTPUT_FORMATS[os.path.splitext(self.output)[1]])
+                    writer = cv2.VideoWriter(self.output, fourcc, self.video_player.fps, (width, height))
+                writer.write(frame)
+                self._record('encode', start)
+        finally:
+            if writer is not None:
+                writer.release()
+            self.end_time = time.perf_counter()
+
+    def get_progress(self) -> dict:
+        """
+        Get the progress of the export, and the throughput of each stage.
+
+        The throughput of a stage only counts the time spent processing frames, the slowest stage is the
+        bottleneck of the export.
+        """
+        encoded_frames = self.stage_frames['encode']
+        elapsed_time = 0.0
+        if self.start_time is not None:
+            elapsed_time = (self.end_time or time.perf_counter()) - self.start_time
+
+        return {'frames': self.num_frames,
+                'encoded_frames': encoded_frames,
+                'progress': encoded_frames / self.num_frames if self.num_frames else 1.0,
+                'elapsed_time': elapsed_time,
+                'fps': encoded_frames / elapsed_time if elapsed_time > 0 else 0.0,
+                'queue_depths': {'decode': self._decode_queue.qsize(), 'filter': self._encode_queue.qsize()},
+                'stages': {stage: {'frames': self.stage_frames[stage],
+                                   'fps': self.stage_frames[stage] / self.stage_times[stage]
+                                   if self.stage_times[stage] > 0 else 0.0}
+                           for stage in EXPORT_STAGES}}
+
+    def report(self) -> str:
+        """
+        Get a one-line summary of the progress, for the GUI.
+        """
+        progress = self.get_progress()
+        stages = ', '.join(f"{stage} {stats['fps']:.0f} fps" for stage, stats in progress['stages'].items())
+        return f"Export {progress['progress']:.0%} ({progress['fps']:.1f} fps) - {stages}"
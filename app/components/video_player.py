@@ -1,7 +1,25 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
 import cv2
-from pymediainfo import MediaInfo
+
+from app.components.decoders import DECODE_THREADS, create_decoder
+from app.components.frame_display import fit_size
+from app.components.frame_prefetcher import FramePrefetcher
+from app.components.frame_store import FRAME_STORE_MAX_BYTES, FrameStore
+from app.components.keyframe_index import KeyframeIndex, seek_capture
+from app.components.proxy_track import ProxyTrack
+from app.components.video_probe import VideoMetadata, get_metadata_cache, probe_video
 
 SUPPORTED_FORMATS = ['.mp4', '.avi', '.mov', '.mkv']
+# Maximum time the GUI waits for the decoder thread, in seconds
+PREFETCH_TIMEOUT = 1.0
+# Default memory budget of the decoded-frame cache, in bytes
+FRAME_CACHE_BYTES = 512 * 1024 * 1024
+# Number of frames decoded and cached before the target when seeking backward
+CACHE_BACKFILL = 8
 
 def is_video(filename:str):
     if filename.endswith(tuple(SUPPORTED_FORMATS)):
@@ -9,69 +27,482 @@ def is_video(filename:str):
     else:
         raise ValueError(f"Invalid video file format. Supported formats are: {', '.join(SUPPORTED_FORMATS)}")
 
+class FrameCache:
+    """
+    LRU cache of decoded frames, keyed by frame id and bounded by a memory budget in bytes.
+
+    The cached frames are shared with the caller and must not be modified in place.
+    """
+    def __init__(self, max_bytes: int = FRAME_CACHE_BYTES):
+        self.max_bytes: int = max_bytes
+        self.current_bytes: int = 0
+        self._frames: OrderedDict = OrderedDict()
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, frame_id: int):
+        return frame_id in self._frames
+
+    def get(self, frame_id: int):
+        """
+        Get a frame from the cache and mark it as the most recently used.
+        :param frame_id: the id of the frame.
+        :return: the frame, or None if the frame is not cached.
+        """
+        frame = self._frames.get(frame_id)
+        if frame is None:
+            self.misses += 1
+            return None
+
+        self._frames.move_to_end(frame_id)
+        self.hits += 1
+        return frame
+
+    def put(self, frame_id: int, frame) -> None:
+        """
+        Add a frame to the cache, and evict the least recently used frames until the budget is met.
+        :param frame_id: the id of the frame.
+        :param frame: the decoded frame.
+        :return:
+        """
+        if frame is None or frame.nbytes > self.max_bytes:
+            return
+
+        previous_frame = self._frames.pop(frame_id, None)
+        if previous_frame is not None:
+            self.current_bytes -= previous_frame.nbytes
+
+        self._frames[frame_id] = frame
+        self.current_bytes += frame.nbytes
+
+        while self.current_bytes > self.max_bytes:
+            _, evicted_frame = self._frames.popitem(last=False)
+            self.current_bytes -= evicted_frame.nbytes
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._frames.clear()
+        self.current_bytes = 0
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'frames': len(self._frames),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+
 class VideoPlayer:
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, prefetch_size: int = 0, use_keyframe_index: bool = True,
+                 keyframe_sidecar: bool = True, frame_cache_bytes: int = FRAME_CACHE_BYTES,
+                 processing_size: tuple = None, use_proxy: bool = False, use_metadata_cache: bool = True,
+                 decoder: str = 'opencv', decode_threads: int = DECODE_THREADS, pixel_format: str = 'bgr',
+                 materialize: bool = False, materialize_max_bytes: int = FRAME_STORE_MAX_BYTES):
         print(f"Loading video file: {filename}")
         self.filename = is_video(filename)
+        if not os.path.isfile(self.filename):
+            raise FileNotFoundError(f"Video file not found: {filename}")
+
+        # Decoder backend, number of decoding threads and pixel format of the decoded frames ('gray' skips BGR)
+        self.decoder: str = decoder
+        self.decode_threads: int = decode_threads
+        self.pixel_format: str = pixel_format
 
-        self.video_file = cv2.VideoCapture(self.filename)
+        # Get the metadata of the video file, from the metadata cache if the file did not change since it was probed.
+        # The cache is looked up before opening the decoder, which only probes the unknown videos
+        metadata_cache = get_metadata_cache() if use_metadata_cache else None
+        metadata = metadata_cache.get(self.filename) if metadata_cache is not None else None
+        self.video_file = self.open_decoder()
+        if metadata is None:
+            metadata = probe_video(self.filename, self.video_file)
+            if metadata_cache is not None:
+                metadata_cache.put(self.filename, metadata)
+                metadata_cache.save()
+        self.metadata: VideoMetadata = metadata
+        self.num_frames = self.metadata.num_frames
+        self.fps = self.metadata.fps
+        self.height = self.metadata.height
+        self.width = self.metadata.width
 
-        # Get the metadata of the video file
-        self.num_frames = self.get_nb_frames()
-        self.fps = self.video_file.get(cv2.CAP_PROP_FPS)
-        self.height = int(self.video_file.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        # The frames are downscaled once, right after decoding, so the filters run on the processing size
+        self.processing_size: tuple = self.get_processing_size(processing_size)
+
+        # Keyframe index used to seek to the nearest keyframe and only decode the remaining frames.
+        # Without an up-to-date sidecar, the index is built in a background thread and the seeks go through
+        # CAP_PROP_POS_FRAMES until it is ready
+        self.keyframe_index: KeyframeIndex | None = None
+        self._keyframe_lock = threading.Lock()
+        self._keyframe_thread: threading.Thread | None = None
+        self.prefetcher: FramePrefetcher | None = None
+        self.proxy_track: ProxyTrack | None = None
+        if use_keyframe_index:
+            keyframe_index = KeyframeIndex.load(self.filename) if keyframe_sidecar else None
+            if keyframe_index is not None:
+                self.set_keyframe_index(keyframe_index)
+            else:
+                self._keyframe_thread = threading.Thread(target=self._build_keyframe_index, args=(keyframe_sidecar,),
+                                                         daemon=True)
+                self._keyframe_thread.start()
 
         self.ret = False
         self.frame = None
 
-        self.current_frame_id = self.get_current_frame_id()
+        # Decoded frames around the playhead, to step back and forth without decoding again
+        self.frame_cache: FrameCache = FrameCache(frame_cache_bytes)
+
+        # Id of the last frame read, id of the next frame to read,
+        # and id of the next frame the capture will decode
+        self.current_frame_id: int = 0
+        self.next_frame_id: int = 0
+        self.capture_position: int = 0
         self.is_playing = False
 
+        # Frames decoded once into a memory map on the local disk, for instant random access
+        self.frame_store: FrameStore | None = None
+        if materialize:
+            self.start_materialize(materialize_max_bytes)
+
+        # Low-resolution thumbnails for the scrubbing previews, built in the background
+        if use_proxy:
+            self.start_proxy()
+
+        # Producer mode: decode the frames ahead of the playhead in a background thread
+        if prefetch_size > 0:
+            self.start_prefetch(prefetch_size)
+
+    def open_decoder(self):
+        """
+        Open a new decoder on the video, with the backend and the options of the video player.
+        """
+        return create_decoder(self.filename, self.decoder, self.decode_threads, self.pixel_format)
+
+    def _build_keyframe_index(self, use_sidecar: bool) -> None:
+        keyframe_index = KeyframeIndex.build(self.filename)
+        if use_sidecar:
+            keyframe_index.save(self.filename)
+        self.set_keyframe_index(keyframe_index)
+
+    def set_keyframe_index(self, keyframe_index: KeyframeIndex) -> None:
+        """
+        Seek through a keyframe index from now on, in the video player and its background decoders.
+        :param keyframe_index: the keyframe index of the video.
+        :return:
+        """
+        with self._keyframe_lock:
+            self.keyframe_index = keyframe_index
+            # The keyframe scan counts the packets of the video, more reliable than the count of the header
+            if keyframe_index.num_frames > 0:
+                self.num_frames = keyframe_index.num_frames
+            if self.prefetcher is not None:
+                self.prefetcher.keyframe_index = keyframe_index
+            if self.proxy_track is not None:
+                self.proxy_track.keyframe_index = keyframe_index
+
+    def wait_keyframe_index(self, timeout: float = None) -> KeyframeIndex | None:
+        """
+        Wait for the keyframe index being built in the background.
+        :param timeout: the maximum time to wait in seconds, None to wait until the index is built.
+        :return: the keyframe index, or None if it is not ready or not used.
+        """
+        if self._keyframe_thread is not None:
+            self._keyframe_thread.join(timeout)
+        return self.keyframe_index
+
     def get_nb_frames(self):
         """
-        Get the number of frames in the video file using the MediaInfo library as it is more reliable than OpenCV
+        Get the number of frames in the video file, counted by the keyframe scan when available,
+        read from the container header otherwise.
+        """
+        return self.num_frames
+
+    def get_processing_size(self, processing_size: tuple = None) -> tuple:
+        """
+        Get the size of the frames returned by the video player.
+        :param processing_size: the (width, height) the frames must fit in, None to keep the source size.
+        :return: the (width, height) of the processed frames, never larger than the source.
+        """
+        if processing_size is None or self.width <= 0 or self.height <= 0:
+            return self.width, self.height
+        if self.width <= processing_size[0] and self.height <= processing_size[1]:
+            return self.width, self.height
+        return fit_size((self.width, self.height), processing_size)
+
+    def get_source_scale(self) -> tuple:
+        """
+        Get the factors mapping the coordinates of the processed frames to the source frames.
+        """
+        if self.processing_size[0] <= 0 or self.processing_size[1] <= 0:
+            return 1.0, 1.0
+        return self.width / self.processing_size[0], self.height / self.processing_size[1]
+
+    def downscale(self, frame):
+        """
+        Resize a decoded frame to the processing size.
+        """
+        if (frame.shape[1], frame.shape[0]) == self.processing_size:
+            return frame
+        return cv2.resize(frame, self.processing_size, interpolation=cv2.INTER_AREA)
+
+    def start_prefetch(self, capacity: int = 32):
+        """
+        Switch the video player to producer mode.
+
+        A decoder thread fills a bounded ring of decoded frames ahead of the playhead,
+        and read_next_frame only pops the frames that are ready.
+        :param capacity: the maximum number of decoded frames kept ahead of the playhead.
+        :return:
+        """
+        with self._keyframe_lock:
+            if self.prefetcher is None:
+                self.prefetcher = FramePrefetcher(self.filename, capacity, self.keyframe_index, self.downscale,
+                                                  self.open_decoder)
+        self.prefetcher.start(self.next_frame_id)
+
+    def stop_prefetch(self):
+        """
+        Stop the decoder thread and go back to decoding on the calling thread.
+        :return:
+        """
+        if self.prefetcher is None:
+            return
+
+        self.prefetcher.stop()
+        self.prefetcher = None
+
+    def start_proxy(self):
+        """
+        Open the proxy track of the video, and build its missing thumbnails in a background thread.
+        :return:
+        """
+        with self._keyframe_lock:
+            if self.proxy_track is None:
+                # The thumbnails are in color whatever the pixel format of the player
+                self.proxy_track = ProxyTrack(self.filename, self.num_frames, (self.width, self.height),
+                                              self.keyframe_index,
+                                              open_decoder=partial(create_decoder, self.filename, self.decoder,
+                                                                   self.decode_threads))
+        self.proxy_track.start()
+
+    def stop_proxy(self):
+        if self.proxy_track is not None:
+            self.proxy_track.stop()
+
+    def read_proxy_frame(self, frame_id: int):
+        """
+        Get the low-resolution preview of a frame, without decoding and without moving the playhead.
+        :param frame_id: the id of the frame.
+        :return: the thumbnail closest to the frame, or None if the proxy track is not available yet.
+        """
+        if self.proxy_track is None:
+            return None
+        return self.proxy_track.get(frame_id)
+
+    def get_prefetch_stats(self) -> dict:
+        """
+        Get the queue depth and the dropped-frame counters of the decoder thread.
+        """
+        if self.prefetcher is None:
+            return {}
+        return self.prefetcher.get_stats()
+
+    def get_cache_stats(self) -> dict:
+        """
+        Get the hit/miss statistics and the memory usage of the decoded-frame cache.
+        """
+        return self.frame_cache.get_stats()
+
+    def start_materialize(self, max_bytes: int = FRAME_STORE_MAX_BYTES) -> bool:
+        """
+        Decode the whole video once, at the processing size, into a memory-mapped frame store.
+
+        The frames are stored in a background thread and served from the store as soon as they are written.
+        :param max_bytes: the maximum size of the store, larger videos are decoded as usual.
+        :return: whether the video is materialized.
+        """
+        if self.frame_store is None:
+            width, height = self.processing_size
+            frame_shape = (height, width) if self.pixel_format == 'gray' else (height, width, 3)
+            self.frame_store = FrameStore.open(self.filename, self.num_frames, frame_shape, max_bytes=max_bytes)
+            if self.frame_store is None:
+                print("The video is too large to be materialized, it is decoded as usual")
+                return False
+        self.frame_store.start(self.open_decoder, self.downscale)
+        return True
+
+    def stop_materialize(self):
+        if self.frame_store is not None:
+            self.frame_store.stop()
+
+    def get_decoded_frame(self, frame_id: int):
+        """
+        Get a frame without decoding it, from the frame store or the frame cache.
+        :param frame_id: the id of the frame.
+        :return: the frame, or None if it has to be decoded.
+        """
+        if self.frame_store is not None and frame_id in self.frame_store:
+            return self.frame_store.get(frame_id)
+        return self.frame_cache.get(frame_id)
+
+    def is_decoded(self, frame_id: int) -> bool:
+        return (self.frame_store is not None and frame_id in self.frame_store) or frame_id in self.frame_cache
+
+    def read_next_frame(self):
+        """
+        Read the next frame, either from the frame store, the frame cache, the prefetch ring
+        or directly from the video file.
+        :return: a (ret, frame) tuple as returned by cv2.VideoCapture.read.
+        """
+        frame_id = self.next_frame_id
+        self.frame = self.get_decoded_frame(frame_id)
+
+        if self.prefetcher is not None and self.frame_store is not None and self.frame_store.is_complete:
+            # Every frame is served from the frame store, the decoder thread is no longer needed
+            self.stop_prefetch()
+
+        if self.frame is None:
+            if self.prefetcher is None:
+                self.frame = self.decode_frame(frame_id)
+            else:
+                item = self.prefetcher.pop(frame_id, timeout=PREFETCH_TIMEOUT)
+                self.frame = item[1] if item is not None else None
+            self.frame_cache.put(frame_id, self.frame)
+
+        self.ret = self.frame is not None
+        if self.ret:
+            self.current_frame_id = frame_id
+            self.next_frame_id = frame_id + 1
+        return self.ret, self.frame
+
+    def poll_next_frame(self):
+        """
+        Read the next frame only if it is available without waiting for the decoder thread.
+
+        Without the prefetcher, the frame is decoded on the calling thread.
+        :return: a (ret, frame) tuple as returned by read_next_frame, or None if the frame is not decoded yet.
+        """
+        if self.prefetcher is not None and not self.is_decoded(self.next_frame_id) \
+                and not self.prefetcher.is_ready(self.next_frame_id):
+            return None
+        return self.read_next_frame()
+
+    def decode_frame(self, frame_id: int, source: bool = False):
+        """
+        Decode a frame with the capture of the video player, seeking only if necessary.
+
+        When seeking, the frames between the keyframe and the target are decoded anyway: the last few of them
+        are retrieved and cached as well, so stepping back is served from the cache.
+        :param frame_id: the id of the frame to decode.
+        :param source: whether to return the frame at the source size instead of the processing size.
+        :return: the frame, or None if it could not be decoded.
         """
-        num_frames = 0
-        media_info = MediaInfo.parse(self.filename)
-        for track in media_info.tracks:
-            if track.track_type == "Video":
-                num_frames = int(track.frame_count)
+        if frame_id != self.capture_position:
+            # The index can be set by the background build meanwhile, the same one is used for the whole seek
+            keyframe_index = self.keyframe_index
+            keyframe = keyframe_index.nearest_keyframe(frame_id) if keyframe_index else None
+            if keyframe is None:
+                keyframe = frame_id
+            elif keyframe <= self.capture_position <= frame_id:
+                # No seek is needed, the capture only decodes forward
+                keyframe = self.capture_position
+            # Without a frame cache, the frames before the target are only grabbed
+            start_frame_id = max(frame_id - CACHE_BACKFILL, keyframe) if self.frame_cache.max_bytes > 0 else frame_id
 
-        return num_frames
+            self.capture_position = seek_capture(self.video_file, self.capture_position, start_frame_id,
+                                                 keyframe_index)
+            while self.capture_position < frame_id:
+                ret, frame = self.video_file.read()
+                if not ret:
+                    return None
+                self.frame_cache.put(self.capture_position, self.downscale(frame))
+                self.capture_position += 1
+
+        ret, frame = self.video_file.read()
+        if not ret:
+            return None
+        self.capture_position += 1
+        return frame if source else self.downscale(frame)
+
+    def read_source_frame(self, frame_id: int):
+        """
+        Get a frame at the source size, e.g. to save it, without moving the playhead.
+        :param frame_id: the id of the frame.
+        :return: the frame, or None if it could not be decoded.
+        """
+        if self.processing_size == (self.width, self.height):
+            frame = self.get_decoded_frame(frame_id)
+            if frame is not None:
+                return frame
+        return self.decode_frame(frame_id, source=True)
 
     def read_frame(self, frame_id):
-        self.video_file.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
-        self.ret, self.frame = self.video_file.read()
+        self.set_current_frame_id(frame_id)
+        self.read_next_frame()
         if not self.ret:
             raise ValueError("Error reading frame")
         return self.frame
 
     def set_current_frame_id(self, frame_id: float):
-        self.current_frame_id = self.video_file.set(cv2.CAP_PROP_POS_FRAMES, frame_id)
+        """
+        Move the playhead so that the next read returns the given frame.
+        :param frame_id: the id of the frame, starting from 0.
+        :return: the new current frame id.
+        """
+        frame_id = int(frame_id)
+        if self.num_frames > 0:
+            frame_id = min(frame_id, self.num_frames - 1)
+        frame_id = max(frame_id, 0)
+
+        # Flush the ring and restart decoding from the new position, unless the frame is already decoded.
+        # Without the prefetcher, the capture is only seeked when the frame is actually read.
+        if self.prefetcher is not None and not self.is_decoded(frame_id):
+            self.prefetcher.seek(frame_id)
+
+        self.current_frame_id = frame_id
+        self.next_frame_id = frame_id
         return self.current_frame_id
 
+    def skip_to_frame(self, frame_id: int) -> int:
+        """
+        Move the playhead forward without decoding the frames in between, to catch up with the playback clock.
+
+        Unlike set_current_frame_id, the prefetcher is not restarted: the next read drops the skipped frames
+        from the ring, and only realigns the decoder if the frame is too far ahead.
+        :param frame_id: the id of the next frame to read.
+        :return: the number of skipped frames.
+        """
+        if self.num_frames > 0:
+            frame_id = min(frame_id, self.num_frames - 1)
+        skipped_frames = max(frame_id - self.next_frame_id, 0)
+        self.next_frame_id += skipped_frames
+        return skipped_frames
+
     def set_current_frame_from_frame_id(self, frame_id: float):
-        # As the frame is updated using self.video_file.read() that increments the current frame id
-        # Set it to the previous one to match the right frame id
-        self.set_current_frame_id(frame_id - 1)
-        self.ret, self.frame = self.video_file.read()
+        """
+        Read and return the frame with the given id.
+        """
+        self.set_current_frame_id(frame_id)
+        self.read_next_frame()
 
         return self.ret, self.frame
 
     def get_current_frame_id(self):
-        self.current_frame_id = self.video_file.get(cv2.CAP_PROP_POS_FRAMES)
+        """
+        Get the id of the last frame read, starting from 0.
+        """
         return self.current_frame_id
 
     def set_previous_frame(self):
-        # Get the current frame id when clicking on the previous button
-        current_frame_id = self.get_current_frame_id()
-
-        # The index must 2, as the frame id is set to -2, but displayed -1 with read.
-        previous_frame_id = current_frame_id - 2
-
-        # Set the current frame to the previous frame
-        self.current_frame_id = previous_frame_id
-        self.video_file.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame_id)
+        # The next read returns the frame before the one currently displayed
+        self.set_current_frame_id(self.current_frame_id - 1)
 
     def play_video(self):
         self.is_playing = True
@@ -80,5 +511,12 @@ class VideoPlayer:
         self.is_playing = False
 
     def __del__(self):
-        self.video_file.release()
+        if getattr(self, 'prefetcher', None) is not None:
+            self.prefetcher.stop()
+        if getattr(self, 'proxy_track', None) is not None:
+            self.proxy_track.stop()
+        if getattr(self, 'frame_store', None) is not None:
+            self.frame_store.stop()
+        if getattr(self, 'video_file', None) is not None:
+            self.video_file.release()
         cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import cv2
+
+from app.components.keyframe_index import get_file_signature
+
+# Default file of the metadata cache, shared by all the videos
+METADATA_CACHE_FILENAME = os.path.join(os.path.expanduser('~'), '.cache', 'enacuity', 'metadata.json')
+# Maximum number of videos in the metadata cache, the least recently probed ones are dropped
+METADATA_CACHE_SIZE = 4096
+
+
+class VideoMetadata:
+    """
+    Metadata of a video file, read from the container in one pass.
+    """
+    def __init__(self, num_frames: int = 0, fps: float = 0.0, width: int = 0, height: int = 0, codec: str = ''):
+        self.num_frames: int = num_frames
+        self.fps: float = fps
+        self.width: int = width
+        self.height: int = height
+        self.codec: str = codec
+
+    @property
+    def duration(self) -> float:
+        """
+        Duration of the video, in seconds.
+        """
+        return self.num_frames / self.fps if self.fps > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {'num_frames': self.num_frames, 'fps': self.fps, 'width': self.width, 'height': self.height,
+                'codec': self.codec}
+
+    @classmethod
+    def from_dict(cls, content: dict) -> 'VideoMetadata':
+        return cls(content['num_frames'], content['fps'], content['width'], content['height'], content['codec'])
+
+
+def probe_video(filename: str, capture: Optional[cv2.VideoCapture] = None) -> VideoMetadata:
+    """
+    Read the frame count, frame rate, resolution and codec of a video from its container headers.
+
+    No frame is decoded, so the probe only costs opening the file.
+    :param filename: the video filepath.
+    :param capture: an already opened capture of the video, to avoid opening the file again.
+    :return: the metadata of the video.
+    """
+    owns_capture = capture is None
+    if owns_capture:
+        capture = cv2.VideoCapture(filename)
+
+    fourcc = int(capture.get(cv2.CAP_PROP_FOURCC))
+    metadata = VideoMetadata(num_frames=max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0),
+                             fps=capture.get(cv2.CAP_PROP_FPS),
+                             width=int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                             height=int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                             codec=''.join(chr((fourcc >> shift) & 0xFF) for shift in (0, 8, 16, 24)).strip('\0 '))
+
+    if owns_capture:
+        capture.release()
+    return metadata
+
+
+class MetadataCache:
+    """
+    Persistent cache of the video metadata, keyed by the absolute path, the size and the mtime of the files.
+
+    The whole cache is a single JSON file, read once, so listing a folder of known videos costs one stat per file.
+    """
+    def __init__(self, filename: Optional[str] = None, max_size: int = METADATA_CACHE_SIZE):
+        """
+        :param filename: the JSON file of the cache, METADATA_CACHE_FILENAME by default.
+        :param max_size: the maximum number of videos in the cache, the least recently probed ones are dropped.
+        """
+        self.filename: str = filename or METADATA_CACHE_FILENAME
+        self.max_size: int = max_size
+        self._lock = threading.Lock()
+        self._entries: OrderedDict | None = None
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            try:
+                with open(self.filename) as cache_file:
+                    self._entries = OrderedDict(json.load(cache_file))
+            except (OSError, ValueError):
+                self._entries = OrderedDict()
+        return self._entries
+
+    def get(self, filename: str) -> Optional[VideoMetadata]:
+        """
+        Get the cached metadata of a video.
+        :param filename: the video filepath.
+        :return: the metadata, or None if the video is not cached or changed since it was probed.
+        """
+        with self._lock:
+            entry = self._load().get(os.path.abspath(filename))
+            signature = get_file_signature(filename)
+            if entry is None or signature is None or entry['signature'] != signature:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return VideoMetadata.from_dict(entry['metadata'])
+
+    def put(self, filename: str, metadata: VideoMetadata) -> None:
+        signature = get_file_signature(filename)
+        if signature is None:
+            # The file is gone, there is nothing to key the entry on
+            return
+        with self._lock:
+            entries = self._load()
+            key = os.path.abspath(filename)
+            entries.pop(key, None)
+            entries[key] = {'signature': signature, 'metadata': metadata.to_dict()}
+            while len(entries) > self.max_size:
+                entries.popitem(last=False)
+
+    def save(self) -> None:
+        """
+        Write the cache to disk, the errors are ignored as the cache can always be rebuilt.
+        """
+        with self._lock:
+            if self._entries is None:
+                return
+            content = json.dumps(self._entries)
+
+        # Write a temporary file first, so a crash or a concurrent process never leaves a half-written cache
+        temporary_filename = f'{self.filename}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+            with open(temporary_filename, 'w') as cache_file:
+                cache_file.write(content)
+            os.replace(temporary_filename, self.filename)
+        except OSError:
+            pass
+
+    def get_or_probe(self, filename: str, capture: Optional[cv2.VideoCapture] = None,
+                     save: bool = True) -> VideoMetadata:
+        """
+        Get the metadata of a video from the cache, or probe it and cache the result.
+        :param filename: the video filepath.
+        :param capture: an already opened capture of the video, used on a cache miss.
+        :param save: whether to write the cache to disk after a miss.
+        :return: the metadata of the video.
+        """
+        metadata = self.get(filename)
+        if metadata is None:
+            metadata = probe_video(filename, capture)
+            self.put(filename, metadata)
+            if save:
+                self.save()
+        return metadata
+
+    def probe_folder(self, folder: str, extensions: tuple) -> dict:
+        """
+        Get the metadata of all the videos of a folder, the cache is written once at the end.
+        :param folder: the folder to list.
+        :param extensions: the extensions of the video files.
+        :return: the metadata by filepath, sorted by filename.
+        """
+        filenames = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                           if name.lower().endswith(extensions))
+        misses = self.misses
+        folder_metadata = {filename: self.get_or_probe(filename, save=False) for filename in filenames}
+        if self.misses != misses:
+            self.save()
+        return folder_metadata
+
+
+# Metadata cache shared by the video players of the process
+_metadata_cache: Optional[MetadataCache] = None
+
+
+def get_metadata_cache() -> MetadataCache:
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = MetadataCache()
+    return _metadata_cache
@@ -0,0 +1,167 @@
+import PySimpleGUI as sg
+
+from app.components.custom_slider import CustomSlider
+from app.components.frame_display import DISPLAY_SIZE, create_frame_display
+from app.components.grid_player import GridPlayer
+from app.components.playback_clock import PlaybackClock
+from app.components.seek_scheduler import SeekScheduler
+from images.output import button_next, button_previous, play_button, pause_button
+
+# Display backend of the image element, see DISPLAY_BACKENDS
+DISPLAY_BACKEND = 'auto'
+# Maximum time to wait for the frames of all the videos after a seek, in seconds
+GRID_SEEK_TIMEOUT = 0.5
+# The grid has no proxy: while the slider is dragged only the time labels move, the frames are decoded once the
+# slider is still for GRID_SEEK_SETTLE_TIME seconds
+GRID_SEEK_SETTLE_TIME = 0.1
+# Interval at which the GUI checks whether the frames of a seek are decoded, in milliseconds
+SEEK_POLL_INTERVAL = 5
+
+
+class GridPlayerApp:
+    """
+    Play several videos side by side in a synchronized grid, driven by one slider.
+
+    The frames of all the videos are composited into one buffer, so each tick is a single update of the image element.
+    """
+    def __init__(self, filenames: list):
+        self.grid_player: GridPlayer = GridPlayer(filenames, DISPLAY_SIZE)
+        self.playback_clock: PlaybackClock = PlaybackClock(self.grid_player.fps)
+        self.is_playing: bool = False
+        self.timeout: int = 1000 // max(int(self.grid_player.fps), 1)
+        # Only the latest slider position is decoded, once the slider settles
+        self.seek_scheduler: SeekScheduler = SeekScheduler(GRID_SEEK_SETTLE_TIME)
+
+        self.create_window()
+        self.frame_display = create_frame_display(DISPLAY_BACKEND, self.window['-IMAGE-'], DISPLAY_SIZE)
+        self.video_slider.update_metadata_from_video_player(self.grid_player.master)
+        self.seek(0)
+
+    def create_window(self):
+        sg.theme('Black2')
+        button_color = sg.theme_background_color()
+
+        time_elapsed_text = sg.Text('', key='-TIME_ELAPSED-')
+        time_remaining_text = sg.Text('', key='-TIME_REMAINING-')
+        self.video_slider = CustomSlider('-SLIDER-', time_elapsed_text, time_remaining_text)
+
+        layout = [
+            [sg.Image(key='-IMAGE-', size=DISPLAY_SIZE)],
+            [time_elapsed_text, self.video_slider, time_remaining_text],
+            [sg.Button(image_data=button_previous, key='-PREVIOUS-', border_width=0, button_color=button_color),
+             sg.Button(image_data=play_button, key='-PLAY_PAUSE-', border_width=0, button_color=button_color),
+             sg.Button(image_data=button_next, key='-NEXT-', border_width=0, button_color=button_color)]
+        ]
+        self.window = sg.Window("EnAcuity Player - Grid", layout, element_justification='c',
+                                return_keyboard_events=True, finalize=True)
+
+    def show_frame(self, frame_id: int, timeout: float = 0.0):
+        """
+        Show a frame of the timeline in all the cells of the grid.
+        :param frame_id: the frame of the timeline.
+        :param timeout: the maximum time to wait for each video, 0 to keep the previous frame of the late videos.
+        :return:
+        """
+        self.frame_display.update(self.grid_player.read(frame_id, timeout))
+        self.video_slider.update_position(frame_id, throttle=self.is_playing)
+
+    def clamp_frame_id(self, frame_id: int) -> int:
+        return min(max(int(frame_id), 0), max(self.grid_player.num_frames - 1, 0))
+
+    def seek(self, frame_id: int):
+        """
+        Show a frame of the timeline, waiting at most GRID_SEEK_TIMEOUT for all the videos.
+        :param frame_id: the frame of the timeline.
+        :return:
+        """
+        # The seek replaces any seek of the slider still pending
+        self.seek_scheduler.cancel()
+        frame_id = self.clamp_frame_id(frame_id)
+        self.grid_player.seek(frame_id)
+        self.show_frame(frame_id, GRID_SEEK_TIMEOUT)
+        if self.is_playing:
+            self.playback_clock.start(self.grid_player.current_frame_id + 1)
+
+    def update_seek(self):
+        """
+        Start the pending seek of the slider once it settled, and show the frames of the videos as they are decoded.
+
+        The GUI never waits for the decoders: the seek is over once all the videos show their frame,
+        or after GRID_SEEK_TIMEOUT, the late videos then catch up like during playback.
+        :return:
+        """
+        if self.seek_scheduler.is_settled():
+            self.grid_player.seek(self.seek_scheduler.start())
+
+        frame_id = self.seek_scheduler.in_flight_frame_id
+        if frame_id is None:
+            return
+        self.show_frame(frame_id)
+        if not self.grid_player.is_complete(frame_id) \
+                and self.seek_scheduler.clock() - self.seek_scheduler.start_time < GRID_SEEK_TIMEOUT:
+            # Not decoded yet, check again on the next timeout
+            return
+
+        self.seek_scheduler.finish()
+        self.timeout = 1000 // max(int(self.grid_player.fps), 1)
+        if self.is_playing:
+            self.playback_clock.start(frame_id + 1)
+
+    def play_next_frame(self):
+        """
+        Show the frame due at the current time of the playback clock, the videos that are late keep their frame.
+        """
+        target_frame_id = self.playback_clock.get_target_frame_id()
+        if target_frame_id > self.grid_player.current_frame_id:
+            if target_frame_id >= self.grid_player.num_frames > 0:
+                self.toggle_playback()
+                return
+            self.show_frame(target_frame_id)
+            self.playback_clock.record_frame(target_frame_id)
+
+        self.timeout = max(1, int(1000 * self.playback_clock.get_time_to_frame(self.grid_player.current_frame_id + 1)))
+
+    def toggle_playback(self):
+        self.is_playing = not self.is_playing
+        self.window['-PLAY_PAUSE-'].update(image_data=pause_button if self.is_playing else play_button)
+        if self.is_playing:
+            self.playback_clock.start(self.grid_player.current_frame_id + 1)
+        else:
+            self.playback_clock.stop()
+            self.timeout = 1000 // max(int(self.grid_player.fps), 1)
+            self.video_slider.update_position(self.grid_player.current_frame_id)
+
+    def launch_app(self):
+        while True:
+            event, values = self.window.read(timeout=self.timeout)
+
+            if event in (sg.WIN_CLOSED, 'Exit'):
+                break
+
+            elif event in ['-PLAY_PAUSE-', ' ']:
+                self.toggle_playback()
+
+            elif event == '-NEXT-':
+                self.seek(self.grid_player.current_frame_id + 1)
+
+            elif event == '-PREVIOUS-':
+                self.seek(self.grid_player.current_frame_id - 1)
+
+            elif event == '-SLIDER-':
+                # The seek is coalesced with the next slider events
+                frame_id = self.clamp_frame_id(values['-SLIDER-'])
+                self.video_slider.update_slider_time_labels(frame_id)
+                self.seek_scheduler.request(frame_id)
+                self.timeout = SEEK_POLL_INTERVAL
+
+            elif self.is_playing and not self.seek_scheduler.is_active:
+                self.play_next_frame()
+
+            # Polled after every event, so a pending seek never swallows the user input
+            if self.seek_scheduler.is_active:
+                self.update_seek()
+
+        stats = self.grid_player.get_stats()
+        print(f"Grid: {sum(stats['decoded_frames'])} frames decoded, {stats['stale_frames']} late frames")
+        self.grid_player.close()
+        self.window.close()
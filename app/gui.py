@@ -1,38 +1,123 @@
 import os
+import time
 
 import cv2
 from datetime import datetime
+from typing import Optional
 import PySimpleGUI as sg
 from PySimpleGUI import Menu
 
 from app.components.custom_slider import CustomSlider
-from app.components.image_filter import ImageFilter
+from app.components.detection_timeline import DetectionTimeline
+from app.components.frame_display import DISPLAY_SIZE, create_frame_display
+from app.components.filter_pipeline import get_filter_name
+from app.components.image_filter import FILTER_LABELS, ImageFilter
+from app.components.motion_gate import MOTION_GATING_PRESETS
+from app.components.playback_clock import PlaybackClock
+from app.components.seek_scheduler import SeekScheduler, format_seek_stats
+from app.components.video_exporter import VIDEO_OUTPUT_FORMATS, VideoExporter, parse_frame_range
 from app.components.video_player import VideoPlayer
+from app.profiling import StageProfiler, StartupProfiler
 from images.output import button_next, button_previous, play_button, pause_button
 
 VIDEO_FILENAME = os.path.join(os.getcwd(), "data/video01_cropped.mp4")
+# Number of frames decoded ahead of the playhead by the video player
+PREFETCH_SIZE = 32
+# Number of frames per model call, and policy applied when the detection lags behind the playback
+DETECTION_BATCH_SIZE = 4
+DETECTION_SKIP_POLICY = 'keep_latest'
+# Load the detection model in the background once the window is shown, instead of on the first detection
+WARM_UP_MODEL = True
+# Display backend of the image element, from DISPLAY_BACKENDS. 'auto' picks the cheaper path from the frame size
+DISPLAY_BACKEND = 'auto'
+# Size the frames are downscaled to right after decoding, the filters run on this size. None keeps the source size
+PROCESSING_SIZE = DISPLAY_SIZE
+# Show the low-resolution proxy while the slider is dragged, the frame is decoded once the slider is still
+# for SCRUB_SETTLE_TIME seconds
+USE_PROXY = True
+SCRUB_SETTLE_TIME = 0.15
+# Decode short videos once into a memory-mapped frame store, for instant frame-by-frame review
+MATERIALIZE = False
+# Interval at which the GUI checks whether the frame of a seek is decoded, in milliseconds
+SEEK_POLL_INTERVAL = 5
+# Default trade-off between detection accuracy and speed, from MOTION_GATING_PRESETS. Tunable from the Filter menu
+MOTION_GATING = 'Off'
+# Suffix of the events of the motion gating menu
+GATING_EVENT = '::-GATING-'
+# Record the duration of the stages of each frame from the start, otherwise only while the overlay is shown (P key)
+PROFILE_STAGES = False
+# Interval between two refreshes of the performance overlay, in seconds
+PROFILE_OVERLAY_INTERVAL = 0.5
+# File the stage statistics are written to when the app closes (.json or .csv), None to not write them
+PROFILE_DUMP_FILENAME = None
+# Index the detections of the whole video in the background, to jump to the next (N key) or previous (B key)
+# appearance of a class and draw their density under the slider. Only built while the Object Detection filter
+# is selected, with the model of the detection worker
+BUILD_TIMELINE = True
+# Suffix of the events of the timeline menu, and label of the entry matching any class
+TIMELINE_EVENT = '::-TIMELINE-'
+ANY_CLASS = 'Any class'
+# Height of the heatmap under the slider in pixels, and interval between two refreshes while it is built in seconds
+TIMELINE_HEATMAP_HEIGHT = 6
+TIMELINE_REFRESH_INTERVAL = 1.0
 
 
 class VideoPlayerApp:
-    def __init__(self):
+    def __init__(self, startup_profiler: Optional[StartupProfiler] = None, filename: Optional[str] = None):
+        """
+        :param startup_profiler: the profiler started with the process, to include the imports in the startup time.
+        :param filename: the video to open, the default video if None.
+        """
         self.window: sg.Window|None = None
         self.video_slider: CustomSlider|None = None
+        self.startup_profiler: StartupProfiler = startup_profiler or StartupProfiler()
+        # Selected filter and motion gating preset, disabled in the Filter menu
+        self.filter_label: str = FILTER_LABELS[0]
+        self.motion_gating: str = MOTION_GATING
+        # Duration of the stages of each frame, shown in the performance overlay
+        self.profiler: StageProfiler = StageProfiler(enabled=PROFILE_STAGES)
+        self.show_profile_overlay: bool = False
+        self.profile_overlay_time: float = 0.0
+        # Index of the detections of the video, and class of the jumps and of the heatmap
+        self.timeline: DetectionTimeline | None = None
+        self.timeline_class: str = ANY_CLASS
+        self.timeline_classes: list = []
+        self.timeline_refresh_time: float = 0.0
+        self.timeline_drawn_frames: int = -1
 
         # Build the window from layout
-        self.create_window()
+        with self.startup_profiler.step('create window'):
+            self.create_window()
 
         self.timeout: int = 0
 
         self.video_player = None
+        # Paces the playback on the wall clock, and drops the frames that cannot be shown in time
+        self.playback_clock: PlaybackClock | None = None
+        # Only the latest slider position is decoded, once the slider settles
+        self.seek_scheduler: SeekScheduler = SeekScheduler(SCRUB_SETTLE_TIME if USE_PROXY else 0.0)
+        # Export of a filtered clip, running in the background
+        self.exporter: VideoExporter | None = None
+        # Percentage of the export shown in the status text
+        self.export_progress: int | None = None
         self.image_element: sg.Image = self.window['-IMAGE-']
+        # Scale the frames once to the image element size and hand them to Tk with as few copies as possible
+        self.frame_display = create_frame_display(DISPLAY_BACKEND, self.image_element, DISPLAY_SIZE)
+        self.frame_display.profiler = self.profiler
         self.current_frame_id: int = 0
         self.frame = None
         self.ret: bool = False
         self.is_filter_applied: bool = False
-        self.filtered_image : ImageFilter = ImageFilter(self.frame)
-
-        # Load a default video file
-        self.filename: str = VIDEO_FILENAME
+        with self.startup_profiler.step('image filter'):
+            # The detection model itself is loaded lazily
+            self.filtered_image : ImageFilter = ImageFilter(self.frame)
+            self.filtered_image.start_detection_worker(DETECTION_BATCH_SIZE, DETECTION_SKIP_POLICY)
+            # The frame display takes gray frames as is, no need to convert them back to BGR
+            self.filtered_image.output_format = None
+            self.filtered_image.set_motion_gating(self.motion_gating)
+
+        # Load the given video file, or the default one
+        self.filename: str = filename or VIDEO_FILENAME
         self.update_filename(filename=self.filename)
 
     def update_filename(self, filename: str=''):
@@ -44,20 +129,47 @@ class VideoPlayerApp:
         # Update the filename
         self.filename = filename
 
+        # Release the decoder threads of the previous video
+        if self.video_player is not None:
+            self.video_player.stop_prefetch()
+            self.video_player.stop_proxy()
+            self.video_player.stop_materialize()
+        if self.timeline is not None:
+            self.timeline.stop()
+        self.seek_scheduler = SeekScheduler(self.seek_scheduler.settle_time)
+
         # Set video player with the new video file
-        self.video_player = VideoPlayer(self.filename)
+        with self.startup_profiler.step('open video'):
+            self.video_player = VideoPlayer(self.filename, prefetch_size=PREFETCH_SIZE,
+                                            processing_size=PROCESSING_SIZE, use_proxy=USE_PROXY,
+                                            materialize=MATERIALIZE)
+        # Reuse the detections already computed on this video
+        with self.startup_profiler.step('detection store'):
+            self.filtered_image.set_video(self.filename, self.video_player.get_source_scale())
+        self.timeline = DetectionTimeline(self.filename, self.video_player.num_frames,
+                                          self.filtered_image.detection_store, self.filtered_image.detect,
+                                          processing_size=PROCESSING_SIZE)
+        self.timeline_class = ANY_CLASS
+        self.timeline_classes = []
+        self.timeline_drawn_frames = -1
+        self.window['-CUST MENUBAR-'].update(menu_definition=self.get_menu_definition())
+        if self.startup_profiler.is_finished:
+            # The initial video starts its build once the window is shown
+            self.update_timeline_build()
 
         # Set the slider range
         self.video_slider.update_metadata_from_video_player(self.video_player)
 
         # Read the first frame
-        self.update_image_element()
+        with self.startup_profiler.step('first frame'):
+            self.update_image_element()
 
         # Update the slider accordingly
         self.update_slider_from_current_id()
 
-        # Set the GUI timeout
+        # Set the GUI timeout, used while the video is paused
         self.timeout = 1000 // self.video_player.fps
+        self.playback_clock = PlaybackClock(self.video_player.fps)
 
     def create_window(self):
         # Set the theme
@@ -71,15 +183,16 @@ class VideoPlayerApp:
 
         # Build the layout
         layout = [
-            [Menu([['File', ['Import', 'Save', 'Exit']],
-                   ['Filter', ['!Gray', 'Object Detection', 'Detect edges']]],  k='-CUST MENUBAR-',
-                  disabled_text_color='red')],
-            [sg.Image(key='-IMAGE-', size=(854, 480))],
+            [Menu(self.get_menu_definition(), k='-CUST MENUBAR-', disabled_text_color='red')],
+            [sg.Image(key='-IMAGE-', size=DISPLAY_SIZE)],
+            [sg.Text('', key='-PROFILE-', font=('Courier', 9), visible=False)],
             [time_elapsed_text, self.video_slider, time_remaining_text],
+            [sg.Image(key='-HEATMAP-')],
             [sg.Button(image_data=button_previous, key='-PREVIOUS-', border_width=0, button_color=button_color),
              sg.Button(image_data=play_button, key='-PLAY_PAUSE-', border_width=0, button_color=button_color),
              sg.Button(image_data=button_next, key='-NEXT-', border_width=0, button_color=button_color)],
-            [sg.Button('Apply filter - Press (F)', key='-FILTER-')]
+            [sg.Button('Apply filter - Press (F)', key='-FILTER-')],
+            [sg.Text('', key='-EXPORT_STATUS-')]
         ]
 
         # Finally, generate the window
@@ -98,19 +211,36 @@ class VideoPlayerApp:
         :return:
         """
         if ret is None and frame is None:
-            # Keep playing the video if the video player is playing
-            self.ret, self.frame = self.video_player.video_file.read()
+            # Keep playing the video if the video player is playing, the frame is popped from the prefetch ring
+            with self.profiler.stage('decode'):
+                self.ret, self.frame = self.video_player.read_next_frame()
 
         # Check if the frame was valid
         if self.ret:
             # Apply the selected filter if necessary
             if self.is_filter_applied:
-                self.frame = self.filtered_image.update_filtered_image(self.frame)
-
-            # Encode the image
-            imgbytes = cv2.imencode('.ppm', self.frame)[1].tobytes()
-            # And update the window image element
-            self.image_element.update(data=imgbytes)
+                # During playback, the detections run in the background and the latest ones are overlaid
+                try:
+                    with self.profiler.stage('filter'):
+                        self.frame = self.filtered_image.update_filtered_image(
+                            self.frame, self.video_player.get_current_frame_id(),
+                            wait_for_detections=not self.video_player.is_playing)
+                except Exception as error:
+                    self.report_filter_error(error)
+
+            # Update the window image element
+            self.frame_display.update(self.frame)
+
+    def report_filter_error(self, error: Exception):
+        """
+        Show the error of a filter, e.g. the detection model could not be loaded, and show the unfiltered frames.
+        :param error: the error raised by the filter.
+        :return:
+        """
+        self.is_filter_applied = False
+        # A failed detection worker is stopped, start a new one so the filter can be applied again
+        self.filtered_image.start_detection_worker(DETECTION_BATCH_SIZE, DETECTION_SKIP_POLICY)
+        sg.popup_error(f'The filter failed: {error}', keep_on_top=True)
 
     def update_slider_from_current_id(self):
         """
@@ -121,9 +251,9 @@ class VideoPlayerApp:
         """
         self.current_frame_id = self.video_player.get_current_frame_id()
 
-        # Update the slider value
-        self.video_slider.update(self.current_frame_id)
-        self.video_slider.update_slider_time_labels(self.current_frame_id)
+        # Update the slider value, at a lower rate during playback
+        with self.profiler.stage('slider'):
+            self.video_slider.update_position(self.current_frame_id, throttle=self.video_player.is_playing)
 
     def update_current_filter(self, event: str):
         """
@@ -134,95 +264,437 @@ class VideoPlayerApp:
         :param event: the menu event that triggered the filter change.
         :return:
         """
-        current_filter = event.lower().replace(' ', '_')
+        current_filter = get_filter_name(event)
+        self.filter_label = event
 
-        menu_definition = [['File', ['Import', 'Exit']],
-                           ['Filter', ['Gray', 'Object Detection', 'Detect edges']]]
+        self.window['-CUST MENUBAR-'].update(menu_definition=self.get_menu_definition())
+        self.filtered_image.set_filter_type(current_filter)
+        self.update_timeline_build()
+        self.refresh_frame()
 
-        # Highlight the selected filter
-        filters = ['Gray', 'Object Detection', 'Detect edges']
-        menu_definition[1][1] = [f'!{filter}' if filter == event else filter for filter in filters]
+    def refresh_frame(self):
+        """
+        Show the current frame again, e.g. once the filter changed.
 
-        self.window['-CUST MENUBAR-'].update(menu_definition=menu_definition)
-        self.filtered_image.set_filter_type(current_filter)
+        During a seek, the frame of the seek is shown with the new settings once decoded instead.
+        :return:
+        """
+        if self.seek_scheduler.is_active:
+            return
         self.ret, self.frame = self.video_player.set_current_frame_from_frame_id(self.current_frame_id)
         self.update_image_element(self.ret, self.frame)
 
+    def update_motion_gating(self, event: str):
+        """
+        Update the trade-off between accuracy and speed of the object detection.
+        :param event: the menu event that triggered the change.
+        :return:
+        """
+        self.motion_gating = event[:-len(GATING_EVENT)]
+        self.filtered_image.set_motion_gating(self.motion_gating)
+        self.window['-CUST MENUBAR-'].update(menu_definition=self.get_menu_definition())
+
+    def get_menu_definition(self) -> list:
+        """
+        Get the menu bar, with the selected filter and motion gating preset disabled.
+        """
+        filters = [f'!{label}' if label == self.filter_label else label for label in FILTER_LABELS]
+        gating = [f'!{name}{GATING_EVENT}' if name == self.motion_gating else f'{name}{GATING_EVENT}'
+                  for name in MOTION_GATING_PRESETS]
+        timeline = [f'!{label}{TIMELINE_EVENT}' if label == self.timeline_class else f'{label}{TIMELINE_EVENT}'
+                    for label in [ANY_CLASS] + self.timeline_classes]
+        return [['File', ['Import', 'Save', 'Export', 'Save profile', 'Exit']],
+                ['Filter', filters + ['Motion gating', gating]],
+                ['Timeline', timeline]]
+
+    def update_timeline_class(self, event: str):
+        """
+        Select the class of the jumps and of the heatmap.
+        :param event: the menu event that triggered the change.
+        :return:
+        """
+        self.timeline_class = event[:-len(TIMELINE_EVENT)]
+        self.window['-CUST MENUBAR-'].update(menu_definition=self.get_menu_definition())
+        self.update_timeline_heatmap()
+
+    def update_timeline_build(self):
+        """
+        Build the timeline while the Object Detection filter is selected, so the other filters never load the model.
+        :return:
+        """
+        if not BUILD_TIMELINE or self.timeline is None:
+            return
+        if self.filtered_image.filter_type == 'object_detection':
+            self.timeline.start()
+        else:
+            self.timeline.stop()
+
+    def update_timeline(self):
+        """
+        Show the progress of the timeline build: the classes found in the menu, and the heatmap.
+        """
+        now = time.monotonic()
+        if now - self.timeline_refresh_time < TIMELINE_REFRESH_INTERVAL \
+                or self.timeline.indexed_frames == self.timeline_drawn_frames:
+            return
+        self.timeline_refresh_time = now
+
+        classes = self.timeline.get_classes()
+        if classes != self.timeline_classes:
+            self.timeline_classes = classes
+            self.window['-CUST MENUBAR-'].update(menu_definition=self.get_menu_definition())
+        self.update_timeline_heatmap()
+
+    def update_timeline_heatmap(self):
+        # The heatmap spans the slider, one column per range of frames
+        self.timeline_drawn_frames = self.timeline.indexed_frames
+        width = max(self.video_slider.Widget.winfo_width(), 1)
+        heatmap = self.timeline.render_heatmap(width, TIMELINE_HEATMAP_HEIGHT, self.get_timeline_class_id())
+        self.window['-HEATMAP-'].update(data=cv2.imencode('.png', heatmap)[1].tobytes())
+
+    def get_timeline_class_id(self) -> Optional[int]:
+        if self.timeline_class == ANY_CLASS:
+            return None
+        return self.timeline.get_class_id(self.timeline_class)
+
+    def jump_to_occurrence(self, forward: bool = True):
+        """
+        Show the first frame of the next or previous appearance of the selected class, from the frames indexed so far.
+        :param forward: whether to jump to the next appearance, otherwise to the previous one.
+        :return:
+        """
+        class_id = self.get_timeline_class_id()
+        if class_id is None and self.timeline_class != ANY_CLASS:
+            return
+        if forward:
+            frame_id = self.timeline.next_occurrence(self.current_frame_id, class_id)
+        else:
+            frame_id = self.timeline.previous_occurrence(self.current_frame_id, class_id)
+        if frame_id is None:
+            return
+
+        # The jump replaces any seek of the slider still pending
+        self.seek_scheduler.cancel()
+        self.ret, self.frame = self.video_player.set_current_frame_from_frame_id(frame_id)
+        self.update_image_element(self.ret, self.frame)
+        self.update_slider_from_current_id()
+        self.restart_playback_clock()
+
     def save_current_frame(self):
         """
         Save the current displayed frame to the output folder.
 
-        It will save the image with or without the applied filter.
+        It will save the image at the source size, with or without the applied filter.
         Generate a unique filename that includes the current frame id and the current datetime.
         :return:
         """
         # Get the current frame id for reference
         current_frame_id = int(self.video_player.get_current_frame_id())
 
+        # The displayed frame is at the processing size, get the source frame back
+        frame = self.video_player.read_source_frame(current_frame_id)
+        if frame is None:
+            frame = self.frame
+        elif self.is_filter_applied:
+            # The detections are mapped back to the source coordinates
+            frame = self.filtered_image.filter_source_image(frame, current_frame_id)
+
         # Make sure the output folder exist or creates its is not created
         os.makedirs('output', exist_ok=True)
         datatime_f = datetime.now().strftime('%Y_%m_%d-%H_%M_%S_%f')
-        cv2.imwrite(f'output/frame_{current_frame_id}-{datatime_f}.png', self.frame)
-
-    def launch_app(self):
-        # Main loop
-        while True:
-            event, values = self.window.read(timeout=self.timeout)
-
-            if event in (sg.WIN_CLOSED, 'Exit'):
-                break
+        cv2.imwrite(f'output/frame_{current_frame_id}-{datatime_f}.png', frame)
 
-            elif event == 'Import':
-                file = sg.popup_get_file('Choose your file', keep_on_top=True)
-                self.update_filename(filename=file)
+    def export_video(self):
+        """
+        Export a frame range of the video, with the applied filter, in the background.
 
-            elif event in ['-PLAY_PAUSE-', ' ']:
-                self.video_player.is_playing = not self.video_player.is_playing
-                button_image = pause_button if self.video_player.is_playing else play_button
-                self.window['-PLAY_PAUSE-'].update(image_data=button_image)
+        The export has its own decoder and filter pipeline, and shares the model and the detection store of the GUI.
+        :return:
+        """
+        if self.exporter is not None:
+            sg.popup('An export is already running', keep_on_top=True)
+            return
+
+        output = sg.popup_get_file('Export to', save_as=True, default_extension='.mp4', keep_on_top=True,
+                                   file_types=[(extension[1:].upper(), f'*{extension}')
+                                               for extension in VIDEO_OUTPUT_FORMATS])
+        if not output:
+            return
+        num_frames = self.video_player.num_frames
+        frame_range = sg.popup_get_text('Frame range (start-end)',
+                                        default_text=f'{self.current_frame_id}-{num_frames}', keep_on_top=True)
+        if not frame_range:
+            return
+
+        try:
+            start, end = parse_frame_range(frame_range, num_frames)
+            filter_types = self.filtered_image.pipeline.filter_types if self.is_filter_applied else []
+            self.exporter = VideoExporter(self.filename, output, start, end, filter_types,
+                                          image_filter=self.filtered_image)
+        except ValueError as error:
+            sg.popup_error(str(error), keep_on_top=True)
+            return
+        self.export_progress = None
+        self.exporter.start()
+
+    def update_export_status(self):
+        """
+        Show the progress of the export, called on each iteration of the event loop.
+        """
+        # The text is only updated when the shown percentage changes, not on every event
+        progress = round(100 * self.exporter.get_progress()['progress'])
+        if progress != self.export_progress:
+            self.export_progress = progress
+            self.window['-EXPORT_STATUS-'].update(self.exporter.report())
+        if self.exporter.is_running:
+            return
+
+        exporter, self.exporter = self.exporter, None
+        if exporter.error is not None:
+            self.window['-EXPORT_STATUS-'].update('')
+            sg.popup_error(f'Export failed: {exporter.error}', keep_on_top=True)
+
+    def toggle_profile_overlay(self):
+        """
+        Show or hide the performance overlay, the stages are only recorded while it is shown
+        unless PROFILE_STAGES is set.
+        """
+        self.show_profile_overlay = not self.show_profile_overlay
+        self.profiler.enabled = self.show_profile_overlay or PROFILE_STAGES
+        self.window['-PROFILE-'].update(visible=self.show_profile_overlay)
+        self.profile_overlay_time = 0.0
+
+    def update_profile_overlay(self):
+        # The overlay text is refreshed at a low rate, so it does not weigh on the stages it measures
+        now = time.monotonic()
+        if now - self.profile_overlay_time < PROFILE_OVERLAY_INTERVAL:
+            return
+        self.profile_overlay_time = now
+        clock_stats = self.playback_clock.get_stats()
+        self.window['-PROFILE-'].update(f"{self.profiler.report()}\n"
+                                        f"{clock_stats['achieved_fps']:.1f}/{clock_stats['target_fps']:.1f} fps, "
+                                        f"{clock_stats['dropped_frames']} dropped frames\n"
+                                        f"{format_seek_stats(self.seek_scheduler.get_stats())}")
+
+    def save_profile(self):
+        """
+        Write the stage statistics to a .json or a .csv file chosen by the user.
+        """
+        filename = sg.popup_get_file('Save profile to', save_as=True, default_extension='.json', keep_on_top=True,
+                                     file_types=[('JSON', '*.json'), ('CSV', '*.csv')])
+        if not filename:
+            return
+        try:
+            self.profiler.dump(filename)
+        except (OSError, ValueError) as error:
+            sg.popup_error(str(error), keep_on_top=True)
+
+    def play_next_frame(self):
+        """
+        Show the frame due at the current time of the playback clock.
 
-            elif event == '-NEXT-':
-                # Set the next image
+        The frames whose time has already passed are skipped without being decoded or filtered,
+        so the playback keeps the pace of the video whatever the cost of a frame.
+        :return:
+        """
+        next_frame_id = self.video_player.next_frame_id
+        target_frame_id = self.playback_clock.get_target_frame_id()
+
+        if target_frame_id >= next_frame_id:
+            if target_frame_id >= self.video_player.num_frames > 0:
+                # End of the video
+                self.video_player.is_playing = False
+                self.playback_clock.stop()
+                self.timeout = 1000 // self.video_player.fps
+                self.window['-PLAY_PAUSE-'].update(image_data=play_button)
+                return
+
+            with self.profiler.stage('frame'):
+                self.video_player.skip_to_frame(target_frame_id)
+                # Update the image shown
                 self.update_image_element()
-                # Update the slider value
-                self.update_slider_from_current_id()
+                self.playback_clock.record_frame(self.video_player.get_current_frame_id())
 
-            elif event == '-PREVIOUS-':
-                # Set the current frame id to the previous frame
-                self.video_player.set_previous_frame()
-                # Update the image accordingly
-                self.update_image_element()
-                # Update the gui component such as the slider
+                # Update the time elapsed and remaining in the GUI
                 self.update_slider_from_current_id()
 
-            elif event == '-SLIDER-':
-                # Setting the slider id to -1 as the next frame is shown
-                current_frame_id = int(values['-SLIDER-'])
-                # And update the displayed frame
-                self.video_player.set_current_frame_id(current_frame_id)
-                # Get the new frame and update the window image element
-                self.update_image_element()
-                # Update the slider accordingly
-                self.update_slider_from_current_id()
+        # Wake up when the next frame is due
+        self.timeout = max(1, int(1000 * self.playback_clock.get_time_to_frame(self.video_player.next_frame_id)))
+
+    def preview_frame(self, frame_id: int):
+        """
+        Show the proxy thumbnail of a frame while the slider is dragged, if the proxy is available.
+        :param frame_id: the id of the frame under the slider.
+        :return:
+        """
+        thumbnail = self.video_player.read_proxy_frame(frame_id)
+        if thumbnail is not None:
+            self.frame_display.update(thumbnail)
+        self.video_slider.update_slider_time_labels(frame_id)
+
+    def update_seek(self):
+        """
+        Start the pending seek once the slider settled, and show its frame as soon as it is decoded.
 
-            elif event.lower() == 'f' or  event == '-FILTER-':
-                self.is_filter_applied = not self.is_filter_applied
-                self.ret, self.frame = self.video_player.set_current_frame_from_frame_id(self.current_frame_id)
-                self.update_image_element(self.ret, self.frame)
+        The GUI never waits for the decoder: a new slider position cancels the seek in flight,
+        and the decoder restarts from the new position.
+        :return:
+        """
+        if self.seek_scheduler.is_settled():
+            self.video_player.set_current_frame_id(self.seek_scheduler.start())
 
-            elif event.lower() == 's' or  event == 'Save':
-                self.save_current_frame()
+        if self.seek_scheduler.in_flight_frame_id is None:
+            return
+        result = self.video_player.poll_next_frame()
+        if result is None:
+            # Not decoded yet, check again on the next timeout
+            return
 
-            elif event in ['Gray', 'Object Detection', 'Detect edges']:
-                self.update_current_filter(event)
+        self.ret, self.frame = result
+        self.update_image_element(self.ret, self.frame)
+        latency = self.seek_scheduler.finish()
+        if latency is not None:
+            self.profiler.record('seek', latency)
+        # Update the slider accordingly
+        self.update_slider_from_current_id()
+        self.timeout = 1000 // self.video_player.fps
+        self.restart_playback_clock()
 
-            elif self.video_player and self.video_player.is_playing:
-                # Update the image shown
-                self.update_image_element()
+    def restart_playback_clock(self):
+        # After a seek during playback, the playback goes on from the new position
+        if self.video_player.is_playing:
+            self.playback_clock.start(self.video_player.next_frame_id)
 
-                # Update the time elapsed and remaining in the GUI
+    def handle_event(self, event, values: dict) -> bool:
+        """
+        Handle an event of the window.
+        :param event: the event read from the window, the timeout event when no user input came.
+        :param values: the values of the window elements.
+        :return: False if the window is closed.
+        """
+        if event in (sg.WIN_CLOSED, 'Exit'):
+            return False
+
+        if event == 'Import':
+            file = sg.popup_get_file('Choose your file', keep_on_top=True)
+            self.update_filename(filename=file)
+
+        elif event in ['-PLAY_PAUSE-', ' ']:
+            self.video_player.is_playing = not self.video_player.is_playing
+            button_image = pause_button if self.video_player.is_playing else play_button
+            self.window['-PLAY_PAUSE-'].update(image_data=button_image)
+            if self.video_player.is_playing:
+                self.playback_clock.start(self.video_player.next_frame_id)
+            else:
+                self.playback_clock.stop()
+                self.timeout = 1000 // self.video_player.fps
+                # The slider moves at a lower rate during playback, catch up with the shown frame
                 self.update_slider_from_current_id()
 
+        elif event == '-NEXT-':
+            self.seek_scheduler.cancel()
+            # Set the next image
+            self.update_image_element()
+            # Update the slider value
+            self.update_slider_from_current_id()
+            self.restart_playback_clock()
+
+        elif event == '-PREVIOUS-':
+            self.seek_scheduler.cancel()
+            # Set the current frame id to the previous frame
+            self.video_player.set_previous_frame()
+            # Update the image accordingly
+            self.update_image_element()
+            # Update the gui component such as the slider
+            self.update_slider_from_current_id()
+            self.restart_playback_clock()
+
+        elif event == '-SLIDER-':
+            # The slider value is the id of the frame to show, the seek itself is coalesced with the next ones
+            current_frame_id = int(values['-SLIDER-'])
+            self.preview_frame(current_frame_id)
+            self.seek_scheduler.request(current_frame_id)
+            self.timeout = SEEK_POLL_INTERVAL
+
+        elif event.lower() == 'f' or  event == '-FILTER-':
+            self.is_filter_applied = not self.is_filter_applied
+            self.refresh_frame()
+
+        elif event.lower() == 's' or  event == 'Save':
+            self.save_current_frame()
+
+        elif event == 'Export':
+            self.export_video()
+
+        elif event.lower() == 'p':
+            self.toggle_profile_overlay()
+
+        elif event == 'Save profile':
+            self.save_profile()
+
+        elif event.lower() == 'n':
+            self.jump_to_occurrence(forward=True)
+
+        elif event.lower() == 'b':
+            self.jump_to_occurrence(forward=False)
+
+        elif event in FILTER_LABELS:
+            self.update_current_filter(event)
+
+        elif event.endswith(GATING_EVENT):
+            self.update_motion_gating(event)
+
+        elif event.endswith(TIMELINE_EVENT):
+            self.update_timeline_class(event)
+
+        elif self.video_player and self.video_player.is_playing and not self.seek_scheduler.is_active:
+            self.play_next_frame()
+
+        return True
+
+    def launch_app(self):
+        # Main loop
+        while True:
+            event, values = self.window.read(timeout=self.timeout)
+
+            if not self.startup_profiler.is_finished:
+                # The window and the first frame are now shown
+                self.startup_profiler.finish()
+                print(self.startup_profiler.report())
+                if WARM_UP_MODEL:
+                    self.filtered_image.warm_up_model()
+                self.update_timeline_build()
+
+            if self.exporter is not None:
+                self.update_export_status()
+
+            if self.show_profile_overlay:
+                self.update_profile_overlay()
+
+            if BUILD_TIMELINE and self.timeline is not None:
+                self.update_timeline()
+
+            if not self.handle_event(event, values):
+                break
+
+            # Polled after every event, so a pending seek neither swallows the user input nor waits for a timeout
+            if self.seek_scheduler.is_active:
+                self.update_seek()
+
+        if self.exporter is not None:
+            self.exporter.stop()
+        if self.timeline is not None:
+            self.timeline.stop()
+        if PROFILE_DUMP_FILENAME is not None and self.profiler.histograms:
+            self.profiler.dump(PROFILE_DUMP_FILENAME)
+        seek_stats = self.seek_scheduler.get_stats()
+        if seek_stats['requests']:
+            print(f"Seeking: {format_seek_stats(seek_stats)}")
+        gating_stats = self.filtered_image.get_motion_gate_stats()
+        if gating_stats['frames']:
+            print(f"Motion gating: {gating_stats['skip_rate']:.0%} of the detections skipped, "
+                  f"{gating_stats['region_rate']:.0%} run on a region only")
+        self.filtered_image.close()
         self.window.close()
 
 if __name__ == "__main__":
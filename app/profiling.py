@@ -0,0 +1,191 @@
+import csv
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+class StartupProfiler:
+    """
+    Record the duration of each startup step, from the creation of the profiler to the first frame shown.
+
+    Once finished, the profiler ignores the new steps, so the code shared with later actions
+    (e.g. loading another video) is only recorded at startup.
+    """
+    def __init__(self):
+        self.start_time: float = time.perf_counter()
+        self.steps: list = []
+        self.total_time: float | None = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.total_time is not None
+
+    @contextmanager
+    def step(self, name: str):
+        """
+        Context manager timing a startup step.
+        :param name: the name of the step.
+        """
+        if self.is_finished:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def finish(self) -> None:
+        if not self.is_finished:
+            self.total_time = time.perf_counter() - self.start_time
+
+    def as_dict(self) -> dict:
+        return {'steps': dict(self.steps), 'total_time': self.total_time}
+
+    def report(self) -> str:
+        """
+        Format the startup-time breakdown, one step per line.
+        """
+        lines = ["Startup time breakdown:"]
+        lines += [f"  {name:<20} {duration * 1000:8.1f} ms" for name, duration in self.steps]
+        if self.is_finished:
+            lines.append(f"  {'total':<20} {self.total_time * 1000:8.1f} ms")
+        return '\n'.join(lines)
+
+
+# Number of samples kept per stage, the percentiles are computed over this rolling window
+PROFILE_WINDOW = 600
+# Percentiles reported per stage
+PROFILE_PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """
+    Rolling window of the durations of one stage, in a preallocated ring so recording a sample never allocates.
+    """
+    def __init__(self, window: int = PROFILE_WINDOW):
+        self.samples: np.ndarray = np.zeros(max(1, window), np.float64)
+        # Total number of samples recorded, the ring holds the last len(samples) ones
+        self.count: int = 0
+        self.total_time: float = 0.0
+
+    def record(self, duration: float) -> None:
+        self.samples[self.count % len(self.samples)] = duration
+        self.count += 1
+        self.total_time += duration
+
+    def get_stats(self) -> dict:
+        """
+        Get the count, the mean over all the samples, and the percentiles and maximum over the window,
+        in milliseconds.
+        """
+        window = 1000 * self.samples[:min(self.count, len(self.samples))]
+        if not len(window):
+            return {'count': 0, 'mean_ms': 0.0, **{f'p{percentile}_ms': 0.0 for percentile in PROFILE_PERCENTILES},
+                    'max_ms': 0.0}
+
+        percentiles = np.percentile(window, PROFILE_PERCENTILES)
+        return {'count': self.count,
+                'mean_ms': 1000 * self.total_time / self.count,
+                **{f'p{percentile}_ms': float(value) for percentile, value in zip(PROFILE_PERCENTILES, percentiles)},
+                'max_ms': float(window.max())}
+
+
+class StageProfiler:
+    """
+    Record the duration of the stages of the hot path (decode, filter, display...) on a monotonic clock.
+
+    Each stage keeps a rolling histogram of its last durations, reported as percentiles.
+    A disabled profiler hands out a shared no-op context manager, so the instrumented code costs one attribute
+    check per stage.
+    """
+    def __init__(self, enabled: bool = False, window: int = PROFILE_WINDOW, clock=time.perf_counter):
+        """
+        :param enabled: whether to record the stages.
+        :param window: the number of samples kept per stage.
+        :param clock: the monotonic clock, in seconds.
+        """
+        self.enabled: bool = enabled
+        self.window: int = window
+        self.clock = clock
+        self.histograms: dict = {}
+
+    @contextmanager
+    def _timed_stage(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, self.clock() - start)
+
+    def stage(self, name: str):
+        """
+        Context manager timing one run of a stage.
+        :param name: the name of the stage.
+        """
+        if not self.enabled:
+            return _NO_STAGE
+        return self._timed_stage(name)
+
+    def record(self, name: str, duration: float) -> None:
+        """
+        Record a duration measured by the caller.
+        :param name: the name of the stage.
+        :param duration: the duration, in seconds.
+        """
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram(self.window)
+        histogram.record(duration)
+
+    def reset(self) -> None:
+        self.histograms = {}
+
+    def get_stats(self) -> dict:
+        """
+        Get the statistics of each stage, in the order the stages were first recorded.
+        """
+        return {name: histogram.get_stats() for name, histogram in self.histograms.items()}
+
+    def report(self) -> str:
+        """
+        Format the statistics, one stage per line.
+        """
+        lines = [f"{'stage':<12}{'count':>7}" + ''.join(f"{f'p{percentile}':>8}" for percentile in PROFILE_PERCENTILES)
+                 + f"{'max':>8}"]
+        for name, stats in self.get_stats().items():
+            lines.append(f"{name:<12}{stats['count']:>7}"
+                         + ''.join(f"{stats[f'p{percentile}_ms']:8.1f}" for percentile in PROFILE_PERCENTILES)
+                         + f"{stats['max_ms']:8.1f}")
+        return '\n'.join(lines)
+
+    def dump(self, filename: str) -> None:
+        """
+        Write the statistics to a .json or a .csv file, one row per stage.
+        :param filename: the output filepath.
+        """
+        stats = self.get_stats()
+        extension = os.path.splitext(filename)[1]
+        if extension == '.json':
+            with open(filename, 'w') as dump_file:
+                json.dump({'platform': platform.platform(), 'stages': stats}, dump_file, indent=2)
+        elif extension == '.csv':
+            columns = ['count', 'mean_ms'] + [f'p{percentile}_ms' for percentile in PROFILE_PERCENTILES] + ['max_ms']
+            with open(filename, 'w', newline='') as dump_file:
+                writer = csv.writer(dump_file)
+                writer.writerow(['stage'] + columns)
+                for name, stage_stats in stats.items():
+                    writer.writerow([name] + [stage_stats[column] for column in columns])
+        else:
+            raise ValueError("Invalid profile format. Supported formats are: .json, .csv")
+
+
+# Context manager of the stages of a disabled profiler
+_NO_STAGE = nullcontext()
@@ -0,0 +1,91 @@
+"""
+Command line client of the review server, to drive it over the loopback interface and measure the frame rate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+from app.components.review_session import unpack_frame
+
+# Address of the review server, see app.server
+SERVER_URL = 'ws://127.0.0.1:8000/ws'
+
+
+async def review(url: str, video: str, filters: list = (), seek: int = 0, play_time: float = 0.0,
+                 output: str = None) -> dict:
+    """
+    Open a video on the review server, apply filters, seek, and play it for a while.
+    :param url: the WebSocket url of the server.
+    :param video: the name of the video in the folder of the server.
+    :param filters: the filters to apply.
+    :param seek: the frame to start from.
+    :param play_time: the playback duration, in seconds.
+    :param output: the folder the received frames are saved to, None to not save them.
+    :return: the metadata of the video, the number of frames received and their rate.
+    """
+    import websockets
+
+    if output:
+        os.makedirs(output, exist_ok=True)
+
+    async with websockets.connect(f'{url}?{urlencode({"video": video})}', max_size=None) as websocket:
+        metadata = json.loads(await websocket.recv())
+        if metadata['type'] == 'error':
+            raise ValueError(metadata['message'])
+
+        if filters:
+            await websocket.send(json.dumps({'type': 'filter', 'filters': list(filters)}))
+        if seek:
+            await websocket.send(json.dumps({'type': 'seek', 'frame_id': seek}))
+        if play_time > 0:
+            await websocket.send(json.dumps({'type': 'play'}))
+
+        frames = 0
+        last_frame_id = None
+        start_time = time.perf_counter()
+        # Without playback, only the frames of the commands are expected
+        deadline = start_time + (play_time if play_time > 0 else 1.0)
+        while time.perf_counter() < deadline:
+            try:
+                message = await asyncio.wait_for(websocket.recv(), deadline - time.perf_counter())
+            except asyncio.TimeoutError:
+                break
+            if isinstance(message, str):
+                reply = json.loads(message)
+                if reply['type'] == 'error':
+                    print(f"Server error: {reply['message']}")
+                if reply['type'] == 'ended':
+                    break
+                continue
+
+            last_frame_id, jpeg = unpack_frame(message)
+            frames += 1
+            if output:
+                with open(os.path.join(output, f'{last_frame_id:06d}.jpg'), 'wb') as file:
+                    file.write(jpeg)
+        elapsed_time = time.perf_counter() - start_time
+
+    return {'metadata': metadata, 'frames': frames, 'last_frame_id': last_frame_id,
+            'fps': frames / elapsed_time if elapsed_time > 0 else 0.0}
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description="Drive the review server and measure the received frame rate.")
+    parser.add_argument('video', help="the name of the video in the folder of the server")
+    parser.add_argument('--url', default=SERVER_URL, help="the WebSocket url of the server")
+    parser.add_argument('--filter', action='append', default=[], help="a filter to apply, can be repeated")
+    parser.add_argument('--seek', type=int, default=0, help="the frame to start from")
+    parser.add_argument('--play', type=float, default=0.0, help="the playback duration, in seconds")
+    parser.add_argument('--output', default=None, help="the folder the received frames are saved to")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(review(args.url, args.video, args.filter, args.seek, args.play, args.output))
+    print(f"{result['metadata']['num_frames']} frames at {result['metadata']['fps']:.1f} fps, "
+          f"received {result['frames']} frames at {result['fps']:.1f} fps, last frame {result['last_frame_id']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Remote review server: stream the filtered frames of the videos of a folder over WebSocket.
+
+The clients connect to /ws?video=<name>, receive the metadata of the video as JSON, then the frames as binary
+messages (the frame id as a big-endian int64, followed by the JPEG data). They drive the playback with JSON
+commands: {"type": "seek", "frame_id": 100}, {"type": "play"}, {"type": "pause"},
+{"type": "filter", "filters": ["object_detection"]}.
+The clients watching the same video share its decoder, its model and its cache of encoded frames.
+"""
+import argparse
+import asyncio
+
+from app.components.review_session import ReviewClient, VideoRegistry
+
+# Folder of the videos served, and address of the server. Only the loopback interface by default
+VIDEO_FOLDER = 'data'
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8000
+
+
+def create_app(video_folder: str = VIDEO_FOLDER, registry: VideoRegistry = None):
+    """
+    Create the FastAPI application of the review server.
+    :param video_folder: the folder of the videos served.
+    :param registry: the registry of the opened videos, created on the folder if None.
+    :return: the application.
+    """
+    from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+    app = FastAPI(title="EnAcuity review server")
+    app.state.registry = registry or VideoRegistry(video_folder)
+
+    @app.get('/videos')
+    async def list_videos():
+        return app.state.registry.list_videos()
+
+    @app.get('/stats')
+    async def get_stats():
+        return app.state.registry.get_stats()
+
+    @app.websocket('/ws')
+    async def review(websocket: WebSocket, video: str):
+        await websocket.accept()
+        try:
+            shared_video = await app.state.registry.acquire(video)
+        except ValueError as error:
+            await websocket.send_json({'type': 'error', 'message': str(error)})
+            await websocket.close()
+            return
+
+        client = ReviewClient(shared_video, websocket.send_bytes, websocket.send_json)
+        sender = asyncio.create_task(client.send_frames())
+        try:
+            await client.send_json({'type': 'metadata', **shared_video.get_metadata()})
+            await client.show(0)
+            while True:
+                # Read the raw message: a malformed one gets an error reply instead of ending the session
+                message = await websocket.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                await client.handle_message(message.get('text'))
+        except WebSocketDisconnect:
+            pass
+        finally:
+            await client.pause()
+            sender.cancel()
+            await app.state.registry.release(shared_video)
+
+    return app
+
+
+def main(argv: list = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stream the filtered frames of a folder of videos over WebSocket.")
+    parser.add_argument('--videos', default=VIDEO_FOLDER, help="the folder of the videos served")
+    parser.add_argument('--host', default=SERVER_HOST, help="the interface to listen on")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+
+    uvicorn.run(create_app(args.videos), host=args.host, port=args.port)
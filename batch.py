@@ -0,0 +1,4 @@
+from app.batch_processing import main
+
+if __name__ == "__main__":
+    main()
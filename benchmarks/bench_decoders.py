@@ -0,0 +1,59 @@
+"""
+Compare the decoder backends on sequential playback and random seeks.
+
+Run from the repository root: python -m benchmarks.bench_decoders [--video data/video01_cropped.mp4] [--frames 300]
+Only the backends whose dependencies are installed are measured.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.components.decoders import PIXEL_FORMATS, get_available_backends
+from app.components.video_player import VideoPlayer
+
+VIDEO_FILENAME = 'data/video01_cropped.mp4'
+# Decoding threads measured for each backend, 0 lets the backend choose
+THREAD_COUNTS = [1, 0]
+
+
+def run(video: str = VIDEO_FILENAME, nb_frames: int = 300, nb_seeks: int = 30) -> dict:
+    results = {}
+    for backend in get_available_backends():
+        for threads in THREAD_COUNTS:
+            for pixel_format in PIXEL_FORMATS:
+                # No frame cache, every frame is decoded
+                video_player = VideoPlayer(video, frame_cache_bytes=0, use_proxy=False, decoder=backend,
+                                           decode_threads=threads, pixel_format=pixel_format)
+
+                start = time.perf_counter()
+                nb_decoded = 0
+                for _ in range(nb_frames):
+                    if not video_player.read_next_frame()[0]:
+                        break
+                    nb_decoded += 1
+                sequential_time = time.perf_counter() - start
+
+                # The same random targets for every backend
+                targets = np.random.default_rng(0).integers(0, max(video_player.num_frames, 1), nb_seeks)
+                start = time.perf_counter()
+                for frame_id in targets:
+                    video_player.decode_frame(int(frame_id))
+                seek_time = time.perf_counter() - start
+
+                results[(backend, threads, pixel_format)] = {
+                    'sequential_fps': nb_decoded / sequential_time if sequential_time > 0 else 0.0,
+                    'seeks_per_second': nb_seeks / seek_time if seek_time > 0 else 0.0}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--video', default=VIDEO_FILENAME)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--seeks', type=int, default=30)
+    args = parser.parse_args()
+
+    for (backend, threads, pixel_format), stats in run(args.video, args.frames, args.seeks).items():
+        print(f"{backend:<8} threads={threads or 'auto':<5} {pixel_format:<5} "
+              f"sequential {stats['sequential_fps']:7.1f} fps  random seek {stats['seeks_per_second']:6.1f} /s")
@@ -0,0 +1,75 @@
+"""
+Compare the per-frame cost of the display backends on 1080p input, on frames at the display size (the frames
+of the GUI are downscaled to the display size right after decoding), and on frames smaller than the display.
+
+Run from the repository root: python -m benchmarks.bench_display [--frames 200]
+The Tk part is only measured when a display is available.
+"""
+import argparse
+import time
+import tkinter as tk
+
+import numpy as np
+
+from app.components.frame_display import DISPLAY_BACKENDS, DISPLAY_SIZE, create_frame_display
+
+
+class TkImageElement:
+    """Minimal stand-in for sg.Image, backed by a Tk label."""
+    def __init__(self, root):
+        self.label = tk.Label(root)
+        self.label.pack()
+
+    def update(self, data=None):
+        image = tk.PhotoImage(data=data) if isinstance(data, bytes) else data
+        self.label.configure(image=image)
+        self.label.image = image
+
+
+def run(nb_frames: int = 200, frame_size: tuple = (1920, 1080)) -> dict:
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (frame_size[1], frame_size[0], 3), dtype=np.uint8) for _ in range(4)]
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError:
+        root = None
+
+    results = {}
+    for backend in DISPLAY_BACKENDS:
+        image_element = TkImageElement(root) if root is not None else None
+        frame_display = create_frame_display(backend, image_element, DISPLAY_SIZE)
+        if root is None:
+            # Without a display, only the numpy part is measured
+            results[backend] = timed_prepare(frame_display, frames, nb_frames)
+            continue
+
+        for frame_id in range(nb_frames):
+            frame_display.update(frames[frame_id % len(frames)])
+            root.update_idletasks()
+        results[backend] = frame_display.get_stats()
+
+    if root is not None:
+        root.destroy()
+    return results
+
+
+def timed_prepare(frame_display, frames: list, nb_frames: int) -> dict:
+    start = time.perf_counter()
+    for frame_id in range(nb_frames):
+        frame_display.prepare(frames[frame_id % len(frames)])
+    prepare_ms = 1000 * (time.perf_counter() - start) / nb_frames
+    return {'frames': nb_frames, 'prepare_ms': prepare_ms, 'show_ms': float('nan'), 'total_ms': prepare_ms}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+
+    for frame_size in [(1920, 1080), DISPLAY_SIZE, (640, 360)]:
+        print(f"{frame_size[0]}x{frame_size[1]} input")
+        for backend, stats in run(args.frames, frame_size).items():
+            print(f"{backend:<12} prepare {stats['prepare_ms']:6.2f} ms  show {stats['show_ms']:6.2f} ms  "
+                  f"total {stats['total_ms']:6.2f} ms per frame")
@@ -0,0 +1,70 @@
+"""
+Measure the per-frame cost of the edge filters, and check they keep up with the frame rate of the video.
+
+Run from the repository root: python -m benchmarks.bench_edges [--video path] [--frames 300]
+Without a video, synthetic frames at the display size are filtered and compared to a 30 fps source.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.components.filter_pipeline import FilterContext, FilterPipeline
+from app.components.frame_display import DISPLAY_SIZE
+from app.components.video_player import VideoPlayer
+
+EDGE_FILTERS = ['detect_edges', 'smoothed_edges']
+# Frame rate the synthetic frames are compared to
+SYNTHETIC_FPS = 30.0
+
+
+def load_frames(video: str, nb_frames: int, processing_size: tuple) -> tuple:
+    """
+    Decode the frames before the measure, so only the filter is timed.
+    :return: the frames and the frame rate of the source.
+    """
+    if video is None:
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (processing_size[1], processing_size[0], 3), dtype=np.uint8)
+                  for _ in range(8)]
+        return frames, SYNTHETIC_FPS
+
+    video_player = VideoPlayer(video, keyframe_sidecar=False, frame_cache_bytes=0, processing_size=processing_size)
+    frames = []
+    for _ in range(nb_frames):
+        ret, frame = video_player.read_next_frame()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames, video_player.fps
+
+
+def run(video: str = None, nb_frames: int = 300, processing_size: tuple = DISPLAY_SIZE) -> dict:
+    frames, source_fps = load_frames(video, nb_frames, processing_size)
+
+    results = {}
+    for filter_type in EDGE_FILTERS:
+        pipeline = FilterPipeline([filter_type])
+        start = time.perf_counter()
+        for frame_id in range(nb_frames):
+            frame = frames[frame_id % len(frames)]
+            pipeline.run(frame, FilterContext(frame, frame_id))
+        elapsed_time = time.perf_counter() - start
+
+        fps = nb_frames / elapsed_time
+        results[filter_type] = {'ms_per_frame': 1000 * elapsed_time / nb_frames,
+                                'fps': fps,
+                                'source_fps': source_fps,
+                                'real_time': fps >= source_fps}
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--frames', type=int, default=300)
+    args = parser.parse_args()
+
+    for filter_type, stats in run(args.video, args.frames).items():
+        print(f"{filter_type:<16} {stats['ms_per_frame']:6.2f} ms per frame  {stats['fps']:6.1f} fps  "
+              f"(source {stats['source_fps']:.1f} fps, {'real time' if stats['real_time'] else 'too slow'})")
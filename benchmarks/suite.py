@@ -0,0 +1,273 @@
+"""
+Reproducible benchmark suite: sequential decode, random seeks, filters, object detection and display encode.
+
+Run from the repository root: python -m benchmarks.suite [--output results.json] [--quick]
+The suite runs on data/video01_cropped.mp4 when it is available, and on synthetic videos generated at several
+resolutions and GOP lengths. The results are compared to the stored baseline (benchmarks/baseline.json), the exit
+code is 1 if a metric regressed by more than the tolerance. Store the results of the reference machine as the
+baseline with --save-baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from app.components.frame_display import DISPLAY_BACKENDS, DISPLAY_SIZE, create_frame_display
+from app.components.image_filter import FILTER_LIST, ImageFilter
+from app.components.keyframe_index import KeyframeIndex
+from app.components.video_player import VideoPlayer
+
+VIDEO_FILENAME = 'data/video01_cropped.mp4'
+BASELINE_FILENAME = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Synthetic videos: (width, height, GOP length)
+SYNTHETIC_VIDEOS = [(640, 360, 1), (1280, 720, 12), (1920, 1080, 12), (1280, 720, 60)]
+# Without PyAV, OpenCV cannot set the GOP length: a GOP of 1 is written as MJPG, a GOP of MP4V_GOP with mp4v,
+# the other GOP lengths are skipped
+MP4V_GOP = 12
+SYNTHETIC_FPS = 25
+# Relative change of a metric above which it is reported as a regression
+REGRESSION_TOLERANCE = 0.2
+# Batch size of the detection throughput, the batch size of the GUI detection worker
+DETECTION_BATCH_SIZE = 4
+
+
+def make_synthetic_video(filename: str, size: tuple, nb_frames: int, gop: int) -> str:
+    """
+    Write a video of a moving textured pattern, so the decoder has real motion to decode.
+    :param filename: the output filepath, its extension is replaced to match the codec.
+    :param size: the (width, height) of the frames.
+    :param nb_frames: the number of frames.
+    :param gop: the requested distance between two keyframes.
+    :return: the filepath of the written video, None if the GOP length cannot be written without PyAV.
+    """
+    width, height = size
+    rng = np.random.default_rng(0)
+    texture = cv2.resize(rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8), (width * 2, height),
+                         interpolation=cv2.INTER_LINEAR)
+    frames = (texture[:, frame_id * 4 % width:frame_id * 4 % width + width] for frame_id in range(nb_frames))
+
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    if av is not None:
+        filename = os.path.splitext(filename)[0] + '.mp4'
+        with av.open(filename, 'w') as container:
+            stream = container.add_stream('mpeg4', rate=SYNTHETIC_FPS)
+            stream.width, stream.height, stream.pix_fmt = width, height, 'yuv420p'
+            stream.codec_context.gop_size = gop
+            for frame in frames:
+                container.mux(stream.encode(av.VideoFrame.from_ndarray(np.ascontiguousarray(frame), format='bgr24')))
+            container.mux(stream.encode())
+        return filename
+
+    if gop not in (1, MP4V_GOP):
+        return None
+    extension, fourcc = ('.avi', 'MJPG') if gop == 1 else ('.mp4', 'mp4v')
+    filename = os.path.splitext(filename)[0] + extension
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*fourcc), SYNTHETIC_FPS, (width, height))
+    for frame in frames:
+        writer.write(np.ascontiguousarray(frame))
+    writer.release()
+    return filename
+
+
+def bench_decode(video: str, nb_frames: int, nb_seeks: int) -> dict:
+    """
+    Measure the sequential decode throughput and the latency of random seeks, without any cache.
+    """
+    video_player = VideoPlayer(video, keyframe_sidecar=False, frame_cache_bytes=0, use_metadata_cache=False)
+
+    start = time.perf_counter()
+    nb_decoded = 0
+    for _ in range(nb_frames):
+        if not video_player.read_next_frame()[0]:
+            break
+        nb_decoded += 1
+    sequential_time = time.perf_counter() - start
+
+    # The same random targets on every run
+    targets = np.random.default_rng(0).integers(0, max(video_player.num_frames, 1), nb_seeks)
+    latencies = []
+    for frame_id in targets:
+        start = time.perf_counter()
+        video_player.decode_frame(int(frame_id))
+        latencies.append(1000 * (time.perf_counter() - start))
+
+    keyframes = video_player.keyframe_index.keyframes if video_player.keyframe_index is not None else []
+    return {'decode_fps': nb_decoded / sequential_time if sequential_time > 0 else 0.0,
+            'seek_mean_ms': float(np.mean(latencies)),
+            'seek_p95_ms': float(np.percentile(latencies, 95)),
+            'gop': video_player.num_frames / len(keyframes) if len(keyframes) else 0.0}
+
+
+def load_frames(video: str, nb_frames: int) -> list:
+    # Decoded before the measures, so only the filters and the display are timed
+    video_player = VideoPlayer(video, keyframe_sidecar=False, frame_cache_bytes=0, use_metadata_cache=False,
+                               processing_size=DISPLAY_SIZE)
+    frames = []
+    for _ in range(nb_frames):
+        ret, frame = video_player.read_next_frame()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames
+
+
+def bench_filters(frames: list) -> dict:
+    """
+    Measure the per-frame cost of each filter mode, and the throughput of the detection model.
+    The model metrics are skipped when the model cannot be loaded.
+    """
+    results = {}
+    for filter_type in FILTER_LIST:
+        image_filter = ImageFilter()
+        image_filter.set_filter_type(filter_type)
+        if filter_type == 'object_detection':
+            try:
+                # Load the model before the measure
+                image_filter.predict(frames[:1], verbose=False)
+            except Exception as error:
+                print(f"Skipping the object detection: {error}", file=sys.stderr)
+                continue
+
+        start = time.perf_counter()
+        for frame_id, frame in enumerate(frames):
+            image_filter.update_filtered_image(frame, frame_id)
+        results[f'filter/{filter_type}_ms'] = 1000 * (time.perf_counter() - start) / len(frames)
+
+        if filter_type == 'object_detection':
+            batches = [frames[index:index + DETECTION_BATCH_SIZE]
+                       for index in range(0, len(frames), DETECTION_BATCH_SIZE)]
+            start = time.perf_counter()
+            for batch in batches:
+                image_filter.predict(batch, conf=image_filter.confidence, verbose=False)
+            results['detection/batch_fps'] = len(frames) / (time.perf_counter() - start)
+    return results
+
+
+def bench_display(frames: list) -> dict:
+    """
+    Measure the encode cost of each display backend, the Tk part needs a display and is not measured.
+    """
+    results = {}
+    for backend in DISPLAY_BACKENDS:
+        frame_display = create_frame_display(backend, None, DISPLAY_SIZE)
+        start = time.perf_counter()
+        for frame in frames:
+            frame_display.prepare(frame)
+        results[f'display/{backend}_ms'] = 1000 * (time.perf_counter() - start) / len(frames)
+    return results
+
+
+def run(video: str = VIDEO_FILENAME, nb_frames: int = 300, nb_seeks: int = 30,
+        synthetic_videos: list = SYNTHETIC_VIDEOS) -> dict:
+    """
+    Run the whole suite.
+    :param video: the reference video, skipped if it cannot be decoded.
+    :param nb_frames: the number of frames decoded and filtered per video.
+    :param nb_seeks: the number of random seeks per video.
+    :param synthetic_videos: the (width, height, gop) of the generated videos.
+    :return: the environment and the metrics, the metrics ending with _fps are better higher,
+        the ones ending with _ms are better lower.
+    """
+    metrics = {}
+    with tempfile.TemporaryDirectory() as folder:
+        videos = {}
+        if KeyframeIndex.load_or_build(video, use_sidecar=False).num_frames > 0:
+            videos[os.path.splitext(os.path.basename(video))[0]] = video
+        else:
+            print(f"Skipping {video}, it cannot be decoded", file=sys.stderr)
+        for width, height, gop in synthetic_videos:
+            name = f'synthetic-{width}x{height}-gop{gop}'
+            filename = make_synthetic_video(os.path.join(folder, name), (width, height), nb_frames, gop)
+            if filename is None:
+                print(f"Skipping {name}, the GOP length can only be set with PyAV", file=sys.stderr)
+                continue
+            videos[name] = filename
+
+        for name, filename in videos.items():
+            decode = bench_decode(filename, nb_frames, nb_seeks)
+            metrics[f'decode/{name}/sequential_fps'] = decode['decode_fps']
+            metrics[f'seek/{name}/mean_ms'] = decode['seek_mean_ms']
+            metrics[f'seek/{name}/p95_ms'] = decode['seek_p95_ms']
+            print(f"{name:<32} measured GOP {decode['gop']:5.1f}", file=sys.stderr)
+
+        # The filters and the display run on the frames of the first video, at the display size
+        frames = load_frames(next(iter(videos.values())), min(nb_frames, 100))
+        metrics.update(bench_filters(frames))
+        metrics.update(bench_display(frames))
+
+    return {'environment': {'platform': platform.platform(), 'python': platform.python_version(),
+                            'opencv': cv2.__version__, 'cpu_count': os.cpu_count()},
+            'metrics': metrics}
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """
+    Compare metrics to a baseline.
+    :param metrics: the current metrics.
+    :param baseline: the metrics of the baseline.
+    :param tolerance: the relative change above which a metric is a regression.
+    :return: the (name, baseline value, current value, relative change) of the regressions, the change is
+        positive when the metric got worse.
+    """
+    regressions = []
+    for name, value in metrics.items():
+        baseline_value = baseline.get(name)
+        if not baseline_value:
+            continue
+        if name.endswith('_fps'):
+            change = (baseline_value - value) / baseline_value
+        elif name.endswith('_ms'):
+            change = (value - baseline_value) / baseline_value
+        else:
+            continue
+        if change > tolerance:
+            regressions.append((name, baseline_value, value, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default=VIDEO_FILENAME)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--seeks', type=int, default=30)
+    parser.add_argument('--quick', action='store_true', help="fewer frames and only the smallest synthetic video")
+    parser.add_argument('--output', help="the .json file the results are written to")
+    parser.add_argument('--baseline', default=BASELINE_FILENAME)
+    parser.add_argument('--save-baseline', action='store_true', help="store the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.quick:
+        results = run(args.video, min(args.frames, 60), min(args.seeks, 10), SYNTHETIC_VIDEOS[:1])
+    else:
+        results = run(args.video, args.frames, args.seeks)
+
+    for name, value in results['metrics'].items():
+        print(f"{name:<48} {value:10.2f}")
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, store one with --save-baseline")
+        sys.exit(0)
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    regressions = compare(results['metrics'], baseline['metrics'], args.tolerance)
+    for name, baseline_value, value, change in regressions:
+        print(f"REGRESSION {name}: {baseline_value:.2f} -> {value:.2f} ({change:+.0%})")
+    sys.exit(1 if regressions else 0)
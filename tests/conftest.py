@@ -0,0 +1,42 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app.components import detection_store, frame_store, keyframe_index, video_probe
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Fixture moving the user caches to the temporary folder of the test, so the tests never touch ~/.cache."""
+    home = tmp_path / "home"
+    cache_root = home / ".cache" / "enacuity"
+    # The spawned batch workers import the modules again, they find the same caches through the home folder
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.setattr(keyframe_index, 'KEYFRAME_INDEX_ROOT', os.path.join(cache_root, 'keyframes'))
+    monkeypatch.setattr(video_probe, 'METADATA_CACHE_FILENAME', os.path.join(cache_root, 'metadata.json'))
+    monkeypatch.setattr(video_probe, '_metadata_cache', None)
+    monkeypatch.setattr(detection_store, 'DETECTION_STORE_ROOT', os.path.join(cache_root, 'detections'))
+    monkeypatch.setattr(frame_store, 'FRAME_STORE_ROOT', os.path.join(cache_root, 'frames'))
+    yield cache_root
+
+
+@pytest.fixture
+def make_video(tmp_path):
+    """Fixture returning a function writing a small MJPG video where the intensity of each frame encodes its id."""
+    def make_video(name: str = "synthetic.avi", num_frames: int = 50, size: tuple = (64, 48), step: int = 5,
+                   color: tuple = (1, 1, 1)) -> str:
+        filename = str(tmp_path / name)
+        writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 25, size)
+        for frame_id in range(num_frames):
+            writer.write(np.full((size[1], size[0], 3), [frame_id * step * channel for channel in color], np.uint8))
+        writer.release()
+        return filename
+    return make_video
+
+
+@pytest.fixture
+def synthetic_video(make_video):
+    """Fixture writing a small video where the intensity of each frame encodes its frame id."""
+    yield make_video()
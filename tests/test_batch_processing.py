@@ -0,0 +1,63 @@
+import sys
+import types
+
+import cv2
+import numpy as np
+import pytest
+
+from app import batch_processing
+from app.batch_processing import _init_worker, get_torch_threads, process_video, split_frame_ranges
+from app.components.keyframe_index import KeyframeIndex
+
+
+def test_split_frame_ranges():
+    assert split_frame_ranges(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert split_frame_ranges(8, 4) == [(0, 4), (4, 8)]
+    assert split_frame_ranges(0, 4) == []
+
+
+def test_results_file_only_for_object_detection():
+    with pytest.raises(ValueError):
+        process_video('video.mp4', 'gray', 'results.jsonl')
+    with pytest.raises(ValueError):
+        process_video('video.mp4', 'object_detection', 'results.txt')
+
+
+def test_process_video_gray(make_video, tmp_path):
+    filename = make_video('input.avi', num_frames=20, step=10, color=(1, 0, 0))
+
+    output = str(tmp_path / 'output.avi')
+    stats = process_video(filename, 'gray', output, workers=2)
+
+    assert stats['frames'] == 20
+    assert sum(worker['frames'] for worker in stats['workers'].values()) == 20
+    capture = cv2.VideoCapture(output)
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 20
+    ret, frame = capture.read()
+    assert np.allclose(frame[..., 0], frame[..., 2], atol=2)
+
+
+def test_workers_load_the_keyframe_sidecar(make_video, tmp_path, monkeypatch):
+    filename = make_video('input.avi', num_frames=10, step=10)
+    process_video(filename, 'gray', str(tmp_path / 'output.avi'), workers=1)
+
+    # The parent process wrote the sidecar, a worker never scans the packets again
+    def build(filename):
+        raise AssertionError("The keyframe index was built again")
+
+    monkeypatch.setattr(KeyframeIndex, 'build', classmethod(lambda cls, filename: build(filename)))
+    _init_worker(filename, 'gray', None, 'opencv', 1, 1)
+    assert batch_processing._worker_video_player.keyframe_index.num_frames == 10
+
+
+def test_workers_split_the_torch_threads(synthetic_video, monkeypatch):
+    monkeypatch.setattr(batch_processing.os, 'cpu_count', lambda: 8)
+    assert get_torch_threads(2) == 4
+    assert get_torch_threads(16) == 1
+
+    # Torch is not needed by the test, a stand-in records the number of threads
+    torch_threads = []
+    monkeypatch.setitem(sys.modules, 'torch', types.SimpleNamespace(set_num_threads=torch_threads.append))
+    _init_worker(synthetic_video, 'object_detection', None, 'opencv', 1, 4)
+    _init_worker(synthetic_video, 'gray', None, 'opencv', 1, 4)
+    assert torch_threads == [4]
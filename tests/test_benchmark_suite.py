@@ -0,0 +1,22 @@
+from benchmarks.suite import bench_decode, compare, make_synthetic_video
+
+
+def test_compare_to_baseline():
+    baseline = {'decode/video/sequential_fps': 100.0, 'seek/video/mean_ms': 10.0, 'filter/gray_ms': 1.0}
+
+    # Within the tolerance, or better
+    assert compare({'decode/video/sequential_fps': 90.0, 'seek/video/mean_ms': 5.0, 'filter/gray_ms': 1.1},
+                   baseline) == []
+
+    regressions = compare({'decode/video/sequential_fps': 50.0, 'seek/video/mean_ms': 15.0, 'filter/new_ms': 3.0},
+                          baseline)
+    assert [(name, change) for name, _, _, change in regressions] == \
+        [('decode/video/sequential_fps', 0.5), ('seek/video/mean_ms', 0.5)]
+
+
+def test_synthetic_video_decode(tmp_path):
+    filename = make_synthetic_video(str(tmp_path / 'synthetic'), (160, 96), 24, 1)
+
+    results = bench_decode(filename, 24, 4)
+    assert results['decode_fps'] > 0
+    assert results['gop'] == 1
@@ -134,3 +134,41 @@ def test_negative_frame_id():
     slider.fps = 30.0
     slider.nb_frames = -1  # Arbitrary number of frames
     assert slider.get_video_duration_from_id(-1) == "00:00:00"  # Negative frame ID should return zero
+
+
+class FakeText:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, value):
+        self.updates.append(value)
+
+
+def test_time_labels_only_updated_on_change():
+    elapsed_label, remaining_label = FakeText(), FakeText()
+    slider = CustomSlider("slider_key", time_elapsed=elapsed_label, time_remaining=remaining_label)
+    slider.fps = 30.0
+    slider.nb_frames = 30 * 10
+
+    # One second of playback: each label changes at most twice
+    for frame_id in range(30, 60):
+        slider.update_slider_time_labels(frame_id)
+
+    assert elapsed_label.updates == ["00:00:01"]
+    assert remaining_label.updates == ["00:00:09", "00:00:08"]
+
+
+def test_slider_moves_are_throttled_during_playback(monkeypatch):
+    slider = CustomSlider("slider_key", time_elapsed=FakeText(), time_remaining=FakeText(), update_rate=10.0)
+    slider.fps = 30.0
+    slider.nb_frames = 300
+    positions = []
+    monkeypatch.setattr(slider, 'update', lambda value: positions.append(value))
+
+    for frame_id in range(30):
+        slider.update_position(frame_id, throttle=True)
+    assert positions == [0]
+
+    # Without throttling, e.g. when paused, the slider always follows the frame
+    slider.update_position(29)
+    assert positions == [0, 29]
@@ -0,0 +1,37 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.components.decoders import create_decoder, get_available_backends
+from app.components.filter_pipeline import FilterContext, FilterPipeline
+from app.components.video_player import VideoPlayer
+
+
+@pytest.mark.parametrize('backend', get_available_backends())
+def test_backends_decode_the_same_frames(synthetic_video, backend):
+    decoder = create_decoder(synthetic_video, backend, threads=2)
+    decoder.set(cv2.CAP_PROP_POS_FRAMES, 20)
+    ret, frame = decoder.read()
+    decoder.release()
+
+    assert ret
+    assert frame.shape == (48, 64, 3)
+    assert int(round(frame.mean() / 5)) == 20
+
+
+def test_gray_decoding_skips_the_gray_conversion(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, pixel_format='gray')
+    frame = video_player.read_frame(30)
+    assert frame.shape == (48, 64)
+    assert int(round(frame.mean() / 5)) == 30
+
+    pipeline = FilterPipeline(['gray'])
+    assert pipeline.run(frame, FilterContext(frame), output_format=None) is frame
+    assert 'convert' not in pipeline.get_timings()
+
+
+def test_invalid_decoder_options(synthetic_video):
+    with pytest.raises(ValueError):
+        create_decoder(synthetic_video, 'gstreamer')
+    with pytest.raises(ValueError):
+        create_decoder(synthetic_video, pixel_format='yuv')
@@ -0,0 +1,115 @@
+import os
+import threading
+
+import numpy as np
+
+from app.components.detection_store import DetectionStore, hash_file
+from app.components.detection_worker import Detections
+
+
+def make_detections(frame_id, nb_boxes):
+    boxes = np.tile(np.array([[frame_id, 0, frame_id + 10, 10]], np.float32), (nb_boxes, 1))
+    return Detections(frame_id, boxes, np.full(nb_boxes, 1), np.full(nb_boxes, 0.5, np.float32), {1: 'grasper'})
+
+
+def make_store(tmp_path):
+    video_filename = tmp_path / 'video.mp4'
+    video_filename.write_bytes(b'video content')
+    return DetectionStore.open(str(video_filename), str(tmp_path / 'yolov8n.pt'), 0.25, root=str(tmp_path / 'store'))
+
+
+def test_hash_file_depends_on_content(tmp_path):
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    first.write_bytes(b'a' * 10)
+    second.write_bytes(b'b' * 10)
+    assert hash_file(str(first)) != hash_file(str(second))
+    assert hash_file(str(first)) == hash_file(str(first))
+
+
+def test_put_get_before_and_after_flush(tmp_path):
+    store = make_store(tmp_path)
+    for frame_id, nb_boxes in [(5, 2), (1, 0), (3, 1)]:
+        store.put(make_detections(frame_id, nb_boxes))
+    assert len(store.get(5)) == 2
+
+    store.flush()
+    assert len(store) == 3
+    assert len(store.get(5)) == 2
+    assert len(store.get(1)) == 0
+    assert store.get(3).boxes[0, 0] == 3
+    assert store.get(3).names[1] == 'grasper'
+    assert store.get(2) is None
+
+
+def test_reopen_and_reprocess(tmp_path):
+    store = make_store(tmp_path)
+    store.put(make_detections(0, 1))
+    store.put(make_detections(1, 1))
+    store.flush()
+
+    # The store of the same video, model and threshold is found again with memory-mapped columns
+    reopened_store = make_store(tmp_path)
+    assert isinstance(reopened_store.get(0).boxes, np.memmap)
+
+    # Frames processed again replace their previous detections
+    reopened_store.put(make_detections(1, 3))
+    reopened_store.flush()
+    assert len(reopened_store.get(1)) == 3
+    assert len(reopened_store.get(0)) == 1
+
+
+def test_flushes_append_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.components.detection_store.FLUSH_EVERY', 4)
+    store = make_store(tmp_path)
+    for frame_id in range(64):
+        store.put(make_detections(frame_id, frame_id % 3))
+    store.put(make_detections(10, 5))
+    store.flush()
+
+    # The chunks are merged by size, the files of the merged chunks are removed
+    assert len(store._chunks) <= 3
+    chunk_folders = sorted(name for name in os.listdir(store.folder) if name.startswith('chunk-'))
+    assert chunk_folders == sorted(os.path.basename(chunk.folder) for chunk in store._chunks)
+    assert len(store) == 64
+    assert len(store.get(10)) == 5
+    assert len(store.get(11)) == 2
+
+    # A chunk left by an interrupted flush is not in the manifest, it is ignored and removed
+    os.makedirs(os.path.join(store.folder, 'chunk-999999.tmp'))
+    reopened_store = make_store(tmp_path)
+    assert not os.path.exists(os.path.join(store.folder, 'chunk-999999.tmp'))
+    assert len(reopened_store) == 64
+    assert len(reopened_store.get(10)) == 5
+    assert reopened_store.get(62).boxes[0, 0] == 62
+
+
+def test_get_and_put_during_a_flush(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    store.put(make_detections(0, 1))
+    store.flush()
+    store.put(make_detections(1, 2))
+
+    write_started, write_allowed = threading.Event(), threading.Event()
+    write_chunk = store._write_chunk
+
+    def blocking_write_chunk(columns):
+        write_started.set()
+        write_allowed.wait(5)
+        return write_chunk(columns)
+
+    monkeypatch.setattr(store, '_write_chunk', blocking_write_chunk)
+    flush_thread = threading.Thread(target=store.flush)
+    flush_thread.start()
+    assert write_started.wait(5)
+
+    # The chunk is being written: the store is not locked, and the detections being flushed are still found
+    store.put(make_detections(2, 3))
+    assert len(store.get(1)) == 2
+    assert len(store.get(2)) == 3
+    assert len(store) == 3
+
+    write_allowed.set()
+    flush_thread.join()
+    store.flush()
+    reopened_store = make_store(tmp_path)
+    assert [len(reopened_store.get(frame_id)) for frame_id in range(3)] == [1, 2, 3]
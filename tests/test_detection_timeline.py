@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.components.detection_store import DetectionStore
+from app.components.detection_timeline import DetectionTimeline
+from app.components.detection_worker import Detections
+
+NAMES = {0: 'grasper', 1: 'hook'}
+
+
+def make_detections(frame_id: int, classes: list) -> Detections:
+    return Detections(frame_id, np.zeros((len(classes), 4), np.float32), np.array(classes, np.int32),
+                      np.ones(len(classes), np.float32), NAMES)
+
+
+def detect_graspers(images: list) -> list:
+    # One grasper on the frames 10 to 19, two hooks from the frame 30
+    detections = []
+    for image in images:
+        frame_id = int(round(image.mean() / 5))
+        classes = ([0] if 10 <= frame_id < 20 else []) + ([1, 1] if frame_id >= 30 else [])
+        detections.append(make_detections(0, classes))
+    return detections
+
+
+def test_run_length_queries():
+    timeline = DetectionTimeline('video.avi', 100, step=10)
+    for frame_id, classes in [(0, [0]), (10, [0]), (20, []), (30, [0, 0]), (40, [0]), (50, [1]), (60, [0])]:
+        timeline.add(make_detections(frame_id, classes))
+
+    # Contiguous frames with the same count are merged into one run
+    starts, ends, counts = timeline.get_runs(0)
+    assert starts.tolist() == [0, 30, 40, 60]
+    assert ends.tolist() == [20, 40, 50, 70]
+    assert counts.tolist() == [1, 2, 1, 1]
+    assert timeline.get_counts(35) == {0: 2}
+    assert timeline.get_counts(25) == {}
+
+    grasper = timeline.get_class_id('grasper')
+    assert timeline.next_occurrence(0, grasper) == 30
+    assert timeline.next_occurrence(45, grasper) == 60
+    assert timeline.next_occurrence(60, grasper) is None
+    assert timeline.previous_occurrence(45, grasper) == 30
+    assert timeline.previous_occurrence(30, grasper) == 0
+    assert timeline.previous_occurrence(0, grasper) is None
+    # Any class
+    assert timeline.next_occurrence(45) == 50
+    assert timeline.get_classes() == ['grasper', 'hook']
+    assert timeline.indexed_frames == 70
+
+
+def test_heatmap():
+    timeline = DetectionTimeline('video.avi', 100, step=10)
+    for frame_id in range(0, 50, 10):
+        timeline.add(make_detections(frame_id, [0, 0] if frame_id == 20 else [0]))
+
+    assert timeline.get_density(10).tolist() == [1, 1, 2, 1, 1, 0, 0, 0, 0, 0]
+    heatmap = timeline.render_heatmap(100, 8)
+    assert heatmap.shape == (8, 100, 3)
+    # The frames not indexed yet are gray
+    assert np.all(heatmap[:, 50:] == 60)
+
+
+def test_build_reuses_the_store(synthetic_video, tmp_path):
+    store = DetectionStore(str(tmp_path / 'store'))
+    calls = []
+
+    def detect(images):
+        calls.append(len(images))
+        return detect_graspers(images)
+
+    timeline = DetectionTimeline(synthetic_video, 50, store, detect, step=2, batch_size=4)
+    timeline.start()
+    timeline._thread.join()
+    assert timeline.error is None and timeline.is_complete
+    # One detection every two frames, in batches
+    assert sum(calls) == 25 and max(calls) == 4
+    assert timeline.next_occurrence(0, timeline.get_class_id('grasper')) == 10
+    assert timeline.get_counts(35) == {1: 2}
+
+    # The second build only reads the store
+    calls.clear()
+    rebuilt_timeline = DetectionTimeline(synthetic_video, 50, DetectionStore(str(tmp_path / 'store')), detect,
+                                         step=2)
+    rebuilt_timeline.start()
+    rebuilt_timeline._thread.join()
+    assert calls == []
+    assert rebuilt_timeline.get_runs(0)[0].tolist() == timeline.get_runs(0)[0].tolist() == [10]
+
+
+def test_build_decodes_at_the_processing_size(synthetic_video, tmp_path):
+    store = DetectionStore(str(tmp_path / 'store'))
+    shapes = []
+
+    def detect(images):
+        shapes.extend(image.shape[:2] for image in images)
+        return [Detections(0, np.array([[8, 8, 16, 16]], np.float32), np.array([0], np.int32),
+                           np.ones(1, np.float32), NAMES) for _ in images]
+
+    timeline = DetectionTimeline(synthetic_video, 50, store, detect, step=10, processing_size=(32, 24))
+    timeline.start()
+    timeline._thread.join()
+    assert timeline.error is None
+    assert set(shapes) == {(24, 32)}
+    assert timeline.get_stats()['detected_frames'] == 5
+    # The store keeps the boxes in source coordinates
+    assert store.get(10).boxes.tolist() == [[16, 16, 32, 32]]
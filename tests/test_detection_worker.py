@@ -0,0 +1,129 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.components.detection_worker import DetectionWorker, Detections, draw_detections
+
+
+class FakeTensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class FakeResult:
+    """Mimic the interface of an ultralytics result: one box per image, its class is the image intensity."""
+    def __init__(self, image):
+        class_id = float(image.flat[0])
+        self.boxes = type('Boxes', (), {'data': FakeTensor(np.array([[1, 2, 10, 20, 0.9, class_id]]))})()
+        self.names = {int(class_id): f'class_{int(class_id)}'}
+
+
+class FakeModel:
+    def __init__(self):
+        self.batch_sizes = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, images, conf=0.25, verbose=False):
+        self.release.wait()
+        self.batch_sizes.append(len(images))
+        return [FakeResult(image) for image in images]
+
+
+def make_image(frame_id):
+    return np.full((8, 8, 3), frame_id, np.uint8)
+
+
+def test_detections_tagged_by_frame_id():
+    model = FakeModel()
+    worker = DetectionWorker(model, batch_size=4, skip_policy='none')
+    for frame_id in range(8):
+        worker.submit(frame_id, make_image(frame_id))
+
+    for frame_id in range(8):
+        detections = worker.get(frame_id, timeout=2.0)
+        assert detections.frame_id == frame_id
+        assert detections.classes[0] == frame_id
+    assert worker.get_stats()['skipped_frames'] == 0
+    assert max(model.batch_sizes) > 1
+    worker.stop()
+
+
+def test_keep_latest_skips_frames_when_lagging():
+    model = FakeModel()
+    model.release.clear()
+    worker = DetectionWorker(model, batch_size=2, skip_policy='keep_latest', max_pending=4)
+
+    # The model is blocked: the frames pile up
+    for frame_id in range(10):
+        worker.submit(frame_id, make_image(frame_id))
+    model.release.set()
+
+    assert worker.get(9, timeout=2.0) is not None
+    assert worker.get_stats()['skipped_frames'] > 0
+    assert worker.get_latest(12, max_age=3).frame_id == 9
+    assert worker.get_latest(12, max_age=2) is None
+    worker.stop()
+
+
+def test_invalid_skip_policy():
+    with pytest.raises(ValueError):
+        DetectionWorker(FakeModel(), skip_policy='random')
+
+
+def test_draw_detections():
+    image = np.zeros((32, 32, 3), np.uint8)
+    detections = Detections(0, np.array([[2, 2, 20, 20]], np.float32), np.array([0]), np.array([0.5]), {0: 'grasper'})
+    draw_detections(image, detections)
+    assert image[2, 10, 1] == 255
+
+
+def test_scaled_detections():
+    detections = Detections(0, np.array([[10, 20, 30, 40]], np.float32), np.array([0]), np.array([0.5]))
+    assert detections.scaled(1.0, 1.0) is detections
+    assert detections.scaled(2.0, 0.5).boxes.tolist() == [[20, 10, 60, 20]]
+
+
+def test_model_error_stops_the_worker():
+    def failing_model(images, conf=0.25, verbose=False):
+        raise FileNotFoundError("yolov8n.pt")
+
+    worker = DetectionWorker(failing_model, batch_size=1, skip_policy='none', max_pending=1, batch_timeout=0.0)
+    worker.submit(0, make_image(0))
+    # The waiting call returns as soon as the model fails, and raises its error
+    with pytest.raises(FileNotFoundError):
+        worker.get(0, timeout=5.0)
+    assert isinstance(worker.error, FileNotFoundError)
+    with pytest.raises(FileNotFoundError):
+        worker.submit(1, make_image(1))
+    worker.stop()
+
+
+def test_clear_drops_the_batch_in_flight():
+    model = FakeModel()
+    model.release.clear()
+    stored = []
+    worker = DetectionWorker(model, batch_size=1, batch_timeout=0.0, on_detections=stored.extend)
+    worker.submit(0, make_image(0))
+    # The batch of the previous video is running when the worker is cleared
+    while worker.get_stats()['pending_frames']:
+        time.sleep(0.001)
+    clear_thread = threading.Thread(target=worker.clear)
+    clear_thread.start()
+    clear_thread.join(0.05)
+    model.release.set()
+    clear_thread.join()
+
+    worker.submit(1, make_image(1))
+    assert worker.get(1, timeout=2.0) is not None
+    assert worker.get(0) is None
+    assert [detections.frame_id for detections in stored] == [1]
+    worker.stop()
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from app.components.detection_worker import Detections
+from app.components.filter_pipeline import BGR, EDGE_COLOR, FilterContext, FilterPipeline, get_filter_name
+from app.components.image_filter import ImageFilter
+
+
+def make_image():
+    return np.random.default_rng(0).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+
+
+def test_gray_pipeline_keeps_gray_format():
+    image = make_image()
+    pipeline = FilterPipeline(['gray'])
+
+    assert pipeline.run(image, FilterContext(image), output_format=None).shape == image.shape[:2]
+    assert pipeline.run(image, FilterContext(image), output_format=BGR).shape == image.shape
+    # The conversion back to BGR only happens when asked for
+    assert pipeline.stage_calls['convert'] == 1
+
+
+def test_in_place_stage_never_modifies_the_source():
+    image = make_image()
+    source = image.copy()
+    image_filter = ImageFilter()
+    image_filter.set_filter_types(['object_detection'])
+    detections = Detections(0, np.array([[2, 2, 20, 20]], np.float32), np.array([0]), np.array([0.5]))
+
+    filtered_image = image_filter.pipeline.run(image, FilterContext(image, image_filter=image_filter,
+                                                                    detections=detections))
+
+    assert np.array_equal(image, source)
+    assert not np.array_equal(filtered_image, source)
+    # The frame is copied once, before the detections are drawn
+    assert image_filter.pipeline.stage_calls['copy'] == 1
+    assert image_filter.detections is detections
+    assert not image_filter.is_model_loaded
+
+
+def test_chained_filters_are_timed():
+    image = make_image()
+    image_filter = ImageFilter()
+    image_filter.set_filter_types(['gray', 'detect_edges'])
+
+    filtered_image = image_filter.update_filtered_image(image)
+
+    assert filtered_image.shape == image.shape
+    # The gray image is converted back to BGR for the edge stage, no extra copy is needed
+    assert set(image_filter.get_stage_timings()) == {'gray', 'convert', 'detect_edges'}
+
+
+def test_invalid_filter():
+    with pytest.raises(ValueError):
+        FilterPipeline(['gray', 'sepia'])
+    with pytest.raises(ValueError):
+        get_filter_name('Sepia')
+    assert get_filter_name('Object Detection') == 'object_detection'
+
+
+def make_edge_image(offset: int = 0):
+    image = np.zeros((48, 64, 3), np.uint8)
+    image[:, 32 + offset:] = 255
+    return image
+
+
+def test_edges_are_drawn_in_reused_buffers():
+    pipeline = FilterPipeline(['detect_edges'])
+    stage = pipeline.stages[0]
+
+    filtered_image = pipeline.run(make_edge_image(), FilterContext(make_edge_image(), 0))
+    edges_buffer = stage._edges
+    pipeline.run(make_edge_image(), FilterContext(make_edge_image(), 1))
+
+    assert stage._edges is edges_buffer
+    # The vertical edge is green, the flat areas are untouched
+    assert (filtered_image[:, 30:34] == EDGE_COLOR).all(axis=-1).any()
+    assert (filtered_image[:, :8] == 0).all()
+
+
+def test_smoothed_edges_ignore_a_single_frame():
+    pipeline = FilterPipeline(['smoothed_edges'])
+    pipeline.run(make_edge_image(), FilterContext(make_edge_image(), 0))
+
+    # The edge moves for one frame only: it is not shown yet
+    moved_image = make_edge_image(16)
+    filtered_image = pipeline.run(moved_image, FilterContext(moved_image, 1))
+    assert not (filtered_image[:, 46:50] == EDGE_COLOR).all(axis=-1).any()
+
+    # After a seek, the average restarts from the new frame
+    filtered_image = pipeline.run(moved_image, FilterContext(moved_image, 100))
+    assert (filtered_image[:, 46:50] == EDGE_COLOR).all(axis=-1).any()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.components.frame_display import PhotoImageFrameDisplay, create_frame_display, fit_size
+
+
+def test_fit_size():
+    assert fit_size((1920, 1080), (854, 480)) == (853, 480)
+    assert fit_size((854, 480), (854, 480)) == (854, 480)
+    assert fit_size((480, 480), (854, 480)) == (480, 480)
+
+
+def test_prepare_scales_once_into_shared_buffer():
+    frame_display = PhotoImageFrameDisplay(display_size=(854, 480))
+    frame = np.zeros((1080, 1920, 3), np.uint8)
+    frame[..., 2] = 200  # Red in BGR
+
+    pil_image = frame_display.prepare(frame)
+    assert pil_image.size == (853, 480)
+    assert pil_image.getpixel((10, 10)) == (200, 0, 0, 255)
+
+    # The same PIL image is reused and reflects the new frame without being created again
+    frame[..., 2] = 0
+    frame[..., 0] = 100  # Blue in BGR
+    assert frame_display.prepare(frame) is pil_image
+    assert pil_image.getpixel((10, 10)) == (0, 0, 100, 255)
+
+
+def test_prepare_gray_frame():
+    frame_display = PhotoImageFrameDisplay(display_size=(32, 32))
+    pil_image = frame_display.prepare(np.full((64, 64), 50, np.uint8))
+    assert pil_image.getpixel((0, 0)) == (50, 50, 50, 255)
+
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        create_frame_display('opengl')
+
+
+def test_auto_display_picks_the_path_from_the_frame_size():
+    frame_display = create_frame_display('auto', display_size=(854, 480))
+    # Scaled down once through the photo image
+    assert frame_display.get_display(np.zeros((1080, 1920, 3), np.uint8)) is frame_display.photo_image_display
+    assert frame_display.get_display(np.zeros((480, 853, 3), np.uint8)) is frame_display.photo_image_display
+    # Smaller than the display: encoded at its own size instead of scaled up
+    display, prepared = frame_display.prepare(np.zeros((360, 640, 3), np.uint8))
+    assert display is frame_display.ppm_display
+    assert prepared.startswith(b'P6')
+
+
+def test_auto_display_small_gray_frame():
+    # The gray filter outputs 2-D frames, smaller than the display they go through the PPM path
+    frame_display = create_frame_display('auto', display_size=(854, 480))
+    display, prepared = frame_display.prepare(np.full((360, 640), 50, np.uint8))
+    assert display is frame_display.ppm_display
+    assert prepared.startswith(b'P5')
@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.components.frame_store import FrameStore
+from app.components.video_player import VideoPlayer
+
+
+def test_frame_store_is_materialized_and_reopened(synthetic_video, tmp_path):
+    frame_store = FrameStore.open(synthetic_video, 50, (48, 64, 3), root=str(tmp_path / "frames"))
+    frame_store.materialize(lambda: cv2.VideoCapture(synthetic_video))
+
+    assert frame_store.is_complete
+    frame = frame_store.get(30)
+    assert int(round(frame.mean() / 5)) == 30
+    # Zero-copy and read-only view of the memory map
+    assert np.shares_memory(frame, frame_store.frames)
+    assert not frame.flags.writeable
+
+    reopened_frame_store = FrameStore.open(synthetic_video, 50, (48, 64, 3), root=str(tmp_path / "frames"))
+    assert reopened_frame_store.is_complete
+
+
+def test_frame_store_size_cap(synthetic_video, tmp_path):
+    assert FrameStore.open(synthetic_video, 50, (48, 64, 3), root=str(tmp_path), max_bytes=1024) is None
+
+
+def test_video_player_reads_from_frame_store(synthetic_video, tmp_path):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=4)
+    video_player.frame_store = FrameStore.open(synthetic_video, 50, (48, 64, 3), root=str(tmp_path / "frames"))
+    assert video_player.start_materialize()
+    video_player.frame_store._thread.join()
+
+    for frame_id in [45, 3, 20]:
+        frame = video_player.read_frame(frame_id)
+        assert int(round(frame.mean() / 5)) == frame_id
+        assert np.shares_memory(frame, video_player.frame_store.frames)
+    # Once the store is complete, the decoder thread is stopped
+    assert video_player.prefetcher is None
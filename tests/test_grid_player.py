@@ -0,0 +1,93 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from app.components.decode_scheduler import DecodeScheduler
+from app.components.grid_player import GridCompositor, GridPlayer, get_grid_shape
+from app.components.video_player import VideoPlayer
+
+
+def write_video(filename: str, nb_frames: int, fps: float = 25, value: int = 0):
+    # The blue channel of each frame encodes its id
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for frame_id in range(nb_frames):
+        writer.write(np.full((48, 64, 3), (frame_id * 4, value, 0), np.uint8))
+    writer.release()
+    return filename
+
+
+def test_grid_shape():
+    assert get_grid_shape(1) == (1, 1)
+    assert get_grid_shape(3) == (2, 2)
+    assert get_grid_shape(5) == (3, 2)
+    assert get_grid_shape(3, columns=3) == (3, 1)
+
+
+def test_compositor_letterbox():
+    compositor = GridCompositor(2, size=(200, 100))
+    assert compositor.cell_size == (100, 100)
+
+    compositor.update(1, np.full((50, 100), 200, np.uint8))
+    # The gray frame is centered in the second cell, with black borders
+    assert np.all(compositor.buffer[25:75, 100:200] == 200)
+    assert np.all(compositor.buffer[:25, 100:200] == 0)
+    assert np.all(compositor.get_cell(0) == 0)
+
+
+def test_decode_scheduler(tmp_path):
+    video_players = [VideoPlayer(write_video(str(tmp_path / f'video{index}.avi'), 20), frame_cache_bytes=0)
+                     for index in range(2)]
+    scheduler = DecodeScheduler(video_players, workers=2, prefetch_size=4)
+
+    for frame_id in range(20):
+        for stream_index in range(2):
+            frame = scheduler.get(stream_index, frame_id, timeout=2.0)
+            assert abs(int(frame[0, 0, 0]) - frame_id * 4) <= 2
+    # Sequential reads never seek
+    assert scheduler.get_stats()['seeks'] == [0, 0]
+
+    # Going back restarts the decoding from the frame
+    frame = scheduler.get(0, 3, timeout=2.0)
+    assert abs(int(frame[0, 0, 0]) - 12) <= 2
+    assert scheduler.get_stats()['seeks'][0] == 1
+    scheduler.close()
+
+
+def test_grid_player_synchronized(tmp_path):
+    filenames = [write_video(str(tmp_path / 'long.avi'), 40, fps=25),
+                 write_video(str(tmp_path / 'fast.avi'), 40, fps=50, value=100)]
+    grid_player = GridPlayer(filenames, size=(128, 48))
+
+    # The longest video drives the timeline, the other one is shown at the same time
+    assert grid_player.num_frames == 40
+    grid_player.seek(10)
+    grid_player.read(10, timeout=2.0)
+    assert grid_player.shown_frame_ids == [10, 20]
+    assert grid_player.is_complete(10)
+
+    # The second video is over after frame 20 of the timeline, its last frame stays shown
+    grid_player.read(30, timeout=2.0)
+    assert grid_player.shown_frame_ids == [30, 20]
+    grid_player.close()
+
+
+def test_read_waits_once_for_all_the_videos(tmp_path):
+    filenames = [write_video(str(tmp_path / f'video{index}.avi'), 20) for index in range(3)]
+    grid_player = GridPlayer(filenames, size=(192, 48))
+    # Decoders that never deliver their frame in time
+    release = threading.Event()
+    for video_player in grid_player.video_players:
+        video_player.decode_frame = lambda frame_id: release.wait() and None
+
+    start = time.monotonic()
+    grid_player.read(5, timeout=0.3)
+    elapsed = time.monotonic() - start
+    release.set()
+
+    # The timeout is shared by the videos, not spent on each of them in turn
+    assert elapsed < 0.6
+    assert grid_player.stale_frames == 3
+    assert not grid_player.is_complete(5)
+    grid_player.close()
@@ -0,0 +1,87 @@
+import time
+
+from app.components.image_filter import ImageFilter
+from app.components.seek_scheduler import SeekScheduler
+from app.components.video_player import VideoPlayer
+from app.gui import VideoPlayerApp
+from app.profiling import StageProfiler, StartupProfiler
+
+
+class ScriptedWindow:
+    """Window returning the scripted events, then timeouts until the seek is shown, then Exit."""
+    def __init__(self, app, events: list):
+        self.app = app
+        self.events = list(events)
+        self.seek_active_on_events = []
+        self.nb_timeouts = 0
+
+    def read(self, timeout=None):
+        if self.events:
+            event, values = self.events.pop(0)
+            self.seek_active_on_events.append(self.app.seek_scheduler.is_active)
+            return event, values
+        if self.app.seek_scheduler.is_active and self.nb_timeouts < 200:
+            self.nb_timeouts += 1
+            time.sleep(0.01)
+            return '__TIMEOUT__', {}
+        return 'Exit', {}
+
+    def close(self):
+        pass
+
+
+class FakeSlider:
+    def update_position(self, frame_id, throttle=False):
+        self.frame_id = frame_id
+
+    def update_slider_time_labels(self, frame_id):
+        pass
+
+
+class FakeFrameDisplay:
+    def __init__(self):
+        self.frames = []
+
+    def update(self, frame):
+        self.frames.append(frame)
+
+
+def make_app(filename: str, events: list) -> VideoPlayerApp:
+    # The app without its Tk window, the video player, filter and seek scheduler are the real ones
+    app = VideoPlayerApp.__new__(VideoPlayerApp)
+    app.startup_profiler = StartupProfiler()
+    app.startup_profiler.finish()
+    app.profiler = StageProfiler(enabled=True)
+    app.show_profile_overlay = False
+    app.exporter = None
+    app.timeline = None
+    app.timeout = 0
+    app.video_player = VideoPlayer(filename, prefetch_size=4, keyframe_sidecar=False, use_metadata_cache=False)
+    app.seek_scheduler = SeekScheduler()
+    app.filtered_image = ImageFilter()
+    app.filtered_image.output_format = None
+    app.frame_display = FakeFrameDisplay()
+    app.video_slider = FakeSlider()
+    app.current_frame_id = 0
+    app.ret, app.frame = False, None
+    app.is_filter_applied = False
+    app.window = ScriptedWindow(app, events)
+    return app
+
+
+def test_key_events_are_handled_while_a_seek_is_pending(synthetic_video):
+    app = make_app(synthetic_video, [('-SLIDER-', {'-SLIDER-': 30}), ('f', {})])
+    app.launch_app()
+
+    # The filter key came while the seek was in flight, it was handled and the seek still completed
+    assert app.window.seek_active_on_events == [False, True]
+    assert app.is_filter_applied
+    assert not app.seek_scheduler.is_active
+    assert app.seek_scheduler.get_stats()['seeks'] == 1
+    # The latency of the seek is recorded with the other stages
+    assert app.profiler.get_stats()['seek']['count'] == 1
+    assert app.current_frame_id == 30
+    # The frame of the seek is shown with the filter toggled during the seek
+    shown_frame = app.frame_display.frames[-1]
+    assert shown_frame.ndim == 2
+    assert abs(int(shown_frame.mean()) - 150) <= 2
@@ -0,0 +1,57 @@
+import sys
+
+import numpy as np
+
+from app.components.detection_worker import Detections
+from app.components.image_filter import ImageFilter
+from app.profiling import StartupProfiler
+
+
+def test_model_is_not_loaded_for_gray_filter():
+    image_filter = ImageFilter()
+    image = np.random.default_rng(0).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+
+    filtered_image = image_filter.update_filtered_image(image)
+
+    assert filtered_image.shape == image.shape
+    assert np.array_equal(filtered_image[..., 0], filtered_image[..., 2])
+    assert not image_filter.is_model_loaded
+    assert 'ultralytics' not in sys.modules
+
+
+def test_startup_profiler():
+    startup_profiler = StartupProfiler()
+    with startup_profiler.step('first step'):
+        pass
+    startup_profiler.finish()
+
+    # Steps are ignored once the startup is finished
+    with startup_profiler.step('after startup'):
+        pass
+
+    assert list(startup_profiler.as_dict()['steps']) == ['first step']
+    assert startup_profiler.total_time >= startup_profiler.steps[0][1]
+    assert 'first step' in startup_profiler.report()
+
+
+def test_filter_source_image_never_runs_the_model(tmp_path):
+    image_filter = ImageFilter()
+    image_filter.set_filter_type('object_detection')
+    image_filter.source_scale = (2.0, 2.0)
+
+    def model(*args, **kwargs):
+        raise AssertionError("The model ran on the GUI thread")
+
+    image_filter._model = model
+    source_image = np.zeros((96, 128, 3), np.uint8)
+
+    # No detections on screen and none stored: nothing is drawn
+    assert not image_filter.filter_source_image(source_image, 3).any()
+    assert image_filter.detections is None
+
+    # The detections on screen are mapped to the source size
+    image_filter.detections = Detections(3, np.array([[10, 10, 20, 20]], np.float32), np.array([0]),
+                                         np.array([0.9], np.float32), {0: 'grasper'})
+    filtered_image = image_filter.filter_source_image(source_image, 3)
+    assert filtered_image[20, 20:40].any() and not filtered_image[60:, 60:].any()
+    assert image_filter.detections.boxes[0, 2] == 20
@@ -0,0 +1,124 @@
+import numpy as np
+
+from app.components.detection_worker import Detections
+from app.components.image_filter import ImageFilter
+from app.components.motion_gate import (FULL, MOTION_GATE_MAX_SKIPS, REGION, SKIP, MotionGate,
+                                        merge_region_detections)
+from tests.test_detection_worker import FakeResult
+
+
+class FakeModel:
+    """Record the shape of the images the model runs on."""
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, image, conf=0.25, verbose=False):
+        self.shapes.append(image.shape)
+        return [FakeResult(image)]
+
+
+def make_frame(value: int = 100):
+    return np.full((180, 320, 3), value, np.uint8)
+
+
+def test_static_frames_are_skipped():
+    motion_gate = MotionGate(threshold=1.0)
+    frame = make_frame()
+
+    # No reference yet
+    assert motion_gate.check(frame) == (FULL, None)
+    motion_gate.set_reference(frame)
+    assert motion_gate.check(frame) == (SKIP, None)
+
+    # Detections never drift for more than MOTION_GATE_MAX_SKIPS frames
+    for _ in range(MOTION_GATE_MAX_SKIPS - 1):
+        assert motion_gate.check(frame)[0] == SKIP
+    assert motion_gate.check(frame)[0] == FULL
+
+    stats = motion_gate.get_stats()
+    assert stats['skipped_frames'] == MOTION_GATE_MAX_SKIPS
+    assert stats['skip_rate'] == MOTION_GATE_MAX_SKIPS / (MOTION_GATE_MAX_SKIPS + 2)
+
+
+def test_gating_off():
+    motion_gate = MotionGate(threshold=None)
+    frame = make_frame()
+    motion_gate.set_reference(frame)
+    assert motion_gate.check(frame) == (FULL, None)
+
+
+def test_local_change_is_detected_on_a_region():
+    motion_gate = MotionGate(threshold=1.0)
+    frame = make_frame()
+    motion_gate.set_reference(frame)
+
+    moved = frame.copy()
+    moved[40:80, 200:260] = 255
+    decision, region = motion_gate.check(moved)
+    assert decision == REGION
+    x1, y1, x2, y2 = region
+    assert x1 <= 200 and y1 <= 40 and x2 >= 260 and y2 >= 80
+    assert (x2 - x1) * (y2 - y1) < frame.shape[0] * frame.shape[1] / 2
+
+    # A global change needs a full detection
+    assert motion_gate.check(make_frame(200)) == (FULL, None)
+
+
+def test_merge_region_detections():
+    previous = Detections(0, np.array([[0, 0, 10, 10], [100, 100, 120, 120]], np.float32), np.array([0, 1]),
+                          np.array([0.5, 0.6], np.float32), {0: 'grasper', 1: 'hook'})
+    region_detections = Detections(1, np.array([[5, 5, 15, 15]], np.float32), np.array([1]),
+                                   np.array([0.9], np.float32), {1: 'hook'})
+
+    detections = merge_region_detections(previous, region_detections, (90, 90, 150, 150))
+
+    # The previous box inside the region is replaced by the box detected in the region
+    assert detections.frame_id == 1
+    assert np.array_equal(detections.boxes, [[0, 0, 10, 10], [95, 95, 105, 105]])
+    assert np.array_equal(detections.classes, [0, 1])
+
+
+def test_image_filter_reuses_detections():
+    image_filter = ImageFilter()
+    image_filter._model = FakeModel()
+    image_filter.set_motion_gating('Medium')
+    image_filter.set_filter_type('object_detection')
+
+    frame = make_frame()
+    for frame_id in range(5):
+        image_filter.update_filtered_image(frame, frame_id)
+    assert len(image_filter._model.shapes) == 1
+    assert image_filter.detections.frame_id == 4
+
+    # Only the changed region goes through the model
+    moved = frame.copy()
+    moved[40:80, 200:260] = 255
+    image_filter.update_filtered_image(moved, 5)
+    assert len(image_filter._model.shapes) == 2
+    region_height, region_width = image_filter._model.shapes[1][:2]
+    assert region_height < frame.shape[0] and region_width < frame.shape[1]
+    assert image_filter.get_motion_gate_stats()['skipped_frames'] == 4
+
+
+class LaggingWorker:
+    """Detection worker whose detections are two frames behind the displayed frame."""
+    def submit(self, frame_id, image):
+        pass
+
+    def get_latest(self, frame_id, max_age=0):
+        return Detections(frame_id - 2) if frame_id >= 2 else None
+
+
+def test_late_detections_use_their_frame_as_reference():
+    image_filter = ImageFilter()
+    image_filter.set_motion_gating('Low')
+    image_filter.detection_worker = LaggingWorker()
+
+    for frame_id, value in enumerate([0, 50, 100]):
+        image_filter.image = make_frame(value)
+        image_filter.get_detections(frame_id, wait_for_detections=False)
+    assert image_filter.last_detections.frame_id == 0
+
+    # The reference is the frame 0 the detections were made on, not the frame shown when they arrived
+    assert image_filter.motion_gate.check(make_frame(0))[0] == SKIP
+    assert image_filter.motion_gate.check(make_frame(100))[0] == FULL
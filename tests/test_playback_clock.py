@@ -0,0 +1,43 @@
+from app.components.playback_clock import PlaybackClock
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 100.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_target_frame_follows_the_wall_clock():
+    clock = FakeClock()
+    playback_clock = PlaybackClock(25.0, clock)
+    playback_clock.start(10)
+
+    assert playback_clock.get_target_frame_id() == 10
+    clock.time += 0.5
+    assert playback_clock.get_target_frame_id() == 22
+    assert abs(playback_clock.get_time_to_frame(23) - 0.02) < 1e-9
+    assert playback_clock.get_time_to_frame(20) == 0.0
+
+
+def test_dropped_frames_and_achieved_fps():
+    clock = FakeClock()
+    playback_clock = PlaybackClock(25.0, clock)
+    playback_clock.start(0)
+
+    # Each frame takes 3 frame durations to show: two frames are dropped each time
+    for frame_id in range(0, 30, 3):
+        playback_clock.record_frame(frame_id)
+        clock.time += 3 / 25.0
+    playback_clock.stop()
+
+    stats = playback_clock.get_stats()
+    assert stats['displayed_frames'] == 10
+    assert stats['dropped_frames'] == 18
+    assert abs(stats['achieved_fps'] - 25.0 / 3) < 1e-6
+
+    # A seek is not counted as dropped frames
+    playback_clock.start(500)
+    playback_clock.record_frame(500)
+    assert playback_clock.get_stats()['dropped_frames'] == 18
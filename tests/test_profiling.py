@@ -0,0 +1,63 @@
+import csv
+import json
+
+import pytest
+
+from app.profiling import StageProfiler
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = StageProfiler(enabled=False)
+    with profiler.stage('decode'):
+        pass
+    profiler.record('filter', 0.01)
+
+    assert profiler.get_stats() == {}
+
+
+def test_stage_percentiles():
+    clock = FakeClock()
+    profiler = StageProfiler(enabled=True, window=100, clock=clock)
+
+    # 1 to 200 ms, only the last 100 durations are in the window
+    for duration in range(1, 201):
+        with profiler.stage('decode'):
+            clock.time += duration / 1000
+    profiler.record('filter', 0.005)
+
+    stats = profiler.get_stats()
+    assert list(stats) == ['decode', 'filter']
+    assert stats['decode']['count'] == 200
+    assert stats['decode']['mean_ms'] == pytest.approx(100.5)
+    assert stats['decode']['p50_ms'] == pytest.approx(150.5)
+    assert stats['decode']['p99_ms'] == pytest.approx(199.01)
+    assert stats['decode']['max_ms'] == pytest.approx(200)
+    assert stats['filter']['p95_ms'] == pytest.approx(5)
+    assert 'decode' in profiler.report()
+
+
+def test_dump(tmp_path):
+    profiler = StageProfiler(enabled=True)
+    profiler.record('decode', 0.002)
+    profiler.record('decode', 0.004)
+
+    profiler.dump(str(tmp_path / 'profile.json'))
+    with open(tmp_path / 'profile.json') as dump_file:
+        assert json.load(dump_file)['stages']['decode']['count'] == 2
+
+    profiler.dump(str(tmp_path / 'profile.csv'))
+    with open(tmp_path / 'profile.csv') as dump_file:
+        rows = list(csv.DictReader(dump_file))
+    assert rows[0]['stage'] == 'decode'
+    assert float(rows[0]['mean_ms']) == pytest.approx(3)
+
+    with pytest.raises(ValueError):
+        profiler.dump(str(tmp_path / 'profile.txt'))
@@ -0,0 +1,105 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from app.components.keyframe_index import KeyframeIndex
+from app.components.proxy_track import ProxyTrack, get_proxy_filenames
+from app.components.video_player import VideoPlayer
+
+
+def build(proxy_track):
+    proxy_track.start()
+    proxy_track._thread.join()
+
+
+def test_proxy_track_is_built_and_reused(synthetic_video):
+    proxy_track = ProxyTrack(synthetic_video, 50, (64, 48), KeyframeIndex.build(synthetic_video), step=4)
+    build(proxy_track)
+
+    assert proxy_track.is_complete
+    thumbnail = proxy_track.get(21)
+    assert thumbnail.shape == (90, 120, 3)
+    assert int(round(thumbnail.mean() / 5)) == 20
+
+    # The thumbnails are read back from the sidecar, nothing is left to build
+    reopened_proxy_track = ProxyTrack(synthetic_video, 50, (64, 48), step=4)
+    assert reopened_proxy_track.is_complete
+    assert np.array_equal(reopened_proxy_track.get(21), thumbnail)
+
+
+def test_partial_proxy_returns_nearest_thumbnail(synthetic_video):
+    proxy_track = ProxyTrack(synthetic_video, 50, (64, 48), step=4, use_sidecar=False)
+    assert proxy_track.get(10) is None
+
+    frame = np.full((48, 64, 3), 200, np.uint8)
+    proxy_track._store(40, frame)
+    assert proxy_track.progress == pytest.approx(1 / 13)
+    assert proxy_track.get(0).mean() == 200
+
+    # The build goes on from the first missing slot
+    build(proxy_track)
+    assert proxy_track.is_complete
+    assert proxy_track.get(40).mean() == 200
+
+
+def test_video_player_proxy_frames(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, use_proxy=True)
+    video_player.proxy_track._thread.join()
+
+    thumbnail = video_player.read_proxy_frame(33)
+    assert int(round(thumbnail.mean() / 5)) == 32
+    assert video_player.get_current_frame_id() == 0
+    assert all(os.path.exists(filename) for filename in get_proxy_filenames(synthetic_video))
+
+
+class FailingDecoder:
+    """Decoder failing to retrieve the first frame, and holding more frames than the proxy expects."""
+    def __init__(self, filename):
+        self.capture = cv2.VideoCapture(filename)
+        self.position = 0
+        self.opened = True
+
+    def grab(self):
+        self.position += 1
+        return self.capture.grab()
+
+    def retrieve(self):
+        if self.position == 1:
+            return False, None
+        return self.capture.retrieve()
+
+    def set(self, property_id, value):
+        self.position = int(value)
+        return self.capture.set(property_id, value)
+
+    def release(self):
+        self.capture.release()
+
+
+def test_build_stops_at_the_last_slot(synthetic_video):
+    # The header counted 20 frames, the stream holds 50 and the first thumbnail cannot be decoded
+    proxy_track = ProxyTrack(synthetic_video, 20, (64, 48), step=4, use_sidecar=False,
+                             open_decoder=lambda: FailingDecoder(synthetic_video))
+    proxy_track._build()
+
+    assert proxy_track.frame_ids.tolist() == [-1, 4, 8, 12, 16]
+    assert not proxy_track.is_complete
+
+
+def test_proxy_of_an_unknown_frame_size(synthetic_video):
+    proxy_track = ProxyTrack(synthetic_video, 50, (0, 0), step=4)
+    proxy_track.start()
+
+    assert proxy_track.num_slots == 0
+    assert proxy_track.is_complete
+    assert proxy_track.get(10) is None
+    assert not os.path.exists(get_proxy_filenames(synthetic_video)[0])
+
+
+def test_gray_video_player_builds_color_thumbnails(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, use_proxy=True, pixel_format='gray')
+    video_player.proxy_track._thread.join()
+
+    assert video_player.read_proxy_frame(20).shape == (90, 120, 3)
@@ -0,0 +1,182 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+from app.components.review_session import ReviewClient, SharedVideo, VideoRegistry, pack_frame, unpack_frame
+
+
+def write_video(filename: str, nb_frames: int, fps: float = 25):
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), fps, (64, 48))
+    for frame_id in range(nb_frames):
+        writer.write(np.full((48, 64, 3), frame_id * 4, np.uint8))
+    writer.release()
+    return filename
+
+
+def test_pack_frame():
+    assert unpack_frame(pack_frame(42, b'jpeg')) == (42, b'jpeg')
+
+
+def test_shared_video_cache(tmp_path):
+    video = SharedVideo(write_video(str(tmp_path / 'video.avi'), 10), processing_size=None)
+    jpeg = video.render(3)
+    assert cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).shape == (48, 64, 3)
+
+    # A second client watching the same frame gets the encoded frame of the first one
+    assert video.render(3) is jpeg
+    assert (video.renders, video.hits) == (1, 1)
+    # Another filter is another frame
+    assert video.render(3, ('gray',)) is not jpeg
+    assert video.renders == 2
+    video.close()
+
+
+def test_registry(tmp_path):
+    write_video(str(tmp_path / 'video.avi'), 5)
+    (tmp_path / 'notes.txt').write_text('')
+    registry = VideoRegistry(str(tmp_path), open_video=lambda filename: SharedVideo(filename, processing_size=None))
+    assert registry.list_videos() == ['video.avi']
+    for name in ['../video.avi', 'notes.txt', 'missing.avi']:
+        with pytest.raises(ValueError):
+            registry.get_filename(name)
+
+    async def watch():
+        first = await registry.acquire('video.avi')
+        second = await registry.acquire('video.avi')
+        assert first is second and first.clients == 2
+        await registry.release(first)
+        assert registry.get_stats()['video.avi']['clients'] == 1
+        await registry.release(second)
+        assert registry.videos == {}
+
+    asyncio.run(watch())
+
+
+def test_client_backpressure(tmp_path):
+    video = SharedVideo(write_video(str(tmp_path / 'video.avi'), 10), processing_size=None)
+    replies = []
+
+    async def send_json(message):
+        replies.append(message)
+
+    async def review():
+        client = ReviewClient(video, None, send_json, queue_size=2)
+        # Nothing is sent: the client only keeps the latest frames
+        for frame_id in range(5):
+            await client.show(frame_id)
+        assert [unpack_frame(client.queue.get_nowait())[0] for _ in range(2)] == [3, 4]
+        assert client.dropped_frames == 3
+
+        await client.handle({'type': 'filter', 'filters': ['invalid']})
+        await client.handle({'type': 'rewind'})
+        assert [reply['type'] for reply in replies] == ['error', 'error']
+        assert client.filter_types == ()
+
+        await client.handle({'type': 'seek', 'frame_id': 100})
+        assert client.frame_id == 9
+
+    asyncio.run(review())
+    video.close()
+
+
+def test_client_play(tmp_path):
+    video = SharedVideo(write_video(str(tmp_path / 'video.avi'), 10, fps=200), processing_size=None)
+    received = []
+    replies = []
+
+    async def send_bytes(message):
+        received.append(unpack_frame(message)[0])
+
+    async def send_json(message):
+        replies.append(message)
+
+    async def review():
+        client = ReviewClient(video, send_bytes, send_json)
+        sender = asyncio.create_task(client.send_frames())
+        await client.show(0)
+        await client.handle({'type': 'play'})
+        for _ in range(200):
+            if replies:
+                break
+            await asyncio.sleep(0.01)
+        await client.pause()
+        sender.cancel()
+
+    asyncio.run(review())
+    video.close()
+    assert replies == [{'type': 'ended', 'frame_id': 9}]
+    assert received[0] == 0 and received[-1] == 9
+    assert received == sorted(received)
+
+
+def test_client_rejects_malformed_commands(tmp_path):
+    video = SharedVideo(write_video(str(tmp_path / 'video.avi'), 10), processing_size=None)
+    replies = []
+
+    async def send_json(message):
+        replies.append(message)
+
+    async def review():
+        client = ReviewClient(video, None, send_json)
+        for message in ['{"type": "seek"', None, '[1, 2]', '{"type": "seek"}', '{"type": "seek", "frame_id": "x"}',
+                        '{"type": "seek", "frame_id": null}', '{"type": "filter", "filters": 3}',
+                        '{"type": "filter", "filters": [{"name": "gray"}]}']:
+            await client.handle_message(message)
+        assert [reply['type'] for reply in replies] == ['error'] * 8
+
+        # The session goes on
+        await client.handle_message('{"type": "seek", "frame_id": 4}')
+        assert client.frame_id == 4
+
+    asyncio.run(review())
+    video.close()
+
+
+def test_client_reports_playback_errors(tmp_path, caplog):
+    video = SharedVideo(write_video(str(tmp_path / 'video.avi'), 10, fps=200), processing_size=None)
+    replies = []
+
+    async def send_json(message):
+        replies.append(message)
+
+    def render(frame_id, filter_types=()):
+        raise RuntimeError("decoder failure")
+
+    async def review():
+        client = ReviewClient(video, None, send_json)
+        video.render = render
+        client.play()
+        for _ in range(200):
+            if not client.is_playing:
+                break
+            await asyncio.sleep(0.01)
+        assert not client.is_playing
+
+    asyncio.run(review())
+    video.close()
+    assert replies == [{'type': 'error', 'message': "Playback stopped: decoder failure"}]
+    assert "Playback of" in caplog.text
+
+
+def test_server(tmp_path):
+    pytest.importorskip('fastapi')
+    pytest.importorskip('httpx')
+    from fastapi.testclient import TestClient
+
+    from app.server import create_app
+
+    write_video(str(tmp_path / 'video.avi'), 10)
+    client = TestClient(create_app(str(tmp_path)))
+    assert client.get('/videos').json() == ['video.avi']
+
+    with client.websocket_connect('/ws?video=video.avi') as websocket:
+        metadata = websocket.receive_json()
+        assert metadata['type'] == 'metadata' and metadata['num_frames'] == 10
+        assert unpack_frame(websocket.receive_bytes())[0] == 0
+        websocket.send_json({'type': 'seek', 'frame_id': 5})
+        assert unpack_frame(websocket.receive_bytes())[0] == 5
+
+    with client.websocket_connect('/ws?video=../video.avi') as websocket:
+        assert websocket.receive_json()['type'] == 'error'
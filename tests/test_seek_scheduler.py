@@ -0,0 +1,49 @@
+from app.components.seek_scheduler import SeekScheduler, format_seek_stats
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_requests_are_coalesced():
+    clock = FakeClock()
+    seek_scheduler = SeekScheduler(settle_time=0.1, clock=clock)
+
+    # A fast drag: only the last position is decoded
+    for frame_id in range(10, 20):
+        seek_scheduler.request(frame_id)
+        clock.time += 0.01
+        assert not seek_scheduler.is_settled()
+
+    clock.time += 0.1
+    assert seek_scheduler.is_settled()
+    assert seek_scheduler.start() == 19
+
+    clock.time += 0.05
+    assert abs(seek_scheduler.finish() - 0.16) < 1e-6
+    stats = seek_scheduler.get_stats()
+    assert stats['seeks'] == 1
+    assert stats['coalesced_requests'] == 9
+    assert abs(stats['last_latency_ms'] - 160) < 1e-6
+    assert abs(stats['mean_decode_latency_ms'] - 50) < 1e-6
+    assert format_seek_stats(stats) == ("1 seeks for 10 requests, 9 coalesced, 0 cancelled, "
+                                        "160.0 ms mean latency (50.0 ms decoding)")
+    assert not seek_scheduler.is_active
+
+
+def test_new_request_cancels_the_seek_in_flight():
+    seek_scheduler = SeekScheduler()
+    seek_scheduler.request(5)
+    seek_scheduler.start()
+
+    seek_scheduler.request(40)
+    assert seek_scheduler.in_flight_frame_id is None
+    # The frame of the cancelled seek does not count as a shown frame
+    assert seek_scheduler.finish() is None
+    assert seek_scheduler.get_stats()['last_latency_ms'] is None
+    assert seek_scheduler.start() == 40
+    assert seek_scheduler.get_stats()['cancelled_seeks'] == 1
@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.components.detection_store import DetectionStore
+from app.components.image_filter import ImageFilter
+from app.components.video_exporter import VideoExporter, parse_frame_range
+
+
+def test_parse_frame_range():
+    assert parse_frame_range('10-20', 100) == (10, 20)
+    assert parse_frame_range('10-', 100) == (10, 100)
+    assert parse_frame_range('-20', 100) == (0, 20)
+    assert parse_frame_range('50-500', 100) == (50, 100)
+    with pytest.raises(ValueError):
+        parse_frame_range('10', 100)
+
+
+def test_export_frame_range(make_video, tmp_path):
+    filename = make_video('input.avi', num_frames=30, step=8, color=(1, 0, 0))
+
+    output = str(tmp_path / 'output.avi')
+    exporter = VideoExporter(filename, output, 5, 25, ['gray'], queue_size=2)
+    exporter.start()
+    progress = exporter.wait()
+
+    assert progress['encoded_frames'] == 20
+    assert progress['progress'] == 1.0
+    assert all(stage['frames'] == 20 for stage in progress['stages'].values())
+    assert 'encode' in exporter.report()
+
+    capture = cv2.VideoCapture(output)
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 20
+    ret, frame = capture.read()
+    assert np.allclose(frame[..., 0], frame[..., 2], atol=2)
+    # The first exported frame is frame 5 of the source
+    assert abs(int(frame[0, 0, 0]) - int(cv2.cvtColor(np.full((1, 1, 3), (40, 0, 0), np.uint8),
+                                                        cv2.COLOR_BGR2GRAY)[0, 0])) <= 2
+
+
+def test_export_can_be_cancelled(synthetic_video, tmp_path):
+    filename = synthetic_video
+
+    exporter = VideoExporter(filename, str(tmp_path / 'output.avi'), queue_size=1)
+    exporter.start()
+    exporter.stop()
+
+    assert not exporter.is_running
+    assert exporter.is_cancelled
+    assert exporter.get_progress()['encoded_frames'] <= 50
+
+
+class EmptyResult:
+    """Mimic the interface of an ultralytics result without any box."""
+    def __init__(self):
+        data = np.zeros((0, 6), np.float32)
+        self.boxes = type('Boxes', (), {'data': type('Tensor', (), {'cpu': lambda tensor: tensor,
+                                                                    'numpy': lambda tensor: data})()})()
+        self.names = {0: 'grasper'}
+
+
+def test_export_runs_the_model_of_the_gui(synthetic_video, tmp_path):
+    calls = []
+
+    def model(image, **kwargs):
+        calls.append(image.shape)
+        return [EmptyResult()]
+
+    # The model of the GUI is the only one, the export never loads its own
+    gui_filter = ImageFilter()
+    gui_filter._model = model
+    gui_filter.detection_store = DetectionStore(str(tmp_path / 'store'))
+    exporter = VideoExporter(synthetic_video, str(tmp_path / 'output.avi'), 0, 10, ['object_detection'],
+                             image_filter=gui_filter)
+    exporter.start()
+    exporter.wait()
+
+    assert exporter.error is None
+    assert len(calls) == 10
+    # The detections of the export are stored with the ones of the GUI
+    assert gui_filter.detection_store.get(9) is not None
+
+
+def test_invalid_output_format(tmp_path):
+    with pytest.raises(ValueError):
+        VideoExporter('video.mp4', str(tmp_path / 'output.txt'))
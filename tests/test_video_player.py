@@ -1,7 +1,15 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
 import pytest
 import PySimpleGUI as sg
 
-from app.components.video_player import VideoPlayer
+from app.components import keyframe_index
+from app.components.keyframe_index import SIDECAR_EXTENSION, KeyframeIndex, get_sidecar_filename
+from app.components.video_player import FrameCache, VideoPlayer
 
 @pytest.fixture
 def video_player():
@@ -10,7 +18,7 @@ def video_player():
 
 def test_video_player_initialisation(video_player):
     assert video_player.filename == "../data/video01_cropped.mp4"
-    assert video_player.current_frame_id == 1
+    assert video_player.current_frame_id == 0
 
 def test_get_nb_frames(video_player):
     assert 2375 == video_player.get_nb_frames()
@@ -19,3 +27,218 @@ def test_set_current_frame_from_frame_id(video_player):
     frame_id = 0
     video_player.set_current_frame_from_frame_id(frame_id)
     assert frame_id == video_player.get_current_frame_id()
+
+def frame_id_from_intensity(frame):
+    return int(round(frame.mean() / 5))
+
+def test_prefetch_reads_frames_in_order(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=4)
+    for frame_id in range(10):
+        ret, frame = video_player.read_next_frame()
+        assert ret
+        assert frame_id_from_intensity(frame) == frame_id
+    assert video_player.get_current_frame_id() == 9
+    assert video_player.get_prefetch_stats()['queue_depth'] <= 4
+    video_player.stop_prefetch()
+
+def test_prefetch_flushes_on_seek(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=8)
+    video_player.read_next_frame()
+    # Let the decoder fill the ring ahead of the playhead
+    deadline = time.monotonic() + 2.0
+    while video_player.get_prefetch_stats()['queue_depth'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    queue_depth = video_player.get_prefetch_stats()['queue_depth']
+    assert queue_depth >= 4
+
+    video_player.set_current_frame_id(30)
+    # The frames decoded before the seek are flushed, never popped
+    assert video_player.get_prefetch_stats()['dropped_frames'] >= queue_depth
+    ret, frame = video_player.read_next_frame()
+    assert ret
+    assert frame_id_from_intensity(frame) == 30
+    next_frame_id, _ = video_player.prefetcher.pop(timeout=2.0)
+    assert next_frame_id == 31
+    video_player.stop_prefetch()
+    assert video_player.get_current_frame_id() == 30
+
+def test_prefetch_end_of_stream(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=4)
+    video_player.set_current_frame_id(49)
+    assert video_player.read_next_frame()[0]
+    assert not video_player.read_next_frame()[0]
+    video_player.stop_prefetch()
+
+def test_skip_to_frame_drops_prefetched_frames(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=8)
+    video_player.read_next_frame()
+    assert video_player.skip_to_frame(5) == 4
+    ret, frame = video_player.read_next_frame()
+    assert frame_id_from_intensity(frame) == 5
+    # Skipping backwards is a no-op, and the end of the video is never passed
+    assert video_player.skip_to_frame(2) == 0
+    video_player.skip_to_frame(100)
+    assert video_player.next_frame_id == 49
+    video_player.stop_prefetch()
+
+def test_poll_next_frame_does_not_wait(synthetic_video):
+    video_player = VideoPlayer(synthetic_video, prefetch_size=8)
+    video_player.set_current_frame_id(40)
+    result = None
+    for _ in range(1000):
+        result = video_player.poll_next_frame()
+        if result is not None:
+            break
+        time.sleep(0.001)
+    assert frame_id_from_intensity(result[1]) == 40
+    video_player.stop_prefetch()
+
+def test_read_frame_random_access(synthetic_video):
+    video_player = VideoPlayer(synthetic_video)
+    for frame_id in [10, 3, 45, 0, 46]:
+        assert frame_id_from_intensity(video_player.read_frame(frame_id)) == frame_id
+        assert video_player.get_current_frame_id() == frame_id
+
+def test_set_previous_frame(synthetic_video):
+    video_player = VideoPlayer(synthetic_video)
+    video_player.set_current_frame_from_frame_id(20)
+    video_player.set_previous_frame()
+    ret, frame = video_player.read_next_frame()
+    assert frame_id_from_intensity(frame) == 19
+    assert video_player.get_current_frame_id() == 19
+
+def test_keyframe_index_sidecar(synthetic_video):
+    index = KeyframeIndex.load_or_build(synthetic_video)
+    assert index.num_frames == 50
+    assert index.nearest_keyframe(0) == 0
+    assert index.nearest_keyframe(25) <= 25
+
+    # The sidecar is reused as long as the video does not change
+    cached_index = KeyframeIndex.load(synthetic_video)
+    assert cached_index.keyframes == index.keyframes
+
+    with open(get_sidecar_filename(synthetic_video)) as sidecar:
+        assert 'signature' in sidecar.read()
+    # The sidecar is in the user cache, the folder of the video may be read-only
+    assert not os.path.exists(synthetic_video + SIDECAR_EXTENSION)
+
+def test_keyframe_index_sidecars_are_capped(make_video, monkeypatch):
+    monkeypatch.setattr(keyframe_index, 'KEYFRAME_INDEX_MAX_FILES', 2)
+    filenames = [make_video(f"video{video_id}.avi", num_frames=1) for video_id in range(3)]
+
+    KeyframeIndex.load_or_build(filenames[0])
+    KeyframeIndex.load_or_build(filenames[1])
+    # The second sidecar is the least recently used once the first one is loaded again
+    os.utime(get_sidecar_filename(filenames[1]), (0, 0))
+    assert KeyframeIndex.load(filenames[0]) is not None
+    KeyframeIndex.load_or_build(filenames[2])
+
+    assert os.path.exists(get_sidecar_filename(filenames[0]))
+    assert not os.path.exists(get_sidecar_filename(filenames[1]))
+    assert os.path.exists(get_sidecar_filename(filenames[2]))
+
+@pytest.fixture
+def gop_video(tmp_path):
+    """Fixture writing a small video with predicted frames between the keyframes."""
+    # Moving noise forces the encoder to write predicted frames
+    filename = str(tmp_path / "gop.mp4")
+    base = np.random.default_rng(0).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'mp4v'), 25, (64, 48))
+    for frame_id in range(60):
+        writer.write(np.roll(base, frame_id, axis=1))
+    writer.release()
+
+    capture = cv2.VideoCapture(filename)
+    frames = [capture.read()[1] for _ in range(60)]
+    yield filename, frames
+
+def test_keyframe_seek_matches_sequential_decode(gop_video):
+    filename, frames = gop_video
+    video_player = VideoPlayer(filename)
+    assert len(video_player.wait_keyframe_index()) < 60
+    for frame_id in [30, 13, 14, 59, 0, 25, 24]:
+        assert np.array_equal(video_player.read_frame(frame_id), frames[frame_id])
+
+def test_keyframe_index_is_built_in_the_background(gop_video, monkeypatch):
+    filename, frames = gop_video
+    build_started, build_allowed = threading.Event(), threading.Event()
+    build = KeyframeIndex.build.__func__
+
+    def blocking_build(cls, filename):
+        build_started.set()
+        build_allowed.wait(5)
+        return build(cls, filename)
+
+    monkeypatch.setattr(KeyframeIndex, 'build', classmethod(blocking_build))
+    video_player = VideoPlayer(filename)
+    assert build_started.wait(5)
+
+    # The frames are read with the OpenCV seek until the index is ready
+    assert video_player.keyframe_index is None
+    for frame_id in [30, 13, 59, 0]:
+        assert np.array_equal(video_player.read_frame(frame_id), frames[frame_id])
+
+    build_allowed.set()
+    assert len(video_player.wait_keyframe_index()) < 60
+    assert video_player.get_nb_frames() == 60
+    assert np.array_equal(video_player.read_frame(25), frames[25])
+    # The sidecar is written, the next player loads it without building it again
+    assert VideoPlayer(filename).keyframe_index is not None
+
+def test_missing_video_file_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        VideoPlayer(str(tmp_path / "missing.avi"))
+
+def test_frame_cache_byte_budget():
+    frame_cache = FrameCache(max_bytes=3 * 100)
+    for frame_id in range(3):
+        frame_cache.put(frame_id, np.zeros(100, np.uint8))
+    # Touch the frame 0 so the frame 1 becomes the least recently used
+    assert frame_cache.get(0) is not None
+    frame_cache.put(3, np.zeros(100, np.uint8))
+
+    assert 1 not in frame_cache
+    assert 0 in frame_cache and 3 in frame_cache
+    assert frame_cache.current_bytes == 300
+    assert frame_cache.get(1) is None
+    assert frame_cache.get_stats()['hits'] == 1
+    assert frame_cache.get_stats()['misses'] == 1
+    assert frame_cache.get_stats()['evictions'] == 1
+
+def test_step_back_served_from_cache(gop_video):
+    filename, frames = gop_video
+    video_player = VideoPlayer(filename)
+    video_player.wait_keyframe_index()
+    video_player.set_current_frame_from_frame_id(20)
+    misses = video_player.get_cache_stats()['misses']
+
+    # The frames before the seek target are cached, stepping back does not decode
+    for frame_id in [19, 18, 17]:
+        video_player.set_previous_frame()
+        ret, frame = video_player.read_next_frame()
+        assert np.array_equal(frame, frames[frame_id])
+    assert video_player.get_cache_stats()['hits'] == 3
+
+    # Stepping forward again is served from the cache as well
+    ret, frame = video_player.read_next_frame()
+    assert np.array_equal(frame, frames[18])
+    assert video_player.get_cache_stats()['misses'] == misses
+
+def test_processing_size(tmp_path):
+    filename = str(tmp_path / "large.avi")
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*'MJPG'), 25, (320, 240))
+    for frame_id in range(5):
+        writer.write(np.full((240, 320, 3), frame_id * 40, np.uint8))
+    writer.release()
+
+    video_player = VideoPlayer(filename, processing_size=(160, 160))
+    assert video_player.processing_size == (160, 120)
+    assert video_player.get_source_scale() == (2.0, 2.0)
+    assert video_player.read_frame(2).shape == (120, 160, 3)
+
+    # The source frame is still available, without moving the playhead
+    assert video_player.read_source_frame(4).shape == (240, 320, 3)
+    assert round(video_player.read_next_frame()[1].mean()) == 3 * 40
+
+    # The frames are never upscaled
+    assert VideoPlayer(filename, processing_size=(640, 480)).processing_size == (320, 240)
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from app.components.video_probe import MetadataCache, probe_video
+
+
+@pytest.fixture
+def video_folder(make_video, tmp_path):
+    """Fixture writing a few small videos in a folder."""
+    for index in range(3):
+        make_video(f"video{index}.avi", num_frames=10 + index)
+    (tmp_path / "notes.txt").write_text("not a video")
+    yield tmp_path
+
+
+def test_probe_video(video_folder):
+    metadata = probe_video(str(video_folder / "video2.avi"))
+    assert metadata.num_frames == 12
+    assert metadata.fps == 25
+    assert (metadata.width, metadata.height) == (64, 48)
+    assert metadata.codec == 'MJPG'
+    assert metadata.duration == pytest.approx(12 / 25)
+
+
+def test_metadata_cache(video_folder, make_video, tmp_path_factory):
+    cache_filename = str(tmp_path_factory.mktemp("cache") / "metadata.json")
+    folder_metadata = MetadataCache(cache_filename).probe_folder(str(video_folder), ('.avi',))
+    assert [metadata.num_frames for metadata in folder_metadata.values()] == [10, 11, 12]
+
+    # A new session reads the cache written by the previous one, without probing the videos
+    metadata_cache = MetadataCache(cache_filename)
+    metadata_cache.probe_folder(str(video_folder), ('.avi',))
+    assert (metadata_cache.hits, metadata_cache.misses) == (3, 0)
+
+    # A modified video is probed again
+    make_video("video0.avi", num_frames=20)
+    assert metadata_cache.get(str(video_folder / "video0.avi")) is None
+    assert metadata_cache.get_or_probe(str(video_folder / "video0.avi")).num_frames == 20
+
+
+def test_metadata_cache_of_a_deleted_video(video_folder, tmp_path_factory):
+    metadata_cache = MetadataCache(str(tmp_path_factory.mktemp("cache") / "metadata.json"))
+    filename = str(video_folder / "video1.avi")
+    assert metadata_cache.get_or_probe(filename).num_frames == 11
+
+    # The cached entry is ignored and the video is probed again, without raising
+    os.remove(filename)
+    assert metadata_cache.get(filename) is None
+    assert metadata_cache.get_or_probe(filename).num_frames == 0